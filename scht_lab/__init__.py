@@ -1,11 +1,53 @@
 """Main package for scht_lab."""
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
-from scht_lab.cli.app import app
-from scht_lab.client import get_client
-from scht_lab.cost_calc import get_cost_calc
-from scht_lab.models.flow import Flow
-from scht_lab.models.stream import Stream
-from scht_lab.topo import Link, Location, Topology
-from scht_lab.topo_graph import all_paths, build_graph, cost_estimate_fn, get_path, paths_to_flows
+if TYPE_CHECKING:
+    from scht_lab.cli.app import app
+    from scht_lab.client import OnosClient, get_client
+    from scht_lab.cost_calc import compile_weights, get_cost_calc
+    from scht_lab.models.flow import Flow, FlowRecord
+    from scht_lab.models.stream import Stream
+    from scht_lab.routing.parallel import routing_tables
+    from scht_lab.routing.table import RoutingTable, routing_table
+    from scht_lab.topo import Link, Location, Topology
+    from scht_lab.topo_graph import all_paths, build_graph, get_path, paths_to_flows
 
-__all__ = ["app", "get_client", "get_cost_calc", "Topology", "Location", "Link", "build_graph", "all_paths", "get_path", "cost_estimate_fn", "paths_to_flows", "Flow", "Stream"]
\ No newline at end of file
+# imported on first access, so commands only pay for what they use
+_exports = {
+    "app": "scht_lab.cli.app",
+    "get_client": "scht_lab.client",
+    "OnosClient": "scht_lab.client",
+    "get_cost_calc": "scht_lab.cost_calc",
+    "compile_weights": "scht_lab.cost_calc",
+    "Topology": "scht_lab.topo",
+    "Location": "scht_lab.topo",
+    "Link": "scht_lab.topo",
+    "build_graph": "scht_lab.topo_graph",
+    "all_paths": "scht_lab.topo_graph",
+    "get_path": "scht_lab.topo_graph",
+    "paths_to_flows": "scht_lab.topo_graph",
+    "Flow": "scht_lab.models.flow",
+    "FlowRecord": "scht_lab.models.flow",
+    "Stream": "scht_lab.models.stream",
+    "RoutingTable": "scht_lab.routing.table",
+    "routing_table": "scht_lab.routing.table",
+    "routing_tables": "scht_lab.routing.parallel",
+}
+
+__all__ = ["app", "get_client", "OnosClient", "get_cost_calc", "compile_weights", "Topology", "Location", "Link", "build_graph", "all_paths", "get_path", "paths_to_flows", "Flow", "FlowRecord", "Stream", "RoutingTable", "routing_table", "routing_tables"]
+
+
+def __getattr__(name: str) -> Any:
+    """Import exported names lazily."""
+    if name not in _exports:
+        msg = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(msg)
+    value = getattr(import_module(_exports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    """List exported names along with the module's own."""
+    return sorted(set(globals()) | set(__all__))
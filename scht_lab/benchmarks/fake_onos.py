@@ -0,0 +1,413 @@
+"""In-process fake of the ONOS REST API, for benchmarking and testing the client without a controller.
+
+Implements the flows, applications and devices endpoints of openapi.yaml on top of an in-memory
+flow table. Latency, failures and request size limits can be configured, and every request is
+counted, so batching and concurrency of the client can be checked as well as timed::
+
+    async with FakeOnos(devices) as onos:
+        await send_flows(onos.context(), flows)
+        assert onos.stats.max_in_flight <= CONCURRENCY
+"""
+import asyncio
+import json
+import random
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from itertools import count
+from time import time
+from typing import Any, NamedTuple
+
+from aiohttp import BasicAuth, web
+from click import Command, Context
+
+API = "/onos/v1"
+# flows serialized per write of a streamed listing
+STREAM_BATCH = 1000
+# ONOS puts the numeric application id in the upper bits of flow ids
+FIRST_FLOW_ID = 1 << 48
+APPLICATIONS = {
+    "org.onosproject.drivers": True,
+    "org.onosproject.openflow": False,
+    "org.onosproject.proxyarp": False,
+    "org.onosproject.lldpprovider": False,
+    "org.onosproject.hostprovider": False,
+    "org.onosproject.fwd": False,
+}
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+@dataclass
+class FakeConfig:
+    """Behaviour of the fake controller."""
+    # seconds added to every request, plus up to jitter more at random
+    latency: float = 0.0
+    jitter: float = 0.0
+    # share of requests answered with 500 without being handled
+    error_rate: float = 0.0
+    # bigger request bodies are rejected with 413, like a proxy in front of ONOS would
+    max_body: int = 64*1024*1024
+    # batch requests with more flows are rejected with 413 (no limit if None)
+    max_batch: int | None = None
+    username: str = "karaf"
+    password: str = "karaf"
+    seed: int = 0
+
+
+@dataclass
+class RequestStats:
+    """What the fake was asked to do."""
+    # requests by method and route, e.g. "DELETE /onos/v1/flows"
+    requests: Counter[str] = field(default_factory=Counter)
+    # flows in every batch POST/DELETE, in arrival order
+    batches: list[int] = field(default_factory=list)
+    failed: int = 0
+    rejected: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    body_bytes: int = 0
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        self.__init__()  # type: ignore[misc]
+
+
+class StoredFlow(NamedTuple):
+    """Installed flow, with selector and treatment kept as JSON text to stay small with millions of flows."""
+    id: str
+    device_id: str
+    app_id: str
+    priority: int
+    timeout: int
+    permanent: bool
+    rules: str
+    match: int
+
+    def to_json(self, last_seen: int) -> str:
+        """Serialize as a flow entry of ONOS listings."""
+        return (
+            f'{{"id":"{self.id}","tableId":0,"appId":{json.dumps(self.app_id)},"groupId":0,'
+            f'"priority":{self.priority},"timeout":{self.timeout},"isPermanent":{"true" if self.permanent else "false"},'
+            f'"deviceId":{json.dumps(self.device_id)},"state":"ADDED","life":0,"packets":0,"bytes":0,'
+            f'"liveType":"UNKNOWN","lastSeen":{last_seen},{self.rules}}}'
+        )
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"code": status, "message": message}, status=status)
+
+
+def _match_key(app_id: str, device_id: str, priority: int, criteria: list[dict[str, Any]]) -> int:
+    """Key of the flow ONOS would replace, it identifies flows by device, application, priority and selector.
+
+    Only a hash is kept, like ONOS flow ids are, so millions of keys stay small.
+    """
+    try:
+        match = frozenset(tuple(sorted(criterion.items())) for criterion in criteria)
+    except TypeError:
+        # nested criterion values aren't hashable
+        match = frozenset(json.dumps(criterion, sort_keys=True) for criterion in criteria)
+    return hash((device_id, app_id, priority, match))
+
+
+class FakeOnos:
+    """ONOS REST API served from memory by an aiohttp app.
+
+    Use with ``async with`` to serve it on a free local port, or mount ``app`` in aiohttp test
+    utilities. Flows posted again with the same device, application, priority and selector replace
+    the installed ones, like in ONOS. All flows are reported as ADDED right away.
+    """
+    def __init__(self, devices: Iterable[str] = (), config: FakeConfig | None = None) -> None:
+        """Create an empty controller that knows the given device ids."""
+        self.config = config or FakeConfig()
+        self.stats = RequestStats()
+        self.devices = dict.fromkeys(devices)
+        self.applications = dict(APPLICATIONS)
+        # device -> flow id -> flow, devices in the order their first flow arrived
+        self.flows: dict[str, dict[str, StoredFlow]] = {}
+        self._matches: dict[int, str] = {}
+        self._ids = count(FIRST_FLOW_ID)
+        self._random = random.Random(self.config.seed)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+        self.app = web.Application(client_max_size=self.config.max_body, middlewares=[self._middleware])
+        self.app.add_routes([
+            web.get(f"{API}/flows", self.get_flows),
+            web.post(f"{API}/flows", self.post_flows),
+            web.delete(f"{API}/flows", self.delete_flows),
+            web.get(f"{API}/flows/pending", self.get_pending),
+            web.get(f"{API}/flows/application/{{appId}}", self.get_app_flows),
+            web.delete(f"{API}/flows/application/{{appId}}", self.delete_app_flows),
+            web.get(f"{API}/flows/{{deviceId}}", self.get_device_flows),
+            web.post(f"{API}/flows/{{deviceId}}", self.post_device_flow),
+            web.get(f"{API}/flows/{{deviceId}}/{{flowId}}", self.get_flow),
+            web.delete(f"{API}/flows/{{deviceId}}/{{flowId}}", self.delete_flow),
+            web.get(f"{API}/applications", self.get_applications),
+            web.get(f"{API}/applications/{{name}}", self.get_application),
+            web.delete(f"{API}/applications/{{name}}", self.uninstall_application),
+            web.post(f"{API}/applications/{{name}}/active", self.activate_application),
+            web.delete(f"{API}/applications/{{name}}/active", self.deactivate_application),
+            web.get(f"{API}/devices", self.get_devices),
+            web.get(f"{API}/devices/{{id}}", self.get_device),
+            web.get(f"{API}/devices/{{id}}/ports", self.get_device_ports),
+        ])
+
+    @property
+    def flow_count(self) -> int:
+        """Number of installed flows."""
+        return len(self._matches)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve the API (on a free port by default) and return its base URL."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self) -> None:
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeOnos":
+        """Start serving."""
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Stop serving."""
+        await self.close()
+
+    def context(self, **obj: Any) -> Context:
+        """Get a command context pointing the client functions (send_flows, iter_flows...) to this server."""
+        return Context(Command("fake-onos"), obj={
+            "BASE_URL": self.base_url, "USERNAME": self.config.username, "PASSWORD": self.config.password, **obj,
+        })
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler: Handler) -> web.StreamResponse:
+        stats = self.stats
+        route = request.match_info.route.resource
+        stats.requests[f"{request.method} {route.canonical if route else request.path}"] += 1
+        stats.body_bytes += request.content_length or 0
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            config = self.config
+            auth = request.headers.get("Authorization")
+            try:
+                credentials = BasicAuth.decode(auth) if auth else None
+            except ValueError:
+                credentials = None
+            if credentials is None or (credentials.login, credentials.password) != (config.username, config.password):
+                return _error(401, "Unauthorized")
+            if config.latency or config.jitter:
+                await asyncio.sleep(config.latency + self._random.uniform(0, config.jitter))
+            if config.error_rate and self._random.random() < config.error_rate:
+                stats.failed += 1
+                return _error(500, "Injected failure")
+            return await handler(request)
+        except web.HTTPException as e:
+            if e.status == 413:
+                stats.rejected += 1
+            return _error(e.status, e.reason)
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            return _error(400, f"Invalid request: {e}")
+        finally:
+            stats.in_flight -= 1
+
+    async def _batch(self, request: web.Request) -> list[dict[str, Any]]:
+        """Read the flows of a batch request, enforcing the batch size limit."""
+        flows = (await request.json())["flows"]
+        self.stats.batches.append(len(flows))
+        if self.config.max_batch is not None and len(flows) > self.config.max_batch:
+            raise web.HTTPRequestEntityTooLarge(self.config.max_batch, len(flows))
+        return flows
+
+    def add_flow(self, device_id: str, app_id: str, flow: dict[str, Any]) -> StoredFlow:
+        """Install a flow given as ONOS JSON, replacing one with the same match."""
+        priority = int(flow["priority"])
+        selector = flow.get("selector", {"criteria": []})
+        match = _match_key(app_id, device_id, priority, selector.get("criteria", []))
+        flow_id = self._matches.get(match) or str(next(self._ids))
+        rules = json.dumps(
+            {"treatment": flow.get("treatment", {"instructions": [], "deferred": []}), "selector": selector},
+            separators=(",", ":"),
+        )[1:-1]
+        stored = StoredFlow(
+            flow_id, device_id, app_id, priority, int(flow.get("timeout", 0)), bool(flow.get("isPermanent", False)), rules, match,
+        )
+        self._matches[match] = flow_id
+        self.flows.setdefault(device_id, {})[flow_id] = stored
+        return stored
+
+    def remove_flow(self, device_id: str, flow_id: str) -> bool:
+        """Remove an installed flow, returning whether there was one."""
+        stored = self.flows.get(device_id, {}).pop(str(flow_id), None)
+        if stored is None:
+            return False
+        del self._matches[stored.match]
+        return True
+
+    async def _listing(self, request: web.Request, flows: Iterable[StoredFlow]) -> web.StreamResponse:
+        """Stream a {"flows": [...]} listing, so huge tables are never serialized at once."""
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        last_seen = int(time()*1000)
+        await response.write(b'{"flows":[')
+        batch: list[str] = []
+        separator = ""
+        for flow in flows:
+            batch.append(flow.to_json(last_seen))
+            if len(batch) == STREAM_BATCH:
+                await response.write((separator + ",".join(batch)).encode())
+                separator, batch = ",", []
+        if batch:
+            await response.write((separator + ",".join(batch)).encode())
+        await response.write(b"]}")
+        await response.write_eof()
+        return response
+
+    def _all_flows(self) -> Iterable[StoredFlow]:
+        # copied, so changes made while a listing streams don't break it
+        return [flow for device in list(self.flows.values()) for flow in list(device.values())]
+
+    async def get_flows(self, request: web.Request) -> web.StreamResponse:
+        """GET /flows: all flows, device by device."""
+        return await self._listing(request, self._all_flows())
+
+    async def get_pending(self, request: web.Request) -> web.StreamResponse:
+        """GET /flows/pending: flows are installed immediately, so there are never any."""
+        return await self._listing(request, [])
+
+    async def get_app_flows(self, request: web.Request) -> web.StreamResponse:
+        """GET /flows/application/{appId}: flows of an application."""
+        app_id = request.match_info["appId"]
+        return await self._listing(request, [flow for flow in self._all_flows() if flow.app_id == app_id])
+
+    async def get_device_flows(self, request: web.Request) -> web.StreamResponse:
+        """GET /flows/{deviceId}: flows of a device."""
+        return await self._listing(request, list(self.flows.get(request.match_info["deviceId"], {}).values()))
+
+    async def get_flow(self, request: web.Request) -> web.StreamResponse:
+        """GET /flows/{deviceId}/{flowId}: a single flow."""
+        flow = self.flows.get(request.match_info["deviceId"], {}).get(request.match_info["flowId"])
+        if flow is None:
+            return _error(404, "Flow not found")
+        return await self._listing(request, [flow])
+
+    async def post_flows(self, request: web.Request) -> web.Response:
+        """POST /flows?appId=: install a batch of flows, responding with their ids."""
+        app_id = request.query.get("appId", "org.onosproject.rest")
+        stored = [self.add_flow(flow["deviceId"], app_id, flow) for flow in await self._batch(request)]
+        return web.json_response({"flows": [{"deviceId": flow.device_id, "flowId": flow.id} for flow in stored]})
+
+    async def post_device_flow(self, request: web.Request) -> web.Response:
+        """POST /flows/{deviceId}?appId=: install a single flow."""
+        device_id = request.match_info["deviceId"]
+        flow = self.add_flow(device_id, request.query.get("appId", "org.onosproject.rest"), await request.json())
+        return web.Response(status=201, headers={"Location": f"{API}/flows/{device_id}/{flow.id}"})
+
+    async def delete_flows(self, request: web.Request) -> web.Response:
+        """DELETE /flows: remove a batch of flows given as {"deviceId", "flowId"}, unknown ones are ignored."""
+        for flow in await self._batch(request):
+            self.remove_flow(flow["deviceId"], flow["flowId"])
+        return web.Response(status=204)
+
+    async def delete_flow(self, request: web.Request) -> web.Response:
+        """DELETE /flows/{deviceId}/{flowId}: remove a single flow."""
+        self.remove_flow(request.match_info["deviceId"], request.match_info["flowId"])
+        return web.Response(status=204)
+
+    async def delete_app_flows(self, request: web.Request) -> web.Response:
+        """DELETE /flows/application/{appId}: remove all flows of an application."""
+        app_id = request.match_info["appId"]
+        for flow in self._all_flows():
+            if flow.app_id == app_id:
+                self.remove_flow(flow.device_id, flow.id)
+        return web.Response(status=204)
+
+    def _application(self, name: str) -> dict[str, Any]:
+        return {
+            "name": name,
+            "id": list(self.applications).index(name) + 1,
+            "version": "2.7.0",
+            "origin": "ONOS Community",
+            "category": "default",
+            "description": name,
+            "state": "ACTIVE" if self.applications[name] else "INSTALLED",
+            "features": [],
+            "permissions": [],
+            "requiredApps": [],
+        }
+
+    async def get_applications(self, request: web.Request) -> web.Response:
+        """GET /applications: installed applications."""
+        return web.json_response({"applications": [self._application(name) for name in self.applications]})
+
+    async def get_application(self, request: web.Request) -> web.Response:
+        """GET /applications/{name}: a single application."""
+        name = request.match_info["name"]
+        if name not in self.applications:
+            return _error(404, "Application not found")
+        return web.json_response(self._application(name))
+
+    async def uninstall_application(self, request: web.Request) -> web.Response:
+        """DELETE /applications/{name}: uninstall an application."""
+        self.applications.pop(request.match_info["name"], None)
+        return web.Response(status=204)
+
+    async def activate_application(self, request: web.Request) -> web.Response:
+        """POST /applications/{name}/active: activate an installed application."""
+        return self._set_active(request.match_info["name"], True)
+
+    async def deactivate_application(self, request: web.Request) -> web.Response:
+        """DELETE /applications/{name}/active: deactivate an application."""
+        return self._set_active(request.match_info["name"], False)
+
+    def _set_active(self, name: str, active: bool) -> web.Response:
+        if name not in self.applications:
+            return _error(404, "Application not found")
+        self.applications[name] = active
+        return web.json_response(self._application(name))
+
+    def _device(self, device_id: str) -> dict[str, Any]:
+        return {
+            "id": device_id,
+            "type": "SWITCH",
+            "available": True,
+            "role": "MASTER",
+            "mfr": "Nicira, Inc.",
+            "hw": "Open vSwitch",
+            "sw": "2.13.8",
+            "serial": "None",
+            "driver": "ovs",
+            "chassisId": device_id.removeprefix("of:").lstrip("0") or "0",
+            "lastUpdate": "0",
+            "humanReadableLastUpdate": "connected 0s ago",
+            "annotations": {"protocol": "OF_13"},
+        }
+
+    async def get_devices(self, request: web.Request) -> web.Response:
+        """GET /devices: known devices."""
+        return web.json_response({"devices": [self._device(device) for device in self.devices]})
+
+    async def get_device(self, request: web.Request) -> web.Response:
+        """GET /devices/{id}: a single device."""
+        device_id = request.match_info["id"]
+        if device_id not in self.devices:
+            return _error(404, "Device not found")
+        return web.json_response(self._device(device_id))
+
+    async def get_device_ports(self, request: web.Request) -> web.Response:
+        """GET /devices/{id}/ports: a device with its (only, local) port."""
+        device_id = request.match_info["id"]
+        if device_id not in self.devices:
+            return _error(404, "Device not found")
+        port = {"element": device_id, "port": "local", "isEnabled": True, "type": "copper", "portSpeed": 0, "annotations": {}}
+        return web.json_response({**self._device(device_id), "ports": [port]})
+
@@ -0,0 +1,180 @@
+"""Seeded generators of topologies and streams for benchmarks.
+
+Run with ``python -m scht_lab.benchmarks.generators topology|streams`` to write them to files.
+"""
+import json
+from pathlib import Path
+from typing import Annotated, Any, Optional
+
+import numpy as np
+from rich import print
+from typer import Argument, Option, Typer
+
+from scht_lab.routing.heuristics import haversine
+
+# roughly Europe, like the hand-made topologies
+LATITUDES = (36.0, 60.0)
+LONGITUDES = (-9.0, 30.0)
+# city sizes follow a Pareto distribution, with a handful of big ones and many small
+MIN_POPULATION = 20_000
+MAX_POPULATION = 12_000_000
+POPULATION_SHAPE = 1.1
+# links go to a few nearest cities, bigger cities get more of them
+MIN_DEGREE = 2
+MAX_DEGREE = 4
+# cities whose neighbours are looked up at once
+NEIGHBOR_BLOCK = 256
+# share of links with a fixed bandwidth
+BW_OVERRIDE_SHARE = 0.02
+
+app = Typer()
+
+
+def _find(parents: list[int], node: int) -> int:
+    while parents[node] != node:
+        parents[node] = parents[parents[node]]
+        node = parents[node]
+    return node
+
+
+def generate_topology(cities: int, seed: int = 0) -> dict[str, dict[str, Any]]:
+    """Generate a connected topology in the load_topology input format, with inline coordinates.
+
+    Cities are scattered with a few dense clusters. Each city links to its nearest neighbours, with
+    2-4 links depending on population, and components are joined into one network by their closest
+    pair of cities. Link distances are great-circle km (rounded up), so the same seed always gives
+    the same topology.
+    """
+    if cities < 2:
+        msg = "A topology needs at least 2 cities"
+        raise ValueError(msg)
+    rng = np.random.default_rng(seed)
+    # half of the cities around cluster centers, the rest anywhere
+    centers = np.column_stack((rng.uniform(*LATITUDES, max(1, cities//50)), rng.uniform(*LONGITUDES, max(1, cities//50))))
+    clustered = cities//2
+    coords = np.concatenate((
+        centers[rng.integers(0, len(centers), clustered)] + rng.normal(0, 1.0, (clustered, 2)),
+        np.column_stack((rng.uniform(*LATITUDES, cities - clustered), rng.uniform(*LONGITUDES, cities - clustered))),
+    ))
+    coords[:, 0] = np.clip(coords[:, 0], *LATITUDES)
+    coords[:, 1] = np.clip(coords[:, 1], *LONGITUDES)
+    population = np.minimum(MIN_POPULATION*(1 - rng.random(cities))**(-1/POPULATION_SHAPE), MAX_POPULATION).astype(np.int64)
+    ranks = np.argsort(np.argsort(-population))
+    degrees = np.clip(MAX_DEGREE - (ranks*(MAX_DEGREE - MIN_DEGREE + 1))//cities, MIN_DEGREE, MAX_DEGREE)
+    radians = np.radians(coords)
+
+    links: dict[tuple[int, int], int] = {}
+    parents = list(range(cities))
+    def link(a: int, b: int, km: float) -> None:
+        links.setdefault((min(a, b), max(a, b)), int(np.ceil(km)) or 1)
+        parents[_find(parents, a)] = _find(parents, b)
+    # nearest neighbours by a flat approximation (good enough at these distances), a block of cities at a time
+    planar = np.column_stack((radians[:, 0], radians[:, 1]*np.cos(radians[:, 0])))
+    norms = (planar**2).sum(axis=1)
+    candidates = min(MAX_DEGREE, cities - 1)
+    for start in range(0, cities, NEIGHBOR_BLOCK):
+        block = planar[start:start+NEIGHBOR_BLOCK]
+        squared = norms[start:start+NEIGHBOR_BLOCK, None] + norms[None, :] - 2*block @ planar.T
+        squared[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        nearest = np.argpartition(squared, candidates - 1, axis=1)[:, :candidates]
+        for offset, row in enumerate(nearest):
+            city = start + offset
+            row = row[np.argsort(squared[offset, row])][:degrees[city]]
+            for other, km in zip(row.tolist(), haversine(radians[row], radians[city]).tolist(), strict=True):
+                link(city, other, km)
+    # join components, the smallest one to the closest city outside of it until one is left
+    while True:
+        roots = np.array([_find(parents, city) for city in range(cities)])
+        components, sizes = np.unique(roots, return_counts=True)
+        if len(components) == 1:
+            break
+        smallest = components[np.argmin(sizes)]
+        members = np.flatnonzero(roots == smallest)
+        outside = np.flatnonzero(roots != smallest)
+        distances = haversine(radians[members][:, None, :], radians[outside][None, :, :])
+        a, b = np.unravel_index(np.argmin(distances), distances.shape)
+        link(int(members[a]), int(outside[b]), float(distances[a, b]))
+
+    names = [f"city-{city:05d}" for city in range(cities)]
+    topology: dict[str, dict[str, Any]] = {
+        name: {
+            "population": int(population[city]),
+            "connectivity": 0,
+            "neighbors": {},
+            "lat": round(float(coords[city, 0]), 5),
+            "lon": round(float(coords[city, 1]), 5),
+        }
+        for city, name in enumerate(names)
+    }
+    for (a, b), km in links.items():
+        topology[names[a]]["neighbors"][names[b]] = km
+        topology[names[b]]["neighbors"][names[a]] = km
+        topology[names[a]]["connectivity"] += 1
+        topology[names[b]]["connectivity"] += 1
+        if rng.random() < BW_OVERRIDE_SHARE:
+            topology[names[a]].setdefault("bw_overrides", {})[names[b]] = float(rng.integers(100, 1000))
+    return topology
+
+
+def generate_streams(topology: dict[str, dict[str, Any]], count: int, seed: int = 0) -> dict[str, list[dict[str, Any]]]:
+    """Generate streams between random cities of a topology, in the Streams format.
+
+    Big cities are picked more often. Rates are log-uniform between 1 and 500 Mbps, a third of streams
+    is TCP, and most have delay or loss requirements. Jitter is left out: the jitter of links shorter
+    than 200 km is negative, which path searches reject, and generated cities are close together.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(topology)
+    weights = np.array([topology[name]["population"] for name in names], dtype=float)
+    weights /= weights.sum()
+    streams = []
+    for _ in range(count):
+        src, dst = rng.choice(len(names), 2, replace=False, p=weights)
+        stream_type = "TCP" if rng.random() < 1/3 else "UDP"
+        priorities = {"delay": 1, "bandwidth": float(rng.choice([1, 2, 5, 10])), "loss": 1}
+        if stream_type == "UDP":
+            priorities["congestion"] = 1
+        requirements: dict[str, float] = {}
+        if rng.random() < 0.7:
+            requirements["delay"] = float(rng.integers(20, 200))
+        if rng.random() < 0.5:
+            requirements["loss"] = round(float(rng.uniform(0.01, 0.2)), 3)
+        streams.append({
+            "src": names[src],
+            "dst": names[dst],
+            "rate": int(np.exp(rng.uniform(0, np.log(500)))),
+            "type": stream_type,
+            "priorities": priorities,
+            "requirements": requirements or None,
+        })
+    return {"streams": streams}
+
+
+@app.command("topology")
+def topology_command(
+    cities: Annotated[int, Argument(min=2, help="Number of cities")],
+    output: Annotated[Path, Option("-o", "--output", help="File to write the topology to")] = Path("topo.json"),
+    seed: Annotated[int, Option("-s", "--seed")] = 0,
+    ):
+    """Generate a topology file."""
+    topology = generate_topology(cities, seed)
+    output.write_text(json.dumps(topology))
+    print(f"Wrote {cities} cities and {sum(len(city['neighbors']) for city in topology.values())//2} links to {output}")
+
+
+@app.command("streams")
+def streams_command(
+    topology: Annotated[Path, Argument(exists=True, readable=True, help="Topology file to pick cities from")],
+    count: Annotated[int, Argument(min=1, help="Number of streams")],
+    output: Annotated[Optional[Path], Option("-o", "--output", help="File to write the streams to")] = None,
+    seed: Annotated[int, Option("-s", "--seed")] = 0,
+    ):
+    """Generate a streams file for a topology."""
+    streams = generate_streams(json.loads(topology.read_text()), count, seed)
+    target = output or topology.with_name(f"{topology.stem}-streams.json")
+    target.write_text(json.dumps(streams, indent=2))
+    print(f"Wrote {count} streams to {target}")
+
+
+if __name__ == "__main__":
+    app()
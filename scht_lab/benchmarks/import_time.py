@@ -0,0 +1,73 @@
+"""Import time benchmark guarding CLI startup latency.
+
+Run with ``python -m scht_lab.benchmarks.import_time``. Fails if the CLI imports any heavy dependency
+at startup, or if importing takes longer than --max-ms.
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Annotated, Optional
+
+from rich import print
+from rich.table import Table
+from typer import Exit, Option, Typer
+
+# only needed by some commands, so they must not be imported just to start the CLI
+HEAVY_MODULES = (
+    "aiohttp",
+    "anyio",
+    "geopy",
+    "numpy",
+    "pydantic",
+    "rustworkx",
+    "scht_lab.client",
+    "scht_lab.models.flow",
+    "scht_lab.topo",
+    "scht_lab.topo_graph",
+)
+
+app = Typer()
+
+
+def measure_import(module: str, runs: int = 5) -> dict[str, object]:
+    """Import a module in fresh interpreters, returning the best time (in ms) and heavy modules it loaded."""
+    times = []
+    for _ in range(runs):
+        result = subprocess.run( # noqa: S603
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True,
+        )
+        # the last line is the requested module, with cumulative time in microseconds
+        cumulative = result.stderr.strip().splitlines()[-1].split("|")[1]
+        times.append(int(cumulative)/1000)
+    check = f"import sys, json, {module}; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    loaded = json.loads(subprocess.run( # noqa: S603
+        [sys.executable, "-c", check], capture_output=True, text=True, check=True,
+    ).stdout)
+    return {"module": module, "best_ms": min(times), "median_ms": sorted(times)[len(times)//2], "heavy": loaded}
+
+
+@app.command()
+def main(
+    modules: Annotated[Optional[list[str]], Option("-m", "--module", help="Module to import (can be repeated)")] = None,
+    runs: Annotated[int, Option("-n", "--runs", min=1, help="Imports per module")] = 5,
+    max_ms: Annotated[Optional[float], Option("--max-ms", help="Fail if the best import time of a module is above this")] = None,
+    output: Annotated[Optional[Path], Option("-o", "--output", help="Write results to a JSON file")] = None,
+    ):
+    """Measure import time of the package and the CLI."""
+    results = [measure_import(module, runs) for module in modules or ["scht_lab", "scht_lab.cli.app"]]
+    table = Table("Module", "Best [ms]", "Median [ms]", "Heavy imports", title="Import time")
+    for result in results:
+        table.add_row(str(result["module"]), f'{result["best_ms"]:.1f}', f'{result["median_ms"]:.1f}', ", ".join(result["heavy"]) or "-") # type: ignore
+    print(table)
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+    failed = [r for r in results if r["heavy"] or (max_ms is not None and r["best_ms"] > max_ms)] # type: ignore
+    if failed:
+        print(f"[red]Import time regression in {', '.join(str(r['module']) for r in failed)}[/red]")
+        raise Exit(1)
+
+
+if __name__ == "__main__":
+    app()
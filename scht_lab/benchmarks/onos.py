@@ -0,0 +1,178 @@
+"""Throughput of flow upload, listing and deletion against an in-process fake ONOS (see fake_onos).
+
+Run with ``python -m scht_lab.benchmarks.onos -f 10000 -f 100000``, -p picks phases (flows a phase needs are
+loaded into the fake directly when the upload phases are skipped). Request counts and concurrency
+seen by the fake are reported next to timings, batching itself is checked by tests/test_client.py.
+"""
+import asyncio
+import json
+import os
+import platform
+from collections.abc import Awaitable, Callable, Collection
+from datetime import datetime, timezone
+from enum import Enum
+from pathlib import Path
+from time import perf_counter
+from typing import Annotated, Any, Optional
+
+from aiohttp import ClientError
+from rich import print
+from rich.table import Table
+from typer import Option, Typer
+
+from scht_lab.benchmarks.fake_onos import FakeConfig, FakeOnos
+from scht_lab.benchmarks.run import git_commit
+from scht_lab.client import (
+    APP_ID,
+    delete_app_flows,
+    delete_flows,
+    get_client,
+    iter_flows,
+    reconcile_flows,
+    send_flows,
+)
+from scht_lab.limits import CHUNK_SIZE, CONCURRENCY
+from scht_lab.models.flow import FlowRecord, eth_type_criterion, ip_criterion
+from scht_lab.topo import location_ip
+
+Result = dict[str, Any]
+
+app = Typer()
+
+
+class Phase(str, Enum):
+    """Client operations that are benchmarked, in the order they run."""
+    SEND = "send_flows"
+    DELETE_APP = "delete_app_flows"
+    RECONCILE_ADD = "reconcile_add"
+    RECONCILE_NOOP = "reconcile_noop"
+    LIST = "list"
+    DELETE = "delete_flows"
+
+
+def make_flows(count: int, devices: int) -> list[FlowRecord]:
+    """Make count distinct host-to-host flows spread over devices, like paths_to_flows output."""
+    device_ids = [f"of:{hex(device + 1)[2:].zfill(16)}" for device in range(devices)]
+    flows = []
+    for index in range(count):
+        dst, src = location_ip(index), location_ip(index % devices)
+        flows.append(FlowRecord(
+            device_ids[index % devices],
+            40000,
+            (eth_type_criterion(dst), ip_criterion(dst, "DST"), ip_criterion(src, "SRC")),
+            ((("type", "OUTPUT"), ("port", str(index % 4 + 1))),),
+        ))
+    return flows
+
+
+async def benchmark_count(
+        count: int, devices: int, config: FakeConfig, chunk_size: int, concurrency: int, phases: Collection[Phase],
+        ) -> list[Result]:
+    """Run the given phases for count flows on a fresh fake."""
+    flows = make_flows(count, devices)
+    results: list[Result] = []
+    async with FakeOnos([f"of:{hex(device + 1)[2:].zfill(16)}" for device in range(devices)], config) as onos:
+        ctx = onos.context()
+
+        async def phase(name: Phase, run: Callable[[], Awaitable[Any]]) -> Any:
+            onos.stats.reset()
+            start = perf_counter()
+            value, error = None, None
+            try:
+                value = await run()
+            except (ClientError, TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            elapsed = perf_counter() - start
+            stats = onos.stats
+            results.append({
+                "benchmark": name.value,
+                "flows": count,
+                "seconds": elapsed,
+                "flows_per_s": count/elapsed if elapsed else 0.0,
+                "requests": sum(stats.requests.values()),
+                "max_in_flight": stats.max_in_flight,
+                "largest_batch": max(stats.batches, default=0),
+                "failed": stats.failed,
+                "rejected": stats.rejected,
+                "error": error,
+            })
+            return value
+
+        def preload() -> None:
+            # phases that need installed flows get them without HTTP when the upload phases are skipped
+            if not onos.flow_count:
+                for flow in flows:
+                    onos.add_flow(flow.device_id, APP_ID, flow.to_onos())
+
+        async def listing() -> list[dict[str, Any]]:
+            return [{"deviceId": flow["deviceId"], "flowId": flow["id"]} async for flow in iter_flows(ctx, app_id=APP_ID)]
+
+        async with get_client(ctx):
+            if Phase.SEND in phases:
+                await phase(Phase.SEND, lambda: send_flows(ctx, flows))
+            if Phase.DELETE_APP in phases:
+                preload()
+                await phase(Phase.DELETE_APP, lambda: delete_app_flows(ctx))
+            if Phase.RECONCILE_ADD in phases:
+                await phase(Phase.RECONCILE_ADD, lambda: reconcile_flows(ctx, flows, chunk_size=chunk_size))
+            if Phase.RECONCILE_NOOP in phases:
+                preload()
+                await phase(Phase.RECONCILE_NOOP, lambda: reconcile_flows(ctx, flows, chunk_size=chunk_size))
+            installed: list[dict[str, Any]] = []
+            if Phase.LIST in phases:
+                preload()
+                installed = await phase(Phase.LIST, listing) or []
+            if Phase.DELETE in phases:
+                preload()
+                installed = installed or [
+                    {"deviceId": flow.device_id, "flowId": flow.id} for device in onos.flows.values() for flow in device.values()
+                ]
+                await phase(Phase.DELETE, lambda: delete_flows(ctx, installed, chunk_size, concurrency))
+    return results
+
+
+@app.command()
+def main(
+    flows: Annotated[Optional[list[int]], Option("-f", "--flows", min=1, help="Number of flows to benchmark (can be repeated)")] = None,
+    devices: Annotated[int, Option("-d", "--devices", min=1, help="Devices the flows are spread over")] = 100,
+    latency: Annotated[float, Option("--latency", min=0, help="Latency of every request in ms")] = 0.0,
+    jitter: Annotated[float, Option("--jitter", min=0, help="Random extra latency of every request, up to this many ms")] = 0.0,
+    error_rate: Annotated[float, Option("--error-rate", min=0, max=1, help="Share of requests failing with 500")] = 0.0,
+    max_batch: Annotated[Optional[int], Option("--max-batch", min=1, help="Reject batch requests with more flows")] = None,
+    max_body: Annotated[int, Option("--max-body", min=1, help="Reject request bodies bigger than this many MB")] = 1024,
+    chunk_size: Annotated[int, Option("--chunk-size", min=1, help="Flows per batch request")] = CHUNK_SIZE,
+    concurrency: Annotated[int, Option("--concurrency", min=1, help="Deletion requests at once")] = CONCURRENCY,
+    phases: Annotated[Optional[list[Phase]], Option("-p", "--phase", help="Phase to run (can be repeated, all by default)")] = None,
+    seed: Annotated[int, Option("--seed", help="Seed of injected latency and failures")] = 0,
+    output: Annotated[Optional[Path], Option("-o", "--output", help="Write results to a JSON file")] = None,
+    ):
+    """Benchmark flow upload, listing and deletion throughput against a fake ONOS."""
+    config = FakeConfig(
+        latency=latency/1000, jitter=jitter/1000, error_rate=error_rate, max_batch=max_batch,
+        max_body=max_body*1024*1024, seed=seed,
+    )
+    results: list[Result] = []
+    for count in flows or [10_000, 100_000]:
+        print(f"Benchmarking {count} flows...")
+        results.extend(asyncio.run(benchmark_count(count, devices, config, chunk_size, concurrency, phases or list(Phase))))
+    table = Table("Benchmark", "Flows", "Time [ms]", "Flows/s", "Requests", "Max in flight", "Failed", title="ONOS client")
+    for result in results:
+        table.add_row(
+            result["benchmark"], str(result["flows"]), f"{result['seconds']*1000:.1f}", f"{result['flows_per_s']:.0f}",
+            str(result["requests"]), str(result["max_in_flight"]), "error" if result["error"] else str(result["failed"] + result["rejected"]),
+        )
+    print(table)
+    if output:
+        output.write_text(json.dumps({
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "config": vars(config),
+            "results": results,
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,208 @@
+"""Timed benchmarks of topology loading, path finding and flow generation on generated topologies.
+
+Run with ``python -m scht_lab.benchmarks.run``. Results can be written as JSON (-o) and compared
+with an earlier run (--baseline), to track regressions across commits.
+"""
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Annotated, Any, Optional
+
+import numpy as np
+from rich import print
+from rich.table import Table
+from typer import Exit, Option, Typer
+
+from scht_lab.benchmarks.generators import generate_streams, generate_topology
+from scht_lab.cli.paths import SearchMode, find_paths_for_streams
+from scht_lab.cost_calc import compile_weights, cost_calc
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.parallel import routing_tables
+from scht_lab.routing.table import routing_table
+from scht_lab.snapshot import load_snapshot, save_snapshot
+from scht_lab.topo import Location, Topology, load_topology_from_file
+from scht_lab.topo_graph import build_graph, get_path, paths_to_flows
+
+Result = dict[str, Any]
+
+app = Typer()
+
+
+def timed(function: Callable[[], object], repeat: int) -> Result:
+    """Run a function repeat times, returning the best and median wall time."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return {"best_s": min(times), "median_s": median(times), "runs": repeat}
+
+
+def touch(topo: Topology) -> None:
+    """Bump the topology version without changing anything, so cached weights and tables are computed again."""
+    link = topo.links[0]
+    link.utilization = link.utilization
+
+
+@contextmanager
+def app_dir(path: Path) -> Iterator[None]:
+    """Point the app directory (default topology, snapshots, stored tables) to path for a while."""
+    previous = os.environ.get("XDG_CONFIG_HOME")
+    os.environ["XDG_CONFIG_HOME"] = str(path)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["XDG_CONFIG_HOME"]
+        else:
+            os.environ["XDG_CONFIG_HOME"] = previous
+
+
+def benchmark_size(
+        cities: int, streams: int, queries: int, seed: int, repeat: int,
+        all_paths_limit: int, directory: Path,
+        ) -> list[Result]:
+    """Run every benchmark on a generated topology of a given size."""
+    results: list[Result] = []
+    def record(name: str, result: Result, **extra: Any) -> None:
+        results.append({"benchmark": name, "cities": cities, **result, **extra})
+
+    start = perf_counter()
+    topology_data = generate_topology(cities, seed)
+    elapsed = perf_counter() - start
+    record("generate_topology", {"best_s": elapsed, "median_s": elapsed, "runs": 1})
+    topology_file = directory / f"topo-{cities}.json"
+    topology_file.write_text(json.dumps(topology_data))
+    streams_file = directory / f"streams-{cities}.json"
+    streams_file.write_text(json.dumps(generate_streams(topology_data, streams, seed)))
+
+    record("load_topology", timed(lambda: asyncio.run(load_topology_from_file(topology_file, snapshot=False)), repeat))
+    topo = asyncio.run(load_topology_from_file(topology_file, snapshot=False))
+    links = len(topo.links)
+    snapshot = directory / f"snapshot-{cities}"
+    save_snapshot(topo, snapshot)
+    record("load_snapshot", timed(lambda: load_snapshot(snapshot), repeat), links=links)
+
+    def fresh_graph() -> None:
+        topo.invalidate()
+        build_graph(topo)
+    record("build_graph", timed(fresh_graph, repeat), links=links)
+
+    priorities = Priorities()
+    record("cost_calc", timed(lambda: [cost_calc(link, priorities, None, None, topo) for link in topo.links], repeat), links=links)
+    def fresh_weights() -> None:
+        touch(topo)
+        compile_weights(topo, priorities)
+    record("compile_weights", timed(fresh_weights, repeat), links=links)
+
+    rng = np.random.default_rng(seed)
+    pairs = [tuple(rng.choice(cities, 2, replace=False).tolist()) for _ in range(queries)]
+    graph, graph_map = build_graph(topo)
+    paths: dict[Location, dict[Location, list[Location]]] = {}
+    def find_paths() -> None:
+        for a, b in pairs:
+            src, dst = topo.locations[a], topo.locations[b]
+            paths.setdefault(src, {})[dst] = get_path(graph, graph_map, topo, src, dst, priorities, None)
+    record("get_path", timed(find_paths, repeat), links=links, queries=queries)
+    record("paths_to_flows", timed(lambda: paths_to_flows(paths, topo), repeat), links=links, paths=sum(map(len, paths.values()))) # type: ignore
+
+    if cities <= all_paths_limit:
+        def fresh_table() -> None:
+            touch(topo)
+            routing_table(topo, priorities)
+        record("all_paths", timed(fresh_table, repeat), links=links)
+        profiles = [priorities, Priorities(delay=1.0, bandwidth=2.0, loss=1.0), Priorities(delay=None, bandwidth=1.0), Priorities(delay=2.0, loss=2.0)]
+        def fresh_tables() -> None:
+            touch(topo)
+            routing_tables(topo, profiles)
+        record("all_paths_profiles", timed(fresh_tables, repeat), links=links, profiles=len(profiles))
+
+    output = directory / f"flows-{cities}.json"
+    def pipeline() -> None:
+        with redirect_stdout(io.StringIO()):
+            asyncio.run(find_paths_for_streams(
+                None, file=streams_file, apply=False, output=output, topology=topology_file, max_attempts=10,
+                faild_fast=False, mode=SearchMode.RETRY, k=10, index=False, reroute=False, reconcile=False,
+                aggregate=False, mpls=False,
+            ))
+    # the first run compiles the topology snapshot, later ones start warm
+    with app_dir(directory):
+        record("paths_find_cold", timed(pipeline, 1), links=links, streams=streams)
+        record("paths_find", timed(pipeline, repeat), links=links, streams=streams)
+    return results
+
+
+def git_commit() -> str | None:
+    """Commit of the working tree the benchmarks run on, if it's a git checkout."""
+    try:
+        return subprocess.run( # noqa: S603
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, # noqa: S607
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@app.command()
+def main(
+    cities: Annotated[Optional[list[int]], Option("-c", "--cities", min=2, help="Topology size to benchmark (can be repeated)")] = None,
+    streams: Annotated[int, Option("-s", "--streams", min=1, help="Streams per topology for the paths find pipeline")] = 100,
+    queries: Annotated[int, Option("-q", "--queries", min=1, help="Source/destination pairs for get_path")] = 100,
+    seed: Annotated[int, Option("--seed", help="Seed of generated topologies, streams and queries")] = 0,
+    repeat: Annotated[int, Option("-n", "--repeat", min=1, help="Runs of every benchmark")] = 3,
+    all_paths_limit: Annotated[int, Option("--all-paths-limit", help="Skip all_paths on bigger topologies (its tables grow with the square of the size)")] = 2000,
+    output: Annotated[Optional[Path], Option("-o", "--output", help="Write results to a JSON file")] = None,
+    baseline: Annotated[Optional[Path], Option("-b", "--baseline", exists=True, readable=True, help="Results of an earlier run to compare with")] = None,
+    max_regression: Annotated[Optional[float], Option("--max-regression", help="Fail if a benchmark is this many times slower than the baseline")] = None,
+    ):
+    """Benchmark loading, path finding and flow generation on generated topologies."""
+    results: list[Result] = []
+    with tempfile.TemporaryDirectory(prefix="scht_lab-bench-") as directory:
+        for size in cities or [10, 100, 1000]:
+            print(f"Benchmarking {size} cities...")
+            results.extend(benchmark_size(size, streams, queries, seed, repeat, all_paths_limit, Path(directory)))
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "results": results,
+    }
+    previous: dict[tuple[str, int], float] = {}
+    if baseline:
+        previous = {(result["benchmark"], result["cities"]): result["best_s"] for result in json.loads(baseline.read_text())["results"]}
+    table = Table("Benchmark", "Cities", "Best [ms]", "Median [ms]", *(["Change"] if baseline else []), title="Benchmarks")
+    regressions = []
+    for result in results:
+        change = []
+        before = previous.get((result["benchmark"], result["cities"]))
+        if before:
+            ratio = result["best_s"]/before
+            change = [f"{ratio:.2f}x"]
+            if max_regression is not None and ratio > max_regression:
+                regressions.append(f"{result['benchmark']} ({result['cities']} cities)")
+        elif baseline:
+            change = ["-"]
+        table.add_row(result["benchmark"], str(result["cities"]), f"{result['best_s']*1000:.1f}", f"{result['median_s']*1000:.1f}", *change)
+    print(table)
+    if output:
+        output.write_text(json.dumps(report, indent=2))
+    if regressions:
+        print(f"[red]Slower than baseline: {', '.join(regressions)}[/red]")
+        raise Exit(1)
+
+
+if __name__ == "__main__":
+    app()
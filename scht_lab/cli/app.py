@@ -17,12 +17,27 @@ def all_commands(
     ctx: Context,
     host: Annotated[str, Option("-h", "--host", help="Host address")]="http://mininet:8181",
     user: Annotated[str, Option("-u", "--user", help="Username")]="karaf",
-    password: Annotated[str, Option("-p", "--password", help="Password", hide_input=True)]="karaf"): # noqa: S107
+    password: Annotated[str, Option("-p", "--password", help="Password", hide_input=True)]="karaf", # noqa: S107
+    connections: Annotated[int, Option("--connections", help="Maximum number of open connections to ONOS (0 for no limit)")]=100,
+    connections_per_host: Annotated[int, Option("--connections-per-host", help="Maximum number of open connections to a single host (0 for no limit)")]=32,
+    keepalive: Annotated[float, Option("--keepalive", help="Seconds to keep idle connections open")]=30,
+    connect_timeout: Annotated[float, Option("--connect-timeout", help="Seconds to wait for a connection")]=10,
+    timeout: Annotated[float, Option("--timeout", help="Seconds to wait for a whole request")]=300,
+    timings: Annotated[bool, Option("--timings", help="Print ONOS request latency statistics")]=False):
     """Callback with parameters available for all commands."""
     ctx.ensure_object(dict)
     ctx.obj["BASE_URL"] = host
     ctx.obj["USERNAME"] = user
     ctx.obj["PASSWORD"] = password
+    # PoolConfig arguments, the client is only imported by commands that talk to ONOS
+    ctx.obj["POOL"] = {
+        "limit": connections,
+        "limit_per_host": connections_per_host,
+        "keepalive_timeout": keepalive,
+        "connect_timeout": connect_timeout,
+        "total_timeout": timeout,
+    }
+    ctx.obj["TIMINGS"] = timings
 
 app.add_typer(flows_app, name="flows", callback=all_commands)
 app.add_typer(streams_app, name="streams", callback=all_commands)
@@ -1,50 +1,78 @@
 """Commands directly related to ONOS flows."""
-from asyncio import gather
 import json
-from typing import Annotated, Literal
+import sys
+from pathlib import Path
+from typing import Annotated, Any, Optional
 
-from aiohttp import ClientError, ContentTypeError
-from anyio import Path
 from rich import print
-from rich.tree import Tree
-from typer import Argument, Context, Typer, Option
+from typer import Argument, Context, Exit, Typer, Option
 
-from scht_lab.client import get_client, send_flows
-from scht_lab.models.flow import Flow, Selector, Treatment
+from scht_lab.limits import CHUNK_SIZE, CONCURRENCY
 
 flows_app = Typer(name="flows", help="Interact with flows")
 
 @flows_app.command("list")
-async def get_flows(ctx: Context, raw: Annotated[bool, Option("-r", "--raw", help="Print raw JSON response")] = False):
+async def get_flows(
+    ctx: Context,
+    raw: Annotated[bool, Option("-r", "--raw", help="Print raw JSON response")] = False,
+    devices: Annotated[Optional[list[str]], Option("-d", "--device", help="Only list flows of this device (can be repeated)")] = None,
+    app_id: Annotated[Optional[str], Option("-a", "--app", help="Only list flows of this application")] = None,
+    ):
     """List all flows in the network."""
-    async with get_client(ctx) as client:
-        response = await client.get("/onos/v1/flows")
-        data = await response.json()
-        if not data.get("flows", False):
-            msg = f"Response didn't contain valid flows: {data}"
-            raise ValueError(msg)
-        flows: list[Flow] = data["flows"]
-
-        if raw:
-            print(json.dumps(flows, indent=4))
-            return
-
-        flows_tree = Tree("flows")
-        for flow in sorted(flows, key=lambda flow: flow.deviceId):
-            single_flow_tree = flows_tree.add(flow.deviceId, style="cyan")
-            instructions = single_flow_tree.add("Instructions", style="default")
-            criteria = single_flow_tree.add("Criteria", style="default")
-            for instruction in flow.treatment.instructions:
-                secondary_key = (set(instruction.keys()) - {"type"}).pop()
-                instructions.add(f'{instruction["type"]}: {secondary_key}={instruction[secondary_key]}', style="red")
-            for rule in flow.selector.criteria:
-                secondary_key = (set(rule.keys()) - {"type"}).pop()
-                criteria.add(f'{rule["type"]}: {secondary_key}={rule[secondary_key]}', style="green")
-        print(flows_tree)
+    from pydantic import ValidationError
+    from rich.tree import Tree
+
+    from scht_lab.client import iter_flows
+    from scht_lab.models.flow import FlowEntry
+
+    flows = iter_flows(ctx, devices or (), app_id)
+    if raw:
+        # written item by item, so the whole response is never in memory
+        sys.stdout.write('{"flows": [')
+        separator = "\n"
+        async for flow in flows:
+            sys.stdout.write(separator + json.dumps(flow, indent=4))
+            separator = ",\n"
+        sys.stdout.write("\n]}\n")
+        return
+
+    # ONOS lists flows device by device, so only one device tree is kept at a time
+    device_tree: Tree | None = None
+    async for data in flows:
+        try:
+            flow = FlowEntry.model_validate(data)
+        except ValidationError as e:
+            print(f"[red]Skipping invalid flow: {e}[/red]")
+            continue
+        if device_tree is None or device_tree.label != flow.deviceId:
+            if device_tree is not None:
+                print(device_tree)
+            device_tree = Tree(flow.deviceId, style="cyan")
+        single_flow_tree = device_tree.add(f"{flow.id} (priority {flow.priority}, {flow.appId}, {flow.state})", style="default")
+        instructions = single_flow_tree.add("Instructions", style="default")
+        criteria = single_flow_tree.add("Criteria", style="default")
+        for instruction in flow.instructions:
+            instructions.add(describe_rule(instruction), style="red")
+        for rule in flow.criteria:
+            criteria.add(describe_rule(rule), style="green")
+    if device_tree is None:
+        print("No flows found")
+    else:
+        print(device_tree)
+
+def describe_rule(rule: dict) -> str:
+    """Format an instruction or criterion as 'TYPE: key=value, ...'."""
+    fields = ", ".join(f"{key}={value}" for key, value in rule.items() if key != "type")
+    return f'{rule.get("type")}: {fields}'
 
 @flows_app.command("add")
 async def add_flow(ctx: Context, device_id: str, in_port: int, out_port: int, ip: str):
     """Manually add a flow to the network."""
+    from aiohttp import ClientError, ContentTypeError
+
+    from scht_lab.client import get_client, send_flows
+    from scht_lab.models.flow import Flow, Selector, Treatment
+
     async with get_client(ctx) as client:
         flow: Flow = Flow(
             deviceId=device_id,
@@ -78,32 +106,53 @@ async def load_flows_from_file(
     path: Annotated[Path, Argument(exists=True, readable=True, resolve_path=True)],
     ):
     """Load flows from a JSON file."""
-    async with await path.open('r') as file:
+    from anyio import Path as AsyncPath
+
+    from scht_lab.client import get_client
+
+    async with await AsyncPath(path).open('r') as file:
         try:
             flows_data = await file.read()
             async with get_client(ctx) as client:
-                data: dict[Literal["flows"], list[Flow]] = json.loads(flows_data)
+                data: dict[str, list[dict[str, Any]]] = json.loads(flows_data)
                 response = await client.post("/onos/v1/flows?appId=scht_lab", json=data)
                 data = await response.json()
                 print(data)
         except json.JSONDecodeError as e:
             print(f"Error loading JSON file: {e}")
 
-def ip_flow(flow: Flow) -> bool:
+def ip_flow(flow: dict[str, Any]) -> bool:
     return any([rule["type"] == "ETH_TYPE" and rule["ethType"] == "0x800" for rule in flow["selector"]["criteria"]])
 
 @flows_app.command()
-async def clear(ctx: Context):
+async def clear(
+    ctx: Context,
+    app_id: Annotated[Optional[str], Option("-a", "--app", help="Delete all flows of this application instead of all IPv4 flows")] = None,
+    chunk_size: Annotated[int, Option("-c", "--chunk-size", min=1, help="Flows deleted per request")] = CHUNK_SIZE,
+    concurrency: Annotated[int, Option("-j", "--concurrency", min=1, help="Delete requests in flight at once")] = CONCURRENCY,
+    ):
     """Clear all flows from ONOS."""
-    async with get_client(ctx) as client:
-        async with client.get("/onos/v1/flows") as response:
-            data = await response.json()
-            if not data.get("flows", False):
-                msg = f"Response didn't contain valid flows: {data}"
-                raise ValueError(msg)
-            flows = list(filter(ip_flow, data["flows"]))
-            requests = []
-            for flow in flows:
-                requests.append(client.delete(f"/onos/v1/flows/{flow['deviceId']}/{flow['id']}"))
-            await gather(*requests)
-            print(f"Deleted {len(requests)} flows")
\ No newline at end of file
+    from aiohttp import ClientError
+    from rich.progress import Progress
+
+    from scht_lab.client import delete_app_flows, delete_flows, get_client, iter_flows
+
+    if app_id:
+        try:
+            await delete_app_flows(ctx, app_id)
+        except ClientError as e:
+            print(f"[red]Error deleting flows of {app_id}: {e}[/red]")
+            raise Exit(1)
+        print(f"Deleted flows of {app_id}")
+        return
+    async with get_client(ctx):
+        flows = [{"deviceId": flow["deviceId"], "flowId": flow["id"]} async for flow in iter_flows(ctx) if ip_flow(flow)]
+        with Progress() as progress:
+            task = progress.add_task("Deleting flows", total=len(flows))
+            result = await delete_flows(ctx, flows, chunk_size, concurrency, lambda done: progress.advance(task, done))
+    print(f"Deleted {result.done} flows")
+    if result.failed:
+        print(f"[red]Failed to delete {result.failed} flows in {len(result.errors)} requests:[/red]")
+        for error in sorted(set(result.errors)):
+            print(f"  {error}")
+        raise Exit(1)
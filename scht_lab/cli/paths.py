@@ -1,28 +1,31 @@
-from itertools import chain, pairwise
+from collections.abc import Hashable, Iterator
+from enum import Enum
+from itertools import chain, islice, pairwise
 import json
 from pathlib import Path
-from typing import Annotated, Literal, Optional, Tuple, cast
+from typing import TYPE_CHECKING, Annotated, Literal, Optional, Tuple, cast
 from operator import mul
-from functools import reduce
-from aiohttp import ClientError, ContentTypeError
-import re
+from functools import partial, reduce
 from math import inf
-from rich import print
 
-from pydantic import ValidationError
 from rich import print
 from typer import Option, Context, Typer, get_app_dir, Exit
-from scht_lab.client import activate_defaults, get_client, send_flows
 
-from scht_lab.models.flow import Flow
-from scht_lab.models.stream import Requirements, Streams, Priorities
-from scht_lab.helpers.jsonl import jsonl_to_keyed
-from scht_lab.topo import Link, Location, Topology, load_topology_from_file, default_topo
-from scht_lab.topo_graph import build_graph, get_path, paths_to_flows
+if TYPE_CHECKING:
+    import rustworkx as rx
+
+    from scht_lab.models.flow import FlowRecord
+    from scht_lab.models.stream import Priorities, Requirements, Stream
+    from scht_lab.topo import Link, Location, Topology
+    from scht_lab.topo_graph import LabelTable
 
 paths_app = Typer(name="paths")
 
-streams_regex = re.compile(r"^\s*{\s*(\"$schema\": \"[^\"]+\",\s*)?\s*\"streams\":\s*\[", re.UNICODE)
+class SearchMode(str, Enum):
+    """How to look for paths that meet stream requirements."""
+    RETRY = "retry"
+    K_SHORTEST = "k-shortest"
+    CONSTRAINED = "constrained"
 
 @paths_app.command("find")
 async def find_paths_for_streams(
@@ -33,88 +36,199 @@ async def find_paths_for_streams(
     topology: Annotated[Optional[Path], Option("-t", "--topology", help="Topology file to use")] = None,
     max_attempts: Annotated[int, Option("-m", "--max-attempts", help="Maximum number of attempts to find a path")] = 10,
     faild_fast: Annotated[bool, Option("-ff", "--fail-fast", help="Stop after the first failed attempt, and don't upload anything on failure")] = False,
+    mode: Annotated[SearchMode, Option("--mode", help="How to search for paths meeting stream requirements", case_sensitive=False)] = SearchMode.RETRY,
+    k: Annotated[int, Option("-k", "--candidates", help="Number of cheapest paths to check per stream in k-shortest mode")] = 10,
+    index: Annotated[bool, Option("--index", help="Answer first retry mode searches from a precomputed contraction hierarchy when link costs don't follow utilization")] = False,
+    reroute: Annotated[bool, Option("--reroute", help="Move already admitted streams to cheaper paths as later streams change link utilization")] = False,
+    reconcile: Annotated[bool, Option("-r", "--reconcile", help="When applying, only add missing flows and delete stale ones instead of sending everything")] = False,
+    aggregate: Annotated[bool, Option("--aggregate", help="Match on destination only where the source doesn't change the next hop, to shrink flow tables")] = False,
+    mpls: Annotated[bool, Option("--mpls", help="Install paths as MPLS label-switched paths, so core switches only match on labels")] = False,
     ):
     """Find paths based on stream specifications. By default it will use streams previously saved from the CLI."""
+    from aiohttp import ClientError, ContentTypeError
+
+    from scht_lab.client import activate_defaults, get_app_flows, get_client, reconcile_flows, send_flows
+    from scht_lab.models.flow import FlowRecord
+    from scht_lab.models.stream import Priorities, Requirements, Stream
+    from scht_lab.routing.dynamic import DynamicRouter
+    from scht_lab.topo import Link, Location, default_topo, load_topology_from_file
+    from scht_lab.topo_graph import FIRST_MPLS_LABEL, LabelTable, aggregate_flows, build_graph, candidate_paths, get_constrained_path, next_free_label
+
     target_file = Path(get_app_dir("scht_lab")) / "streams.jsonl"
     if file:
         target_file = file
-    with target_file.open('r') as f:
-        try:
-            file_data = f.read()
-            if not streams_regex.match(file_data):
-                file_data = jsonl_to_keyed(file_data, "streams")
-            streams_data = Streams.model_validate_json(file_data)
-        except ValidationError as e:
-            print(f"Error loading JSON file:")
-            print(e.errors())
-            raise Exit(1)
     if topology:
         topo = await load_topology_from_file(topology)
     else:
         topo = await default_topo()
     graph, graph_map = build_graph(topo)
-    flows: set[Flow] = set()
-    for stream in streams_data.streams:
-        source = topo.get_location(stream.src)
-        dest = topo.get_location(stream.dst)
-        if not source or not dest:
-            print(f"Source or destination not found for stream {stream}")
-            continue
-        priorities = stream.priorities or Priorities()
-        requirements = stream.requirements or Requirements()
-        for i in chain(range(1, max_attempts+1), [inf]):
-            path = get_path(graph, graph_map, topo, source, dest, priorities, requirements, stream.type)
-            link_path = cast(list[Link],list(map(lambda x: topo.get_link(*x), pairwise(path))))
-            if not path or None in link_path:
-                print(f"Correct path not found for stream {stream}")
+    flows: set[FlowRecord] = set()
+    labels = None
+    if mpls:
+        first = FIRST_MPLS_LABEL
+        # flows of earlier runs stay installed, so their labels can't be given to other paths
+        # (reconciling deletes stale flows before adding new ones, so labels can start over)
+        if apply and not reconcile:
+            try:
+                first = next_free_label(await get_app_flows(ctx))
+            except (ContentTypeError, ClientError) as e:
+                print(f"Error getting installed flows: {e}")
+                raise Exit(1)
+        labels = LabelTable(first)
+    router = None
+    admitted: dict[int, Stream] = {}
+    if reroute:
+        def accept(key: Hashable, path: list[Location], link_path: list[Link]) -> bool:
+            stream = admitted[cast(int, key)]
+            return not check_requirements(get_stream_path_params(link_path, topo, stream), stream.requirements or Requirements())
+        router = DynamicRouter(topo, accept)
+    try:
+        for stream_index, stream in enumerate(read_streams(target_file)):
+            source = topo.get_location(stream.src)
+            dest = topo.get_location(stream.dst)
+            if not source or not dest:
+                print(f"Source or destination not found for stream {stream}")
                 continue
-            params = get_path_params(link_path, topo)
-            failed = False
-            if stream.type == "UDP" and params["bandwidth"] < stream.rate:
-                params["loss"] += (stream.rate - params["bandwidth"])/stream.rate
-            if requirements.delay and params["delay"] > requirements.delay:
-                priorities.delay = priorities.delay * 2**i if priorities.delay else 1
-                failed = True
-                print(f"Path {path} does not meet delay requirement of {requirements.delay} for stream {stream}. Total delay: {params['delay']}")
-            if requirements.jitter and params["jitter"] > requirements.jitter:
-                priorities.jitter = priorities.jitter * 2**i if priorities.jitter else 1
-                failed = True
-                print(f"Path {path} does not meet jitter requirement of {requirements.jitter} for stream {stream}. Total jitter: {params['jitter']}")
-            if requirements.loss and params["loss"] > requirements.loss:
-                priorities.loss = priorities.loss * 2**i if priorities.loss else 1
-                failed = True
-                print(f"Path {path} does not meet loss requirement of {requirements.loss} for stream {stream}. Total loss: {params['loss']}")
-            if requirements.bandwidth and params["bandwidth"] < requirements.bandwidth:
-                priorities.bandwidth = priorities.bandwidth * 2**i if priorities.bandwidth else 1
-                failed = True
-                print(f"Path {path} does not meet bandwidth requirement of {requirements.bandwidth} for stream {stream}. Total bandwidth: {params['bandwidth']}")
-            if not failed:
-                flows.update(paths_to_flows(path, topo))
-                flows.update(paths_to_flows(list(reversed(path)), topo)) # also add the return path
-                flows.update(*[node.endpoint_flows() for node in path])
-                for link in link_path:
-                    link.increase_utilization(stream.rate)
-                break
-        else:
-            print(f"Path not found for stream {stream}")
-            if faild_fast:
-                return
+            priorities = stream.priorities or Priorities()
+            requirements = stream.requirements or Requirements()
+            if mode == SearchMode.K_SHORTEST:
+                candidates = islice(candidate_paths(topo, source, dest, priorities, requirements, stream.type, stream.rate), k)
+            elif mode == SearchMode.CONSTRAINED:
+                candidates = [get_constrained_path(topo, source, dest, priorities, requirements, stream.type, stream.rate)]
+            else:
+                candidates = RetryPaths(graph, graph_map, topo, source, dest, priorities, requirements, stream, max_attempts, index)
+            for path in candidates:
+                link_path = cast(list[Link],list(map(lambda x: topo.get_link(*x), pairwise(path))))
+                if not path or None in link_path:
+                    print(f"Correct path not found for stream {stream}")
+                    continue
+                params = get_stream_path_params(link_path, topo, stream)
+                failed = check_requirements(params, requirements)
+                for requirement in failed:
+                    print(f"Path {path} does not meet {requirement} requirement of {getattr(requirements, requirement)} for stream {stream}. Total {requirement}: {params[requirement]}")
+                if failed and mode == SearchMode.RETRY:
+                    # make the next search weigh the failed requirements more
+                    attempt = cast(RetryPaths, candidates).attempt
+                    for requirement in failed:
+                        priority = getattr(priorities, requirement)
+                        setattr(priorities, requirement, priority * 2**attempt if priority else 1)
+                if not failed and router:
+                    # flows are generated at the end, as earlier streams can still move
+                    admitted[stream_index] = stream
+                    router.add(stream_index, path, priorities, requirements, stream.type, stream.rate)
+                    for key in router.update():
+                        print(f"Re-routed stream {admitted[cast(int, key)]} to {router.path(key)}")
+                    break
+                if not failed:
+                    flows.update(stream_flows(path, topo, labels))
+                    for link in link_path:
+                        link.increase_utilization(stream.rate)
+                    break
+            else:
+                print(f"Path not found for stream {stream}")
+                if faild_fast:
+                    return
+        if router:
+            for path in router.paths().values():
+                flows.update(stream_flows(path, topo, labels))
+    finally:
+        if router:
+            router.close()
+    if aggregate:
+        flows = set(aggregate_flows(flows))
     if apply:
         try:
-            await activate_defaults(ctx)
-            data = await send_flows(ctx, flows)
-            print(data)
+            # one session for all calls, so connections are reused
+            async with get_client(ctx):
+                await activate_defaults(ctx)
+                if reconcile:
+                    diff = await reconcile_flows(ctx, flows)
+                    print(f"Added {len(diff.add)} flows, deleted {len(diff.delete)}, kept {diff.unchanged}")
+                else:
+                    data = await send_flows(ctx, flows)
+                    print(data)
         except (ContentTypeError, ClientError) as e:
             print(f"Error sending flows: {e}")
     if output:
         with output.open('w') as f:
-            json.dump({"flows": [flow.model_dump(exclude_unset=True, mode="json") for flow in flows]}, f, indent=2)
+            json.dump({"flows": [flow.to_onos() for flow in flows]}, f, indent=2)
     if not (apply or output):
         print(flows)
     if not file:
         # clean up saved streams after use
         target_file.unlink()
-def get_path_params(path: list[Link], topo: Topology) -> dict[Literal["delay", "jitter", "loss", "bandwidth"], float]:
+def read_streams(path: Path) -> Iterator["Stream"]:
+    """Lazily load streams from a file, exiting with an error message if one is invalid."""
+    from scht_lab.helpers.jsonl import iter_streams
+
+    with path.open('r') as f:
+        try:
+            yield from iter_streams(f)
+        except ValueError as e:
+            print(f"Error loading streams: {e}")
+            raise Exit(1)
+
+def stream_flows(path: list["Location"], topo: "Topology", labels: "LabelTable | None" = None) -> set["FlowRecord"]:
+    """Get flows needed for a stream path, in both directions. With labels the path is label-switched."""
+    from scht_lab.topo_graph import mpls_flows, paths_to_flows
+
+    if labels is not None:
+        flows = set(mpls_flows(path, topo, labels))
+        flows.update(mpls_flows(list(reversed(path)), topo, labels))
+    else:
+        flows = set(paths_to_flows(path, topo))
+        flows.update(paths_to_flows(list(reversed(path)), topo)) # also add the return path
+    flows.update(*[node.endpoint_flows() for node in path])
+    return flows
+
+class RetryPaths:
+    """Re-run A* with priorities adjusted between attempts (by the caller) until attempts run out.
+
+    With ``index`` the first attempt is answered from a contraction hierarchy, unless link costs
+    follow utilization. Later attempts change the priorities, so building an index for them
+    would take longer than the searches it speeds up.
+    """
+    def __init__(
+            self, graph: "rx.PyGraph", graph_map: dict["Location", int], topo: "Topology", source: "Location", dest: "Location",
+            priorities: "Priorities", requirements: "Requirements", stream: "Stream", max_attempts: int, index: bool = False,
+            ) -> None:
+        """Prepare path search for a stream."""
+        from scht_lab.cost_calc import uses_utilization
+        from scht_lab.topo_graph import get_path
+
+        self.search = partial(
+            get_path, graph, graph_map, topo, source, dest, priorities, requirements, stream.type, stream.rate,
+        )
+        self.index = index and not uses_utilization(priorities, requirements, stream.type, stream.rate)
+        self.attempts = chain(range(1, max_attempts+1), [inf])
+        self.attempt: float = 0
+    def __iter__(self) -> Iterator[list["Location"]]:
+        for self.attempt in self.attempts:
+            yield self.search(index=self.index and self.attempt == 1)
+
+def get_stream_path_params(path: list["Link"], topo: "Topology", stream: "Stream") -> dict[Literal["delay", "jitter", "loss", "bandwidth"], float]:
+    """Get parameters of a path as experienced by a stream (UDP streams above path bandwidth suffer extra loss)."""
+    from scht_lab.models.stream import StreamType
+
+    params = get_path_params(path, topo)
+    if stream.type == StreamType.UDP and params["bandwidth"] < stream.rate:
+        params["loss"] += (stream.rate - params["bandwidth"])/stream.rate
+    return params
+
+def check_requirements(params: dict[Literal["delay", "jitter", "loss", "bandwidth"], float], requirements: "Requirements") -> list[Literal["delay", "jitter", "loss", "bandwidth"]]:
+    """Get requirements that a path with given parameters fails to meet."""
+    failed: list[Literal["delay", "jitter", "loss", "bandwidth"]] = []
+    if requirements.delay and params["delay"] > requirements.delay:
+        failed.append("delay")
+    if requirements.jitter and params["jitter"] > requirements.jitter:
+        failed.append("jitter")
+    if requirements.loss and params["loss"] > requirements.loss:
+        failed.append("loss")
+    if requirements.bandwidth and params["bandwidth"] < requirements.bandwidth:
+        failed.append("bandwidth")
+    return failed
+
+def get_path_params(path: list["Link"], topo: "Topology") -> dict[Literal["delay", "jitter", "loss", "bandwidth"], float]:
     """Get the bandwidth of a path."""
     delays = []
     success_probabilities = []
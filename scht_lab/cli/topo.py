@@ -1,23 +1,22 @@
 import json
+from collections import OrderedDict
 from pathlib import Path
-import time
 from typing import Annotated, Optional
-from pydantic import ValidationError
 
 from rich import print
-from typer import Argument, Context, Option, Typer, get_app_dir
+from typer import Argument, Context, Option, Typer
 
-from scht_lab.models.flow import Flow
-from scht_lab.models.stream import Streams
-from scht_lab.helpers.jsonl import jsonl_to_keyed
-from scht_lab.topo import default_topo, load_topology_from_file, save_default
-from scht_lab.topo_graph import GraphMethod, build_graph, draw_graph
+from scht_lab.models.graph import GraphMethod
 
 topo_app = Typer(name="topo")
 
 @topo_app.command("load")
 async def load_topology(ctx: Context, file: Annotated[Path, Argument(exists=True, readable=True, resolve_path=True)]):
     """Load topology and save it as default."""
+    from pydantic import ValidationError
+
+    from scht_lab.topo import load_topology_from_file, save_default
+
     try:
         topo = await load_topology_from_file(file)
         print("Loaded topology:")
@@ -34,9 +33,41 @@ async def show_topology(ctx: Context,
                         method: Annotated[GraphMethod, Option("-m", "--method", help="Graphviz layout engine to use for graphing", case_sensitive=False)] = GraphMethod.CIRCO
                         ):
     """Show a graph of the topology."""
+    from scht_lab.topo import default_topo, load_topology_from_file
+    from scht_lab.topo_graph import build_graph, draw_graph
+
     if topology:
         topo = await load_topology_from_file(topology)
     else:
         topo = await default_topo()
     graph, _ = build_graph(topo)
-    draw_graph(graph, output, show=output is None, method=method)
\ No newline at end of file
+    draw_graph(graph, output, show=output is None, method=method)
+
+@topo_app.command("geocode")
+async def geocode_topology(
+    ctx: Context,
+    file: Annotated[Path, Argument(exists=True, readable=True, resolve_path=True)],
+    inline: Annotated[bool, Option("-i", "--inline", help="Write coordinates into the topology file, so loading it never needs geocoding")] = False,
+    retry_missing: Annotated[bool, Option("--retry-missing", help="Look up places that couldn't be geocoded before again")] = False,
+    concurrency: Annotated[int, Option("-j", "--concurrency", min=1, help="Maximum number of places looked up at once")] = 8,
+    hedge_after: Annotated[float, Option("--hedge-after", help="Seconds to wait for a provider before also asking the next one")] = 2.0,
+    ):
+    """Geocode all locations of a topology in bulk, filling the local coordinate store."""
+    from scht_lab.geo import GeoStore, HedgedGeocoder, geocode_all
+
+    with file.open("r") as f:
+        topo_data = json.load(f, object_pairs_hook=OrderedDict)
+    with GeoStore() as store:
+        async with HedgedGeocoder(concurrency=concurrency, hedge_after=hedge_after) as geocoder:
+            coordinates = await geocode_all(topo_data.keys(), store, geocoder, retry_missing)
+    missing = [name for name, coords in coordinates.items() if coords is None]
+    print(f"Coordinates known for {len(coordinates) - len(missing)} of {len(coordinates)} locations")
+    if missing:
+        print(f"Not found: {', '.join(missing)}")
+    if inline:
+        for name, coords in coordinates.items():
+            if coords is not None:
+                topo_data[name]["lat"], topo_data[name]["lon"] = coords
+        with file.open("w") as f:
+            json.dump(topo_data, f, indent=4)
+        print(f"Saved coordinates to {file}")
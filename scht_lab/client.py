@@ -1,20 +1,163 @@
 """aiohttp client wrapper for ONOS API calls."""
-from asyncio import gather
-from typing import Iterable
-from aiohttp import BasicAuth, ClientError, ClientSession, ContentTypeError
+from asyncio import Semaphore, gather
+from collections.abc import AsyncIterator, Callable, Hashable
+from dataclasses import dataclass, field
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any, Iterable
+from aiohttp import (
+    BasicAuth,
+    ClientError,
+    ClientSession,
+    ClientTimeout,
+    ContentTypeError,
+    TCPConnector,
+    TraceConfig,
+    TraceRequestEndParams,
+    TraceRequestExceptionParams,
+    TraceRequestStartParams,
+)
 from click import Context
+from rich import print
+from rich.table import Table
 
-from scht_lab.models.flow import Flow
+from scht_lab.helpers.json_stream import iter_json_array
+from scht_lab.limits import CHUNK_SIZE, CONCURRENCY
+from scht_lab.models.flow import Flow, FlowRecord, dump_flows, flow_key
 
+APP_ID = "scht_lab"
+# bytes read at once when streaming responses
+STREAM_CHUNK_SIZE = 64*1024
 
-def get_client(context: Context, *args, **kwargs):
-    """Get an aiohttp client session."""
-    return ClientSession(
-        context.obj["BASE_URL"], 
-        *args, 
-        auth=BasicAuth(context.obj["USERNAME"], context.obj["PASSWORD"]), 
-        **kwargs,
-    )
+
+@dataclass
+class PoolConfig:
+    """Connection pool settings of the ONOS client."""
+    limit: int = 100
+    limit_per_host: int = 32
+    keepalive_timeout: float = 30
+    connect_timeout: float = 10
+    total_timeout: float = 300
+
+
+class LatencyStats:
+    """Durations of requests made by a client, grouped by method and path."""
+    def __init__(self) -> None:
+        """Start without any samples."""
+        self.samples: dict[tuple[str, str], list[float]] = {}
+        self.errors = 0
+
+    def record(self, method: str, path: str, seconds: float) -> None:
+        """Add a request duration."""
+        self.samples.setdefault((method, path), []).append(seconds)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Get count, mean, median, p95 and max latency (in ms) for every kind of request."""
+        result = {}
+        for (method, path), samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            result[f"{method} {path}"] = {
+                "count": len(ordered),
+                "mean": 1000*sum(ordered)/len(ordered),
+                "p50": 1000*ordered[len(ordered)//2],
+                "p95": 1000*ordered[min(len(ordered) - 1, int(len(ordered)*0.95))],
+                "max": 1000*ordered[-1],
+            }
+        return result
+
+    def trace_config(self) -> TraceConfig:
+        """Get aiohttp trace config that records into these stats."""
+        async def on_request_start(session: ClientSession, trace_ctx: SimpleNamespace, params: TraceRequestStartParams) -> None:
+            trace_ctx.start = perf_counter()
+
+        async def on_request_end(session: ClientSession, trace_ctx: SimpleNamespace, params: TraceRequestEndParams) -> None:
+            self.record(params.method, params.url.path, perf_counter() - trace_ctx.start)
+
+        async def on_request_exception(session: ClientSession, trace_ctx: SimpleNamespace, params: TraceRequestExceptionParams) -> None:
+            self.errors += 1
+
+        config = TraceConfig()
+        config.on_request_start.append(on_request_start)
+        config.on_request_end.append(on_request_end)
+        config.on_request_exception.append(on_request_exception)
+        return config
+
+
+class OnosClient:
+    """ONOS API client shared by all calls in a process, keeping connections alive between them.
+
+    Use with ``async with``, which gives the underlying aiohttp session. Nested uses share it
+    and it's closed when the outermost one exits.
+    """
+    def __init__(self, base_url: str, auth: BasicAuth, pool: PoolConfig | None = None, report: bool = False) -> None:
+        """Configure the client, the session is created on first use."""
+        self.base_url = base_url
+        self.auth = auth
+        self.pool = pool or PoolConfig()
+        self.report = report
+        self.stats = LatencyStats()
+        self._session: ClientSession | None = None
+        self._users = 0
+
+    @property
+    def session(self) -> ClientSession:
+        """Get the session, opening it if needed."""
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                limit=self.pool.limit,
+                limit_per_host=self.pool.limit_per_host,
+                keepalive_timeout=self.pool.keepalive_timeout,
+            )
+            self._session = ClientSession(
+                self.base_url,
+                auth=self.auth,
+                connector=connector,
+                timeout=ClientTimeout(total=self.pool.total_timeout, connect=self.pool.connect_timeout),
+                trace_configs=[self.stats.trace_config()],
+            )
+        return self._session
+
+    async def __aenter__(self) -> ClientSession:
+        """Start using the shared session."""
+        self._users += 1
+        return self.session
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Stop using the session, closing it if nothing else does."""
+        self._users -= 1
+        if not self._users:
+            await self.close()
+
+    async def close(self) -> None:
+        """Close the session and its connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            if self.report:
+                print_stats(self.stats)
+
+
+def print_stats(stats: LatencyStats) -> None:
+    """Print request latency summary."""
+    table = Table("Request", "Count", "Mean [ms]", "p50 [ms]", "p95 [ms]", "Max [ms]", title="ONOS requests")
+    for request, row in stats.summary().items():
+        table.add_row(request, str(int(row["count"])), *(f"{row[key]:.1f}" for key in ("mean", "p50", "p95", "max")))
+    print(table)
+    if stats.errors:
+        print(f"[red]{stats.errors} requests failed[/red]")
+
+
+def get_client(context: Context) -> OnosClient:
+    """Get the ONOS client shared by all calls of the current command."""
+    obj = context.obj
+    if "CLIENT" not in obj:
+        obj["CLIENT"] = OnosClient(
+            obj["BASE_URL"],
+            BasicAuth(obj["USERNAME"], obj["PASSWORD"]),
+            PoolConfig(**obj.get("POOL", {})),
+            obj.get("TIMINGS", False),
+        )
+    return obj["CLIENT"]
 
 
 async def activate_defaults(ctx: Context):
@@ -22,14 +165,142 @@ async def activate_defaults(ctx: Context):
     async with get_client(ctx) as client:
         # ensure switch and host discovery works correctly
         default_apps = ["org.onosproject.openflow", "org.onosproject.proxyarp", "org.onosproject.lldpprovider", "org.onosproject.hostprovider"]
-        responses = []
-        for app in default_apps:
-            responses.append(client.post(f"/applications/{app}/active"))
-        await gather(*responses)
+        async def activate(app: str) -> None:
+            async with client.post(f"/onos/v1/applications/{app}/active") as response:
+                if not response.ok:
+                    print(f"[yellow]Couldn't activate {app}: {response.status} {response.reason}[/yellow]")
+        await gather(*(activate(app) for app in default_apps))
 
-async def send_flows(ctx: Context, flows: Iterable[Flow]):
+async def send_flows(ctx: Context, flows: Iterable[Flow | FlowRecord]):
     """Send flows to ONOS."""
     async with get_client(ctx) as client:
-        async with client.post("/onos/v1/flows?appId=scht_lab", json={"flows":[flow.model_dump(exclude_unset=True, mode="json") for flow in flows]}) as response:
+        async with client.post("/onos/v1/flows?appId=scht_lab", data=dump_flows(flows), headers={"Content-Type": "application/json"}) as response:
             data = await response.json()
-            return data
\ No newline at end of file
+            return data
+
+
+def chunks(items: list, size: int) -> Iterable[list]:
+    """Split a list into consecutive chunks of at most size items."""
+    for start in range(0, len(items), size):
+        yield items[start:start+size]
+
+
+@dataclass
+class FlowDiff:
+    """Changes needed to get from installed flows to desired ones."""
+    add: list[dict[str, Any]]
+    delete: list[dict[str, Any]]
+    unchanged: int
+
+    def __bool__(self) -> bool:
+        """Check if anything needs to change."""
+        return bool(self.add or self.delete)
+
+
+def diff_flows(desired: Iterable[Flow | FlowRecord], installed: Iterable[dict[str, Any]]) -> FlowDiff:
+    """Match desired flows against flows installed in ONOS by what they do.
+
+    Installed flows without a desired counterpart (and duplicates of ones that have one) are deleted,
+    desired flows that aren't installed yet are added.
+    """
+    wanted: dict[Hashable, dict[str, Any]] = {}
+    for flow in desired:
+        wanted.setdefault(flow_key(flow), flow.to_onos() if isinstance(flow, FlowRecord) else flow.model_dump(exclude_unset=True, mode="json"))
+    delete = []
+    kept: set[Hashable] = set()
+    for flow in installed:
+        key = flow_key(flow)
+        if key in wanted and key not in kept:
+            kept.add(key)
+        else:
+            delete.append({"deviceId": flow["deviceId"], "flowId": flow["id"]})
+    add = [flow for key, flow in wanted.items() if key not in kept]
+    return FlowDiff(add, delete, len(kept))
+
+
+async def get_app_flows(ctx: Context, app_id: str = APP_ID) -> list[dict[str, Any]]:
+    """Get flows installed by an application."""
+    return [flow async for flow in iter_flows(ctx, app_id=app_id)]
+
+
+async def iter_flows(ctx: Context, device_ids: Iterable[str] = (), app_id: str | None = None) -> AsyncIterator[dict[str, Any]]:
+    """Yield flows installed in ONOS one by one, parsing the response as it arrives.
+
+    With an app_id only that application's flows are requested, with device_ids only flows of those devices.
+    """
+    devices = set(device_ids)
+    if app_id:
+        # ONOS can't filter by both, so devices are filtered here
+        urls = [f"/onos/v1/flows/application/{app_id}"]
+    elif devices:
+        urls = [f"/onos/v1/flows/{device}" for device in sorted(devices)]
+    else:
+        urls = ["/onos/v1/flows"]
+    async with get_client(ctx) as client:
+        for url in urls:
+            async with client.get(url) as response:
+                response.raise_for_status()
+                async for flow in iter_json_array(response.content.iter_chunked(STREAM_CHUNK_SIZE), "flows"):
+                    if not devices or flow.get("deviceId") in devices:
+                        yield flow
+
+
+async def reconcile_flows(ctx: Context, flows: Iterable[Flow | FlowRecord], app_id: str = APP_ID, chunk_size: int = CHUNK_SIZE) -> FlowDiff:
+    """Make flows installed by the application match desired ones, sending only the differences.
+
+    Deletions go first, so stale rules don't shadow new ones with the same match.
+    """
+    async with get_client(ctx) as client:
+        diff = diff_flows(flows, await get_app_flows(ctx, app_id))
+        for chunk in chunks(diff.delete, chunk_size):
+            async with client.delete("/onos/v1/flows", json={"flows": chunk}) as response:
+                response.raise_for_status()
+        for chunk in chunks(diff.add, chunk_size):
+            async with client.post(f"/onos/v1/flows?appId={app_id}", json={"flows": chunk}) as response:
+                response.raise_for_status()
+    return diff
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a chunked bulk operation."""
+    done: int = 0
+    failed: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+async def delete_flows(
+        ctx: Context,
+        flows: list[dict[str, Any]],
+        chunk_size: int = CHUNK_SIZE,
+        concurrency: int = CONCURRENCY,
+        progress: Callable[[int], None] | None = None,
+        ) -> BatchResult:
+    """Delete flows given as {"deviceId", "flowId"} with batch requests, at most concurrency at a time.
+
+    Failed chunks don't stop the others, they're counted in the result instead.
+    progress is called with the number of flows in each finished chunk.
+    """
+    result = BatchResult()
+    semaphore = Semaphore(concurrency)
+    async with get_client(ctx) as client:
+        async def delete_chunk(chunk: list[dict[str, Any]]) -> None:
+            async with semaphore:
+                try:
+                    async with client.delete("/onos/v1/flows", json={"flows": chunk}) as response:
+                        response.raise_for_status()
+                    result.done += len(chunk)
+                except (ClientError, TimeoutError) as e:
+                    result.failed += len(chunk)
+                    result.errors.append(str(e) or type(e).__name__)
+            if progress:
+                progress(len(chunk))
+        await gather(*(delete_chunk(chunk) for chunk in chunks(flows, chunk_size)))
+    return result
+
+
+async def delete_app_flows(ctx: Context, app_id: str = APP_ID) -> None:
+    """Delete all flows of an application with a single request."""
+    async with get_client(ctx) as client:
+        async with client.delete(f"/onos/v1/flows/application/{app_id}") as response:
+            response.raise_for_status()
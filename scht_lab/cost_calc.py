@@ -1,7 +1,10 @@
 """Cost calculation functions for pathfinding."""
+from collections.abc import Callable, Hashable, Sequence
 from functools import wraps
 from math import inf
-from typing import Literal
+from typing import Literal, cast
+
+import numpy as np
 
 from scht_lab.models.stream import Priorities, Requirements, StreamType
 from scht_lab.topo import Link, Topology
@@ -31,11 +34,11 @@ def bandwidth_calc(link: Link, priority: float = 1.0, requirement: float = 0.0,
 def loss_calc(link: Link, priority: float = 1.0, topo: Topology | None = None, requirement: Requirements | None = None, stream_type: StreamType | None = None, rate: int = 0) -> float:
     """Calculate loss for a link."""
     loss = link.loss_calc()
-    if requirement and requirement.loss and stream_type and stream_type == "UDP":
+    if requirement and requirement.loss and stream_type == StreamType.UDP and rate:
         bw = link.bandwidth_calc() - link.utilization
         if bw < rate:
             loss += (rate-bw)/rate
-    if loss > (requirement.loss if requirement and requirement.loss else 0):
+    if requirement and requirement.loss and loss > requirement.loss:
         return inf
     normalized_loss = loss/(topo.max_loss if topo else 1)
     return priority/normalized_loss if priority else 0.0
@@ -62,4 +65,126 @@ def get_cost_calc(priorities: Priorities | None = None, requirements: Requiremen
     @wraps(cost_calc)
     def wrapped(link: Link):
         return cost_calc(link, priorities, requirements, stream_type, topology)
-    return wrapped
\ No newline at end of file
+    return wrapped
+
+
+def weight_key(
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        ) -> Hashable:
+    """Get a hashable key identifying a weight profile (priorities are mutable, so it's computed from current values)."""
+    return (
+        tuple(priorities.model_dump().values()) if priorities is not None else None,
+        tuple(requirements.model_dump().values()) if requirements is not None else None,
+        stream_type.value if stream_type is not None else None,
+        rate,
+    )
+
+def uses_utilization(
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        ) -> bool:
+    """Check if link costs of a weight profile change with link utilization."""
+    if priorities is None:
+        return False
+    return bool(
+        priorities.congestion
+        or (requirements and requirements.bandwidth)
+        or (requirements and requirements.loss and stream_type == StreamType.UDP and rate)
+    )
+
+def _compile_weights(
+        topology: Topology,
+        priorities: Priorities | None,
+        requirements: Requirements | None,
+        stream_type: StreamType | None,
+        rate: int,
+        edges: np.ndarray | None = None,
+        utilization: np.ndarray | None = None,
+        ) -> np.ndarray:
+    metrics = topology.metrics
+    def column(values: np.ndarray) -> np.ndarray:
+        return values if edges is None else values[edges]
+    if priorities is None:
+        return column(metrics.distance).copy()
+    delay, jitter, bandwidth, loss = column(metrics.delay), column(metrics.jitter), column(metrics.bandwidth), column(metrics.loss)
+    if utilization is None:
+        utilization = column(metrics.utilization)
+    available = bandwidth - utilization
+    weights = np.zeros(len(delay))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if priorities.delay:
+            weights += priorities.delay/(delay/topology.max_delay)
+        if priorities.jitter:
+            weights += priorities.jitter/(jitter/topology.max_jitter)
+        if priorities.bandwidth:
+            weights += (topology.max_bandwidth/bandwidth)**priorities.bandwidth
+        if requirements and requirements.bandwidth:
+            weights[available < requirements.bandwidth] = inf
+        loss = loss.copy()
+        if requirements and requirements.loss and stream_type == StreamType.UDP and rate:
+            congested = available < rate
+            loss[congested] += (rate - available[congested])/rate
+        if priorities.loss:
+            weights += priorities.loss/(loss/topology.max_loss)
+        if requirements and requirements.loss:
+            weights[loss > requirements.loss] = inf
+        if priorities.congestion:
+            weights += (utilization * priorities.congestion)/bandwidth
+    return weights
+
+def compile_weights(
+        topology: Topology,
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        ) -> np.ndarray:
+    """Calculate cost of every link in the topology at once, indexed by edge id.
+
+    Equivalent to calling cost_calc for each link, with ``inf`` marking links that can't be used.
+    Results are cached on the topology until it changes.
+    """
+    key = ("weights", weight_key(priorities, requirements, stream_type, rate))
+    def build() -> np.ndarray:
+        weights = _compile_weights(topology, priorities, requirements, stream_type, rate)
+        weights.flags.writeable = False
+        return weights
+    return topology.derived(key, build)
+
+def edge_weights(
+        topology: Topology,
+        edges: Sequence[int],
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        utilization: np.ndarray | None = None,
+        ) -> np.ndarray:
+    """Calculate cost of some links only, the same values compile_weights gives them (not cached).
+
+    ``utilization`` of those links can be given instead of the current one, e.g. to see them without some load.
+    """
+    return _compile_weights(topology, priorities, requirements, stream_type, rate, np.asarray(edges, dtype=np.intp), utilization)
+
+def get_compiled_cost(
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        topology: Topology | None = None,
+        rate: int = 0,
+        ) -> Callable[[Link], float]:
+    """Get a cost function looking up precompiled link costs, for links belonging to the topology."""
+    if topology is None:
+        msg = "Compiled costs require a topology"
+        raise ValueError(msg)
+    # a list indexes faster than the array, and is kept with it so repeated searches don't convert it again
+    costs: list[float] = topology.derived(
+        ("weight_list", weight_key(priorities, requirements, stream_type, rate)),
+        lambda: compile_weights(topology, priorities, requirements, stream_type, rate).tolist(),
+    )
+    return lambda link: costs[cast(int, link.id)]
@@ -0,0 +1,239 @@
+"""Geocoding of locations, with results kept in a local SQLite store."""
+import sqlite3
+import time
+from asyncio import FIRST_COMPLETED, Lock, Semaphore, Task, create_task, sleep, wait
+from collections.abc import Awaitable, Iterable
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import monotonic
+from typing import Any, cast
+
+from geopy.adapters import AioHTTPAdapter
+from geopy.exc import GeopyError
+from geopy.geocoders import DataBC, IGNFrance, Nominatim, Photon
+from geopy.geocoders.base import Geocoder
+from geopy.location import Location as GeoLocation
+from typer import get_app_dir
+
+from scht_lab.helpers.gather_dict import gather_dict
+
+Coordinates = tuple[float, float]
+# SQLite limits the number of parameters in a single statement
+QUERY_CHUNK = 900
+# errors of a provider that doesn't say whether a place exists, e.g. network problems or rate limiting
+LOOKUP_ERRORS = (GeopyError, OSError, TimeoutError)
+
+
+def store_path() -> Path:
+    """Default location of the coordinate store, in the app directory."""
+    return Path(get_app_dir("scht_lab")) / "geo.sqlite"
+
+
+class GeoStore:
+    """Coordinates of places by name in a single SQLite file.
+
+    Places no provider found are stored too (without coordinates), so they aren't looked up on every load.
+    """
+    def __init__(self, path: Path | None = None) -> None:
+        """Open (or create) the store."""
+        self.path = path or store_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS places (name TEXT PRIMARY KEY, lat REAL, lon REAL, address TEXT, updated REAL NOT NULL)",
+        )
+
+    def __enter__(self) -> "GeoStore":
+        """Use the store as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the store."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+    def get_many(self, names: Iterable[str]) -> dict[str, Coordinates | None]:
+        """Get stored coordinates of places, None for known failures. Unknown places are left out."""
+        names = list(dict.fromkeys(names))
+        result: dict[str, Coordinates | None] = {}
+        for start in range(0, len(names), QUERY_CHUNK):
+            chunk = names[start:start+QUERY_CHUNK]
+            rows = self.connection.execute(
+                f"SELECT name, lat, lon FROM places WHERE name IN ({','.join('?' * len(chunk))})", # noqa: S608
+                chunk,
+            )
+            for name, lat, lon in rows:
+                result[name] = None if lat is None or lon is None else (lat, lon)
+        return result
+
+    def put_many(self, places: dict[str, GeoLocation | None]) -> None:
+        """Store geocoding results (None for places that weren't found) in a single transaction."""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO places (name, lat, lon, address, updated) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (name, geo.latitude, geo.longitude, geo.address, now) if geo is not None else (name, None, None, None, now)
+                    for name, geo in places.items()
+                ],
+            )
+
+
+class TokenBucket:
+    """Rate limiter allowing rate requests per second on average, with bursts of up to burst requests."""
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """Start with a full bucket."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a request is allowed."""
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await sleep((1 - self.tokens)/self.rate)
+
+
+@dataclass
+class Provider:
+    """Geocoding service with its request rate limit. Options are passed to the geopy geocoder."""
+    geocoder: type[Geocoder]
+    rate: float
+    burst: int = 1
+    options: dict[str, Any] = field(default_factory=dict)
+
+
+# in order of preference, Nominatim's usage policy allows a single request per second
+DEFAULT_PROVIDERS = [
+    Provider(Nominatim, 1),
+    Provider(Photon, 5),
+    Provider(IGNFrance, 5),
+    Provider(DataBC, 5),
+]
+
+
+class HedgedGeocoder:
+    """Geocodes places with several providers, hedging requests between them.
+
+    Every provider keeps one HTTP session and its own rate limit for the whole lifetime of the geocoder.
+    A lookup starts with the first provider and also asks the next one whenever the previous fails,
+    finds nothing, or doesn't answer within hedge_after seconds. The first place found wins and
+    the other requests are cancelled. At most concurrency lookups run at once.
+    A place is only reported as not found when every provider answered, otherwise the lookup fails.
+    """
+    def __init__(
+            self,
+            providers: list[Provider] | None = None,
+            concurrency: int = 8,
+            hedge_after: float = 2.0,
+            timeout: float = 10.0,
+            user_agent: str = "scht_lab_pw",
+            ) -> None:
+        """Configure the geocoder, sessions are opened when it's entered."""
+        self.providers = providers or DEFAULT_PROVIDERS
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.semaphore = Semaphore(concurrency)
+        self.buckets = [TokenBucket(provider.rate, provider.burst) for provider in self.providers]
+        self.geocoders: list[Geocoder] = []
+        self._stack = AsyncExitStack()
+
+    async def __aenter__(self) -> "HedgedGeocoder":
+        """Open provider sessions."""
+        for provider in self.providers:
+            geocoder = provider.geocoder(user_agent=self.user_agent, adapter_factory=AioHTTPAdapter, timeout=self.timeout, **provider.options)
+            self.geocoders.append(await self._stack.enter_async_context(geocoder)) # type: ignore
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Close provider sessions."""
+        await self._stack.aclose()
+        self.geocoders = []
+
+    async def _ask(self, index: int, name: str) -> GeoLocation | None:
+        await self.buckets[index].acquire()
+        return await cast(Awaitable[GeoLocation | None], self.geocoders[index].geocode(name, exactly_one=True))
+
+    async def geocode(self, name: str) -> GeoLocation | None:
+        """Get geolocation of a place, None if no provider found it.
+
+        If no provider found it but some failed, the error of the last one is raised instead.
+        """
+        async with self.semaphore:
+            tasks: set[Task[GeoLocation | None]] = set()
+            providers = iter(range(len(self.providers)))
+            error: Exception | None = None
+            try:
+                while True:
+                    index = next(providers, None)
+                    if index is not None:
+                        tasks.add(create_task(self._ask(index, name)))
+                    elif not tasks:
+                        if error is not None:
+                            raise error
+                        return None
+                    # wait for an answer, until it's time to ask the next provider as well
+                    done, tasks = await wait(tasks, timeout=self.hedge_after if index is not None else None, return_when=FIRST_COMPLETED)
+                    for task in done:
+                        try:
+                            result = task.result()
+                        except LOOKUP_ERRORS as e:
+                            error = e
+                            continue
+                        if result is not None:
+                            return result
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+async def get_geo(name: str) -> GeoLocation | None:
+    """Get geolocation by name of a place (e.g. city)."""
+    async with HedgedGeocoder() as geocoder:
+        return await geocoder.geocode(name)
+
+
+async def geocode_all(
+        names: Iterable[str],
+        store: GeoStore,
+        geocoder: HedgedGeocoder | None = None,
+        retry_missing: bool = False,
+        ) -> dict[str, Coordinates | None]:
+    """Get coordinates of many places, from the store where possible and geocoding the rest.
+
+    New results are written back to the store in one batch. Places no provider found are only
+    looked up again with retry_missing, while failed lookups (e.g. network errors) aren't stored
+    and are retried on the next call. Both get None. Without a geocoder a default one is used.
+    """
+    names = list(dict.fromkeys(names))
+    known = store.get_many(names)
+    missing = [name for name in names if name not in known or (retry_missing and known[name] is None)]
+    if missing:
+        async with AsyncExitStack() as stack:
+            if geocoder is None:
+                geocoder = await stack.enter_async_context(HedgedGeocoder())
+            lookup = geocoder.geocode
+
+            async def attempt(name: str) -> GeoLocation | None | Exception:
+                try:
+                    return await lookup(name)
+                except LOOKUP_ERRORS as e:
+                    return e
+
+            found = await gather_dict({name: attempt(name) for name in missing})
+        store.put_many({name: geo for name, geo in found.items() if not isinstance(geo, Exception)})
+        known.update({name: None if geo is None or isinstance(geo, Exception) else (geo.latitude, geo.longitude) for name, geo in found.items()})
+    return known
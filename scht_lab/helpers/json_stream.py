@@ -0,0 +1,145 @@
+"""Incremental parsing of JSON arrays and JSON lines as their text arrives, one item at a time."""
+import codecs
+import json
+import re
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from typing import Any
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\r\n"
+# what's left of a number cut off at the end of the text, e.g. "." of "12." or "e" of "1.5e"
+_number_tail = re.compile(r"[0-9.eE+-]*\Z")
+
+
+class ItemDecoder:
+    """Incremental decoder of JSON values separated by whitespace or commas, fed text as it arrives.
+
+    Used for items of an array (closing is "]") and for JSON lines (closing is None). Only text of
+    items not taken yet is kept. A number at the end of the text is held back until more arrives
+    or the text is final, as the next chunk could continue it.
+    """
+    def __init__(self, closing: str | None = None, line: int = 1) -> None:
+        """Start decoding, line being the line number of the first text fed."""
+        self.closing = closing
+        self.done = False
+        self._buffer = ""
+        self._position = 0
+        self._line = line # of buffer[0]
+        self._counted = (0, line) # (position, its line), so line numbers aren't counted from the start every time
+
+    def feed(self, text: str) -> None:
+        """Add text, dropping what was already decoded."""
+        if self._position:
+            self._line = self.line_at(self._position)
+            self._buffer = self._buffer[self._position:]
+            self._position = 0
+            self._counted = (0, self._line)
+        self._buffer += text
+
+    def line_at(self, position: int) -> int:
+        """Line number of a position in the current text (positions must not go back)."""
+        counted, line = self._counted
+        line += self._buffer.count("\n", counted, position)
+        self._counted = (position, line)
+        return line
+
+    def items(self, final: bool = False) -> Iterator[tuple[int, Any]]:
+        """Yield (line number, item) of every complete item fed so far.
+
+        With final the text is complete: an unfinished item or a missing closing character is an error.
+        """
+        buffer = self._buffer
+        while not self.done:
+            position = self._position
+            while position < len(buffer) and buffer[position] in _whitespace + ",":
+                position += 1
+            self._position = position
+            if position == len(buffer):
+                if final and self.closing:
+                    msg = f"Line {self.line_at(position)}: Unexpected end of JSON, missing {self.closing}"
+                    raise ValueError(msg)
+                return
+            if buffer[position] == self.closing:
+                self.done = True
+                self._position = position + 1
+                return
+            try:
+                item, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if not final:
+                    # most likely incomplete, wait for the rest
+                    return
+                msg = f"Line {self.line_at(position)}: {e.msg}"
+                raise ValueError(msg) from e
+            if not final and type(item) in (int, float) and _number_tail.match(buffer, end):
+                return
+            yield self.line_at(position), item
+            self._position = end
+
+
+def _array_start(buffer: str, marker: str, search: int) -> tuple[int | None, int]:
+    """Find where items of the first marker: [ start, as (position after "[" or None if more text is needed, where to search next)."""
+    while True:
+        found = buffer.find(marker, search)
+        if found == -1:
+            # the marker could be cut off at the end
+            return None, max(search, len(buffer) - len(marker))
+        colon = found + len(marker)
+        while colon < len(buffer) and buffer[colon] in _whitespace:
+            colon += 1
+        if colon == len(buffer):
+            return None, found
+        if buffer[colon] != ":":
+            # a string value, not the key
+            search = found + 1
+            continue
+        bracket = colon + 1
+        while bracket < len(buffer) and buffer[bracket] in _whitespace:
+            bracket += 1
+        if bracket == len(buffer):
+            return None, found
+        if buffer[bracket] != "[":
+            msg = f"Value of {marker} is not an array"
+            raise ValueError(msg)
+        return bracket + 1, found
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes], key: str) -> AsyncIterator[Any]:
+    """Yield items of the array under key in a JSON object one by one, as its chunks arrive.
+
+    Only the item being parsed is kept in memory, never the whole document.
+    Meant for responses like ONOS's {"flows": [...]}: the first "key": [ found is used.
+    """
+    text = codecs.getincrementaldecoder("utf-8")()
+    marker = json.dumps(key)
+    iterator = chunks.__aiter__()
+    buffer = ""
+    search = 0
+    final = False
+
+    async def more() -> str | None:
+        try:
+            return text.decode(await iterator.__anext__())
+        except StopAsyncIteration:
+            return None
+
+    while True:
+        start, search = _array_start(buffer, marker, search)
+        if start is not None:
+            break
+        chunk = await more()
+        if chunk is None:
+            msg = f"No {marker} array in JSON"
+            raise ValueError(msg)
+        buffer += chunk
+    decoder = ItemDecoder("]")
+    decoder.feed(buffer[start:])
+    while True:
+        for _, item in decoder.items(final):
+            yield item
+        if decoder.done or final:
+            return
+        chunk = await more()
+        if chunk is None:
+            chunk, final = text.decode(b"", final=True), True
+        decoder.feed(chunk)
@@ -1,12 +1,80 @@
+"""Reading items of JSON lines, JSON arrays and keyed JSON documents one at a time."""
+import json
 import re
+from collections.abc import Iterator
+from typing import Any, TextIO
 
-newline_after_comma_regex = re.compile(r",\W*\n", re.UNICODE)
-comma_regex = re.compile(r"}\s*,*\s*{", re.UNICODE)
-additional_newline_regex = re.compile(r"\n\n+", re.UNICODE)
-def jsonl_to_keyed(jsonl_file: str, key: str) -> str:
-    """Converts a JSONL file to a string with a dictionary keyed by the specified key."""
-    jsonl_file = jsonl_file.strip().strip("[]").replace("\n", "")
-    jsonl_file = newline_after_comma_regex.sub(",", jsonl_file)
-    jsonl_file = comma_regex.sub("}\n{", jsonl_file)
-    jsonl_file = additional_newline_regex.sub("\n", jsonl_file)
-    return f"{{\"{key}\": [{','.join(jsonl_file.splitlines())}]}}"
\ No newline at end of file
+from pydantic import TypeAdapter, ValidationError
+
+from scht_lab.helpers.json_stream import ItemDecoder
+from scht_lab.models.stream import Stream
+
+_whitespace = " \t\r\n"
+# how much of a document to look at before deciding it's not a keyed one
+_head_size = 4096
+_stream_adapter = TypeAdapter(Stream)
+
+
+def _keyed_regex(key: str) -> re.Pattern[str]:
+    return re.compile(r'\{\s*("\$schema"\s*:\s*"(?:[^"\\]|\\.)*"\s*,\s*)?' + re.escape(json.dumps(key)) + r"\s*:\s*\[", re.UNICODE)
+
+
+def iter_json_items(file: TextIO, key: str, chunk_size: int = 64*1024) -> Iterator[tuple[int, Any]]:
+    """Yield (line number, item) for every item of a JSONL file, a JSON array, or a {"key": [...]} document.
+
+    The file is read in chunks and items are parsed one at a time, so only a single item is kept in memory.
+    JSONL items may be separated by commas as well.
+    """
+    buffer = ""
+    eof = False
+
+    def more() -> bool:
+        nonlocal buffer, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        if decoder is None:
+            buffer += chunk
+        else:
+            decoder.feed(chunk)
+        return True
+
+    decoder: ItemDecoder | None = None
+    # detect the kind of document
+    while not eof and (not buffer.strip(_whitespace) or (buffer.lstrip(_whitespace)[0] == "{" and len(buffer) < _head_size)):
+        more()
+    position = len(buffer) - len(buffer.lstrip(_whitespace))
+    if position == len(buffer):
+        return
+    match = _keyed_regex(key).match(buffer, position)
+    if buffer[position] == "[":
+        closing: str | None = "]"
+        position += 1
+    elif match:
+        closing = "]"
+        position = match.end()
+    elif buffer[position] == "{":
+        closing = None
+    else:
+        msg = f"Line {1 + buffer.count(chr(10), 0, position)}: Expected JSON lines, an array or an object with {json.dumps(key)}"
+        raise ValueError(msg)
+
+    # anything after the closing bracket is ignored
+    decoder = ItemDecoder(closing, 1 + buffer.count("\n", 0, position))
+    decoder.feed(buffer[position:])
+    while True:
+        yield from decoder.items(eof)
+        if decoder.done or eof:
+            return
+        eof = not more()
+
+
+def iter_streams(file: TextIO) -> Iterator[Stream]:
+    """Lazily load and validate streams from JSONL, a JSON array or a {"streams": [...]} document."""
+    for line, item in iter_json_items(file, "streams"):
+        try:
+            yield _stream_adapter.validate_python(item)
+        except ValidationError as e:
+            msg = f"Line {line}: invalid stream: {e}"
+            raise ValueError(msg) from e
@@ -0,0 +1,6 @@
+"""Batching limits of ONOS requests, kept free of heavy imports so CLI option defaults can use them."""
+
+# flows per POST/DELETE request, ONOS handles large batches but very big bodies time out
+CHUNK_SIZE = 500
+# batch requests in flight at once, more only makes ONOS queue (or reject) them
+CONCURRENCY = 4
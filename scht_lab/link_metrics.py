@@ -0,0 +1,310 @@
+"""Columnar storage of per-link metrics for a topology."""
+from collections.abc import Callable, Sequence
+from math import inf
+from typing import TYPE_CHECKING, Literal
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from scht_lab.topo import Location
+
+
+Metric = Literal["distance", "delay", "jitter", "bandwidth", "loss", "utilization", "available"]
+DERIVED: tuple[Metric, ...] = ("delay", "jitter", "bandwidth", "loss")
+
+
+def delay(distance):
+    """Calculate delay from link distance (works on scalars and arrays)."""
+    return distance/200
+
+def jitter(distance):
+    """Calculate jitter (derivative of delay) from link distance (works on scalars and arrays)."""
+    with np.errstate(divide="ignore"):
+        return np.log(np.sqrt(distance/200))
+
+def bandwidth(distance, population_a, population_b, connectivity_a, connectivity_b, bw_override=np.nan):
+    """Calculate bandwidth of a link (works on scalars and arrays).
+
+    A ``bw_override`` that is NaN or 0 means no override.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed = np.maximum(
+            (
+                (population_a + population_b + 10*np.maximum(population_a, population_b)) / 9000000 -
+                distance / 3 +
+                (connectivity_a + connectivity_b) * 90
+            ),
+            (
+                np.minimum(population_a, population_b) / (population_a + population_b) * 100 +
+                distance / 12 -
+                (75/np.minimum(connectivity_a, connectivity_b))
+            ),
+        )
+    overridden = ~np.isnan(bw_override) & (bw_override != 0)
+    return np.where(overridden, bw_override, computed)
+
+def loss(distance, population_a, population_b):
+    """Calculate loss of a link (works on scalars and arrays)."""
+    return (
+        (population_a + population_b + np.maximum(population_a, population_b)) / 2000000000 +
+        distance / 1500000
+    )
+
+
+class Aggregate:
+    """Maximum, minimum and sum of a metric column.
+
+    Max and min are kept in a segment tree, so changing a single row costs O(log n).
+    NaN values are ignored.
+    """
+    def __init__(self, values: np.ndarray, capacity: int) -> None:
+        """Build the aggregate from current column values, with room for ``capacity`` rows."""
+        size = 1
+        while size < max(capacity, 1):
+            size *= 2
+        self._leaves = size
+        self._max = np.full(2*size, -inf)
+        self._min = np.full(2*size, inf)
+        self._max[size:size+len(values)] = values
+        self._min[size:size+len(values)] = values
+        lo, hi = size//2, size
+        while lo >= 1:
+            self._max[lo:hi] = np.fmax(self._max[2*lo:2*hi:2], self._max[2*lo+1:2*hi:2])
+            self._min[lo:hi] = np.fmin(self._min[2*lo:2*hi:2], self._min[2*lo+1:2*hi:2])
+            lo, hi = lo//2, lo
+        self.sum = float(np.nansum(values))
+        self.count = len(values)
+
+    @property
+    def capacity(self) -> int:
+        """Number of rows the aggregate can hold without being rebuilt."""
+        return self._leaves
+    @property
+    def max(self) -> float:
+        """Largest value in the column."""
+        return float(self._max[1])
+    @property
+    def min(self) -> float:
+        """Smallest value in the column."""
+        return float(self._min[1])
+    @property
+    def mean(self) -> float:
+        """Mean of the column."""
+        return self.sum/self.count if self.count else 0.0
+
+    def update(self, index: int, value: float) -> None:
+        """Set value of a single row (appending if it is the next one)."""
+        node = index + self._leaves
+        old = self._max[node]
+        if index >= self.count:
+            self.count = index + 1
+        elif not np.isnan(old) and old != -inf:
+            self.sum -= float(old)
+        if not np.isnan(value):
+            self.sum += float(value)
+        self._max[node] = value
+        self._min[node] = value
+        node //= 2
+        while node >= 1:
+            self._max[node] = np.fmax(self._max[2*node], self._max[2*node+1])
+            self._min[node] = np.fmin(self._min[2*node], self._min[2*node+1])
+            node //= 2
+
+
+class LinkMetrics:
+    """Per-topology metric store, with one row per link (edge id).
+
+    All columns are kept in growable NumPy arrays. Derived metrics (delay, jitter, bandwidth, loss)
+    depend on the population and connectivity of the endpoint locations, so they are computed for
+    all links in one vectorized pass after ``invalidate``, and row by row as links are added or changed.
+
+    ``version`` increases on every change, so anything derived from the metrics can check if it is stale,
+    and ``listeners`` are called with the id of every changed link.
+    """
+    def __init__(self, locations: Sequence["Location"], positions: dict["Location", int], capacity: int = 16) -> None:
+        """Initialize an empty store for links between the given locations."""
+        self.locations = locations
+        self.positions = positions
+        self.size = 0
+        self.version = 0
+        self._columns: dict[str, np.ndarray] = {
+            "distance": np.empty(capacity),
+            "bw_override": np.empty(capacity),
+            "utilization": np.empty(capacity),
+            **{name: np.empty(capacity) for name in DERIVED},
+        }
+        self._endpoints = np.empty((capacity, 2), dtype=np.intp)
+        self._dirty = False
+        self._aggregates: dict[Metric, Aggregate] = {}
+        self.listeners: list[Callable[[int | None], None]] = []
+
+    def _grow(self) -> None:
+        capacity = max(16, 2*len(self._endpoints))
+        self._endpoints = np.resize(np.asarray(self._endpoints), (capacity, 2))
+        for name, column in self._columns.items():
+            self._columns[name] = np.resize(np.asarray(column), capacity)
+
+    def append(
+            self,
+            locations: tuple["Location", "Location"],
+            distance: float,
+            bw_override: float | None = None,
+            utilization: float = 0,
+            ) -> int:
+        """Add a link to the store and return its edge id."""
+        if self.size == len(self._endpoints):
+            self._grow()
+        edge = self.size
+        self._endpoints[edge] = (self.positions[locations[0]], self.positions[locations[1]])
+        self._columns["distance"][edge] = distance
+        self._columns["bw_override"][edge] = np.nan if bw_override is None else bw_override
+        self._columns["utilization"][edge] = utilization
+        self.size += 1
+        self._update_row(edge)
+        return edge
+
+    def adopt(self, endpoints: np.ndarray, columns: dict[str, np.ndarray]) -> None:
+        """Fill an empty store with whole columns at once, without copying them.
+
+        ``columns`` must have distance, bw_override and utilization, derived metrics are recomputed if any of them is missing.
+        Arrays may be memory-mapped (copy-on-write), they are only replaced once the store needs to grow.
+        """
+        if self.size:
+            msg = "Only an empty metric store can adopt columns"
+            raise ValueError(msg)
+        self._endpoints = endpoints
+        self._columns = {name: columns[name] if name in columns else np.empty(len(endpoints)) for name in self._columns}
+        self.size = len(endpoints)
+        self._dirty = not all(name in columns for name in DERIVED)
+        self._aggregates = {}
+        self._changed(None)
+
+    def invalidate(self) -> None:
+        """Recompute all derived metrics and aggregates on next access.
+
+        Call this after changing population or connectivity of locations.
+        """
+        self._dirty = True
+        self._aggregates = {}
+        self._changed(None)
+
+    def _changed(self, edge: int | None) -> None:
+        """Bump version and tell listeners which link changed (None for all of them)."""
+        self.version += 1
+        for listener in self.listeners:
+            listener(edge)
+
+    def _compute(self) -> None:
+        """Recompute derived metrics of all links in one pass, if needed."""
+        if not self._dirty:
+            return
+        population = np.fromiter((location.population for location in self.locations), float, len(self.locations))
+        connectivity = np.fromiter((location.connectivity for location in self.locations), float, len(self.locations))
+        a, b = self.endpoints[:, 0], self.endpoints[:, 1]
+        distance = self.distance
+        rows = slice(0, self.size)
+        self._columns["delay"][rows] = delay(distance)
+        self._columns["jitter"][rows] = jitter(distance)
+        self._columns["bandwidth"][rows] = bandwidth(
+            distance, population[a], population[b], connectivity[a], connectivity[b], self.bw_override,
+        )
+        self._columns["loss"][rows] = loss(distance, population[a], population[b])
+        self._dirty = False
+
+    def _update_row(self, edge: int) -> None:
+        """Recompute derived metrics of a single link and update aggregates."""
+        self._changed(edge)
+        if self._dirty:
+            # everything is recomputed on next access anyway
+            return
+        a, b = (self.locations[i] for i in self._endpoints[edge])
+        distance = self._columns["distance"][edge]
+        self._columns["delay"][edge] = delay(distance)
+        self._columns["jitter"][edge] = jitter(distance)
+        self._columns["bandwidth"][edge] = bandwidth(
+            distance, a.population, b.population, a.connectivity, b.connectivity, self._columns["bw_override"][edge],
+        )
+        self._columns["loss"][edge] = loss(distance, a.population, b.population)
+        for name in list(self._aggregates):
+            self._update_aggregate(name, edge)
+
+    def _update_aggregate(self, name: Metric, edge: int) -> None:
+        aggregate = self._aggregates.get(name)
+        if aggregate is None:
+            return
+        if edge >= aggregate.capacity:
+            # rebuilt lazily with more room
+            del self._aggregates[name]
+            return
+        aggregate.update(edge, self._column(name)[edge])
+
+    def _column(self, name: Metric) -> np.ndarray:
+        if name == "available":
+            return self._columns["bandwidth"][:self.size] - self._columns["utilization"][:self.size]
+        return self._columns[name][:self.size]
+
+    def aggregate(self, name: Metric) -> Aggregate:
+        """Get max/min/sum of a metric over all links, maintained incrementally."""
+        self._compute()
+        aggregate = self._aggregates.get(name)
+        if aggregate is None:
+            aggregate = self._aggregates[name] = Aggregate(self._column(name), len(self._endpoints))
+        return aggregate
+
+    @property
+    def endpoints(self) -> np.ndarray:
+        """Positions (in the topology location list) of both ends of every link."""
+        return self._endpoints[:self.size]
+    @property
+    def distance(self) -> np.ndarray:
+        """Distance of every link."""
+        return self._columns["distance"][:self.size]
+    @property
+    def bw_override(self) -> np.ndarray:
+        """Bandwidth override of every link (NaN if not set)."""
+        return self._columns["bw_override"][:self.size]
+    @property
+    def utilization(self) -> np.ndarray:
+        """Current utilization of every link."""
+        return self._columns["utilization"][:self.size]
+    @property
+    def delay(self) -> np.ndarray:
+        """Delay of every link."""
+        self._compute()
+        return self._columns["delay"][:self.size]
+    @property
+    def jitter(self) -> np.ndarray:
+        """Jitter of every link."""
+        self._compute()
+        return self._columns["jitter"][:self.size]
+    @property
+    def bandwidth(self) -> np.ndarray:
+        """Bandwidth of every link."""
+        self._compute()
+        return self._columns["bandwidth"][:self.size]
+    @property
+    def loss(self) -> np.ndarray:
+        """Loss of every link."""
+        self._compute()
+        return self._columns["loss"][:self.size]
+    @property
+    def available(self) -> np.ndarray:
+        """Bandwidth left on every link after current utilization."""
+        self._compute()
+        return self._column("available")
+
+    def set_distance(self, edge: int, value: float) -> None:
+        """Set distance of a link."""
+        self._columns["distance"][edge] = value
+        self._update_row(edge)
+    def set_bw_override(self, edge: int, value: float | None) -> None:
+        """Set bandwidth override of a link."""
+        self._columns["bw_override"][edge] = np.nan if value is None else value
+        self._update_row(edge)
+    def set_utilization(self, edge: int, value: float) -> None:
+        """Set utilization of a link."""
+        self._columns["utilization"][edge] = value
+        self._changed(edge)
+        if not self._dirty:
+            self._update_aggregate("utilization", edge)
+            self._update_aggregate("available", edge)
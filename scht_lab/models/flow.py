@@ -1,9 +1,14 @@
 """Model of a single ONOS flow."""
 # ruff: noqa: D101
 
+import json
+from collections.abc import Hashable, Iterable, Mapping
+from ipaddress import IPv4Interface, IPv6Interface
+from typing import Any
+
 from typing_extensions import Literal, TypedDict, Union, final
 
-from pydantic import BaseModel, Field
+from pydantic import AliasPath, BaseModel, Field
 
 
 @final
@@ -97,6 +102,12 @@ class L2ModificationMPLSPUSHInstruction(TypedDict):
     subtype: Literal["MPLS_PUSH"]
     ethernetType: int
 
+@final
+class L2ModificationMPLSPOPInstruction(TypedDict):
+    type: Literal["L2MODIFICATION"]
+    subtype: Literal["MPLS_POP"]
+    ethernetType: int
+
 @final
 class L2ModificationTUNNELIDInstruction(TypedDict):
     type: Literal["L2MODIFICATION"]
@@ -161,6 +172,7 @@ Instruction = Union[
     L2ModificationETHDSTInstruction, 
     L2ModificationMPLSLABELInstruction, 
     L2ModificationMPLSPUSHInstruction, 
+    L2ModificationMPLSPOPInstruction,
     L2ModificationTUNNELIDInstruction, 
     L3ModificationIPV4SRCInstruction, 
     L3ModificationIPV4DSTInstruction, 
@@ -459,3 +471,156 @@ class Flow(BaseModel):
         ))
     def __getitem__(self, key):
         return getattr(self, key)
+
+
+# (key, value) pairs of a single criterion or instruction, in order
+Rule = tuple[tuple[str, Any], ...]
+
+
+class FlowRecord:
+    """Compact immutable flow used while generating paths, hashed once on creation.
+
+    Criteria and instructions are tuples of (key, value) pairs in ONOS JSON form.
+    Convert to a validated Flow only at the edges, e.g. with to_model.
+    """
+    __slots__ = ("device_id", "priority", "criteria", "instructions", "timeout", "permanent", "_hash")
+
+    def __init__(
+            self,
+            device_id: str,
+            priority: int,
+            criteria: tuple[Rule, ...],
+            instructions: tuple[Rule, ...],
+            timeout: int = 0,
+            permanent: bool = True,
+            ) -> None:
+        """Create a flow record."""
+        self.device_id = device_id
+        self.priority = priority
+        self.criteria = criteria
+        self.instructions = instructions
+        self.timeout = timeout
+        self.permanent = permanent
+        self._hash = hash((device_id, priority, criteria, instructions, timeout, permanent))
+
+    def __hash__(self) -> int:
+        """Get the precomputed hash."""
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        """Compare all fields."""
+        if not isinstance(other, FlowRecord):
+            return NotImplemented
+        return self._hash == other._hash and (
+            self.device_id, self.priority, self.criteria, self.instructions, self.timeout, self.permanent,
+        ) == (
+            other.device_id, other.priority, other.criteria, other.instructions, other.timeout, other.permanent,
+        )
+
+    def __repr__(self) -> str:
+        """Show the flow as its ONOS JSON."""
+        return f"FlowRecord({self.to_json()})"
+
+    @classmethod
+    def from_model(cls, flow: "Flow") -> "FlowRecord":
+        """Convert a validated flow."""
+        return cls(
+            flow.deviceId,
+            flow.priority,
+            tuple(tuple(criterion.items()) for criterion in flow.selector.criteria),
+            tuple(tuple(instruction.items()) for instruction in flow.treatment.instructions),
+            flow.timeout,
+            flow.isPermanent,
+        )
+
+    def to_model(self) -> "Flow":
+        """Validate into a Flow model."""
+        return Flow.model_validate(self.to_onos())
+
+    def to_onos(self) -> dict[str, Any]:
+        """Get the flow as ONOS JSON data."""
+        return {
+            "deviceId": self.device_id,
+            "priority": self.priority,
+            "timeout": self.timeout,
+            "isPermanent": self.permanent,
+            "treatment": {"instructions": [dict(instruction) for instruction in self.instructions]},
+            "selector": {"criteria": [dict(criterion) for criterion in self.criteria]},
+        }
+
+    def to_json(self) -> str:
+        """Serialize straight to ONOS JSON, without building intermediate dicts."""
+        return (
+            f'{{"deviceId":{json.dumps(self.device_id)},"priority":{self.priority},"timeout":{self.timeout},'
+            f'"isPermanent":{"true" if self.permanent else "false"},'
+            f'"treatment":{{"instructions":[{_rules_json(self.instructions)}]}},'
+            f'"selector":{{"criteria":[{_rules_json(self.criteria)}]}}}}'
+        )
+
+
+def eth_type_criterion(ip: IPv4Interface | IPv6Interface) -> Rule:
+    """Match IP packets of the same version as an address."""
+    return (("type", "ETH_TYPE"), ("ethType", "0x800" if ip.version == 4 else "0x86dd"))
+
+def ip_criterion(ip: IPv4Interface | IPv6Interface, direction: Literal["SRC", "DST"]) -> Rule:
+    """Match a single host address as source or destination."""
+    return (("type", f"IPV{ip.version}_{direction}"), ("ip", f"{ip.ip}/{ip.max_prefixlen}"))
+
+
+def _rules_json(rules: tuple[Rule, ...]) -> str:
+    return ",".join("{" + ",".join(f'"{key}":{json.dumps(value)}' for key, value in rule) + "}" for rule in rules)
+
+
+def dump_flows(flows: "Iterable[FlowRecord | Flow]") -> bytes:
+    """Serialize flows to an ONOS {"flows": [...]} request body."""
+    records = (flow if isinstance(flow, FlowRecord) else FlowRecord.from_model(flow) for flow in flows)
+    return ('{"flows":[' + ",".join(record.to_json() for record in records) + "]}").encode()
+
+
+class FlowEntry(BaseModel):
+    """Flow installed in ONOS as listed by the API, with criteria and instructions kept as plain dicts."""
+    id: str
+    deviceId: str
+    appId: str = ""
+    priority: int
+    state: str = ""
+    timeout: int = 0
+    isPermanent: bool = False
+    criteria: list[dict[str, Any]] = Field(default_factory=list, validation_alias=AliasPath("selector", "criteria"))
+    instructions: list[dict[str, Any]] = Field(default_factory=list, validation_alias=AliasPath("treatment", "instructions"))
+
+
+# EtherTypes are sent as numbers or hex strings and ONOS lists them as hex ("0x8847"), so they're compared as numbers
+_ETHERTYPE_KEYS = frozenset({"ethType", "ethernetType"})
+
+def _canonical_ethertype(value: Any) -> Hashable:
+    try:
+        return str(int(value, 0) if isinstance(value, str) else int(value))
+    except (TypeError, ValueError):
+        return str(value).lower()
+
+def _canonical_value(value: Any) -> Hashable:
+    if isinstance(value, Mapping):
+        return tuple(sorted(
+            (key, _canonical_ethertype(item) if key in _ETHERTYPE_KEYS else _canonical_value(item)) for key, item in value.items()
+        ))
+    if isinstance(value, list):
+        return tuple(_canonical_value(item) for item in value)
+    return str(value).lower()
+
+def flow_key(flow: "Flow | FlowRecord | Mapping[str, Any]") -> Hashable:
+    """Get a key identifying what a flow does (deviceId, priority, selector, treatment), ignoring ONOS bookkeeping.
+
+    Works for Flow models and for raw flows as returned by ONOS, so they can be matched against each other.
+    Criteria are compared regardless of order, instructions in order.
+    """
+    if isinstance(flow, Flow):
+        flow = flow.model_dump(exclude_unset=True, mode="json")
+    elif isinstance(flow, FlowRecord):
+        flow = flow.to_onos()
+    return (
+        flow["deviceId"],
+        int(flow["priority"]),
+        tuple(sorted(_canonical_value(criterion) for criterion in flow.get("selector", {}).get("criteria", []))), # type: ignore
+        tuple(_canonical_value(instruction) for instruction in flow.get("treatment", {}).get("instructions", [])),
+    )
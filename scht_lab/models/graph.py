@@ -0,0 +1,12 @@
+"""Options for drawing topology graphs."""
+from enum import Enum
+
+
+class GraphMethod(str, Enum):
+    """Which layout method to use for drawing a graph."""
+    CIRCO = "circo"
+    DOT = "dot"
+    FDP = "fdp"
+    NEATO = "neato"
+    OSAGE = "osage"
+    SFDP = "sfdp"
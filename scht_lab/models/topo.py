@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, RootModel
 
 
@@ -5,6 +7,9 @@ class Location(BaseModel):
     population: int
     connectivity: int
     neighbors: dict[str, int]
+    bw_overrides: Optional[dict[str, float]] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
 
 class Topology(RootModel):
     root: dict[str, Location]
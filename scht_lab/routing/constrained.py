@@ -0,0 +1,159 @@
+"""Cheapest path meeting end-to-end delay, jitter and loss bounds (label-setting with dominance pruning)."""
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from itertools import count
+from math import inf, log1p
+
+import numpy as np
+
+from scht_lab.routing.graph import CSRGraph, dijkstra
+
+
+@dataclass(slots=True)
+class Bounds:
+    """End-to-end bounds of a path, None means unbounded.
+
+    ``rate`` is only set for UDP streams, which get extra loss when the path bandwidth is below their rate.
+    """
+    delay: float | None = None
+    jitter: float | None = None
+    loss: float | None = None
+    rate: float | None = None
+
+
+@dataclass(slots=True)
+class _Label:
+    cost: float
+    delay: float
+    jitter: float
+    neglog_success: float
+    bandwidth: float
+    node: int
+    edge: int
+    parent: "_Label | None"
+    alive: bool = True
+
+    def dominates(self, other: "_Label") -> bool:
+        return (
+            self.cost <= other.cost and self.delay <= other.delay and self.jitter <= other.jitter and
+            self.neglog_success <= other.neglog_success and self.bandwidth >= other.bandwidth
+        )
+
+    def visits(self, node: int) -> bool:
+        label: _Label | None = self
+        while label is not None:
+            if label.node == node:
+                return True
+            label = label.parent
+        return False
+
+
+def path_loss(neglog_success: float, bandwidth: float, rate: float | None) -> float:
+    """Loss of a path from its summed -log(1-loss) and bottleneck bandwidth (same as paths find computes it)."""
+    loss = -np.expm1(-neglog_success)
+    if rate and bandwidth < rate:
+        loss += (rate - bandwidth)/rate
+    return float(loss)
+
+
+def constrained_shortest_path(
+        graph: CSRGraph,
+        weights: np.ndarray,
+        delay: np.ndarray,
+        jitter: np.ndarray,
+        loss: np.ndarray,
+        bandwidth: np.ndarray,
+        source: int,
+        target: int,
+        bounds: Bounds,
+        max_labels: int = 200000,
+        ) -> tuple[float, list[int], list[int]] | None:
+    """Find the cheapest source-target path meeting all bounds, as (cost, nodes, edges).
+
+    Labels are expanded in order of cost plus a lower bound of the remaining cost, and partial paths
+    are pruned when they're dominated by another path to the same node, or when even the best possible
+    rest of the path would break a bound. The result is optimal as long as costs are non-negative.
+    Returns None if no path meets the bounds or more than max_labels labels would be needed.
+    """
+    costs: list[float] = weights.tolist()
+    delays: list[float] = delay.tolist()
+    jitters: list[float] = jitter.tolist()
+    with np.errstate(divide="ignore"):
+        neglogs: list[float] = (-np.log1p(-loss)).tolist()
+    bandwidths: list[float] = bandwidth.tolist()
+    # bottleneck bandwidth only matters for extra UDP loss
+    track_bandwidth = bool(bounds.rate and bounds.loss is not None)
+
+    # lower bounds of the rest of the path (graph is undirected, so distances from target work)
+    nonnegative_costs = bool(np.all(weights >= 0))
+    nonnegative_jitter = bool(np.all(jitter >= 0))
+    remaining_cost = dijkstra(graph, costs, target)[0] if nonnegative_costs else [0.0] * graph.node_count
+    remaining_delay = dijkstra(graph, delays, target)[0] if bounds.delay is not None else None
+    remaining_jitter = dijkstra(graph, jitters, target)[0] if bounds.jitter is not None and nonnegative_jitter else None
+    remaining_neglog = dijkstra(graph, neglogs, target)[0] if bounds.loss is not None else None
+    max_neglog = -log1p(-bounds.loss) if bounds.loss is not None and bounds.loss < 1 else inf
+
+    labels: list[list[_Label]] = [[] for _ in range(graph.node_count)]
+    start = _Label(0.0, 0.0, 0.0, 0.0, inf, source, -1, None)
+    labels[source].append(start)
+    queue: list[tuple[float, int, _Label]] = [(remaining_cost[source], 0, start)]
+    tiebreak = count(1)
+    created = 1
+    while queue:
+        _, _, label = heappop(queue)
+        if not label.alive:
+            continue
+        if label.node == target:
+            if (bounds.jitter is None or label.jitter <= bounds.jitter) and (
+                    bounds.loss is None or
+                    path_loss(label.neglog_success, label.bandwidth, bounds.rate if track_bandwidth else None) <= bounds.loss
+                    ):
+                return label.cost, *_trace(label)
+            continue
+        for neighbor, edge in graph.neighbors(label.node):
+            cost = label.cost + costs[edge]
+            if cost == inf or remaining_cost[neighbor] == inf:
+                continue
+            new = _Label(
+                cost,
+                label.delay + delays[edge],
+                label.jitter + jitters[edge],
+                label.neglog_success + neglogs[edge],
+                min(label.bandwidth, bandwidths[edge]) if track_bandwidth else inf,
+                neighbor, edge, label,
+            )
+            if remaining_delay is not None and new.delay + remaining_delay[neighbor] > bounds.delay: # type: ignore
+                continue
+            if remaining_jitter is not None and new.jitter + remaining_jitter[neighbor] > bounds.jitter: # type: ignore
+                continue
+            if remaining_neglog is not None and new.neglog_success + remaining_neglog[neighbor] > max_neglog:
+                continue
+            if not nonnegative_jitter and label.visits(neighbor):
+                # with negative jitter loops aren't always dominated
+                continue
+            existing = labels[neighbor]
+            if any(other.dominates(new) for other in existing):
+                continue
+            for other in existing:
+                if new.dominates(other):
+                    other.alive = False
+            labels[neighbor] = [other for other in existing if other.alive]
+            labels[neighbor].append(new)
+            created += 1
+            if created > max_labels:
+                return None
+            heappush(queue, (cost + remaining_cost[neighbor], next(tiebreak), new))
+    return None
+
+
+def _trace(label: _Label) -> tuple[list[int], list[int]]:
+    nodes, edges = [], []
+    current: _Label | None = label
+    while current is not None:
+        nodes.append(current.node)
+        if current.edge != -1:
+            edges.append(current.edge)
+        current = current.parent
+    nodes.reverse()
+    edges.reverse()
+    return nodes, edges
@@ -0,0 +1,244 @@
+"""Contraction hierarchy index for fast repeated point-to-point queries with fixed link costs."""
+from hashlib import sha1
+from heapq import heappop, heappush
+from math import inf
+from pathlib import Path
+
+import numpy as np
+from typer import get_app_dir
+
+from scht_lab.routing.graph import CSRGraph
+from scht_lab.topo import Topology
+
+# (cost, middle node of a shortcut or -1, link id of an original edge or -1)
+Shortcut = tuple[float, int, int]
+
+WITNESS_SETTLE_LIMIT = 64
+# how many indexes to keep on disk, least recently used ones are removed first
+INDEX_LIMIT = 8
+
+
+def index_dir() -> Path:
+    """Directory where preprocessed indexes are stored, next to the default topology."""
+    return Path(get_app_dir("scht_lab")) / "index"
+
+
+def prune_indexes(directory: Path, keep: int = INDEX_LIMIT) -> None:
+    """Remove all but the most recently used stored indexes."""
+    if not directory.is_dir():
+        return
+    indexes = sorted(directory.glob("ch-*.npz"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in indexes[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def weights_digest(graph: CSRGraph, weights: np.ndarray) -> str:
+    """Identify a graph with a set of link costs, so indexes can be reused across runs."""
+    digest = sha1(np.ascontiguousarray(graph.endpoints).tobytes(), usedforsecurity=False)
+    digest.update(np.ascontiguousarray(weights, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+class ContractionHierarchy:
+    """Contraction hierarchy over an undirected graph with finite, non-negative link costs.
+
+    Nodes are contracted one by one (least edge difference first), adding shortcuts wherever a local
+    witness search doesn't find a path avoiding the contracted node. Queries then only relax edges
+    towards higher ranked nodes from both ends, which settles a tiny fraction of the graph.
+    """
+    def __init__(self, rank: np.ndarray, upward: list[dict[int, Shortcut]]) -> None:
+        """Wrap a finished hierarchy (use build or load to create one)."""
+        self.rank = rank
+        self.upward = upward
+
+    @classmethod
+    def build(cls, graph: CSRGraph, weights: np.ndarray) -> "ContractionHierarchy":
+        """Preprocess a graph."""
+        costs: list[float] = weights.tolist()
+        n = graph.node_count
+        adjacency: list[dict[int, Shortcut]] = [{} for _ in range(n)]
+        for edge, (a, b) in enumerate(graph.endpoints.tolist()):
+            cost = costs[edge]
+            if a == b or cost == inf:
+                continue
+            if b not in adjacency[a] or cost < adjacency[a][b][0]:
+                adjacency[a][b] = adjacency[b][a] = (cost, -1, edge)
+
+        deleted_neighbors = [0] * n
+        level = [0] * n
+
+        def shortcuts(node: int) -> list[tuple[int, int, float]]:
+            neighbors = [(other, record[0]) for other, record in adjacency[node].items()]
+            needed = []
+            for i, (u, to_u) in enumerate(neighbors[:-1]):
+                rest = neighbors[i+1:]
+                limit = to_u + max(cost for _, cost in rest)
+                reached = _witness_search(adjacency, u, node, limit)
+                for x, to_x in rest:
+                    if reached.get(x, inf) > to_u + to_x:
+                        needed.append((u, x, to_u + to_x))
+            return needed
+
+        def priority(node: int) -> int:
+            return len(shortcuts(node)) - len(adjacency[node]) + deleted_neighbors[node] + level[node]
+
+        queue = [(priority(node), node) for node in range(n)]
+        queue.sort()
+        rank = np.zeros(n, dtype=np.intp)
+        upward: list[dict[int, Shortcut]] = [{} for _ in range(n)]
+        order = 0
+        while queue:
+            _, node = heappop(queue)
+            # lazy update - contract only if it's still the best candidate
+            current = priority(node)
+            if queue and current > queue[0][0]:
+                heappush(queue, (current, node))
+                continue
+            for u, x, cost in shortcuts(node):
+                if x not in adjacency[u] or cost < adjacency[u][x][0]:
+                    adjacency[u][x] = adjacency[x][u] = (cost, node, -1)
+            upward[node] = adjacency[node]
+            for other in adjacency[node]:
+                del adjacency[other][node]
+                deleted_neighbors[other] += 1
+                level[other] = max(level[other], level[node] + 1)
+            adjacency[node] = {}
+            rank[node] = order
+            order += 1
+        return cls(rank, upward)
+
+    def query(self, source: int, target: int) -> tuple[float, list[int], list[int]] | None:
+        """Find the cheapest path as (cost, nodes, link ids), None if target is unreachable."""
+        if source == target:
+            return 0.0, [source], []
+        dist = ({source: 0.0}, {target: 0.0})
+        parent: tuple[dict[int, int], dict[int, int]] = ({}, {})
+        queues = ([(0.0, source)], [(0.0, target)])
+        settled: tuple[set[int], set[int]] = (set(), set())
+        best, meeting = inf, -1
+        while queues[0] or queues[1]:
+            for side in (0, 1):
+                queue = queues[side]
+                if not queue:
+                    continue
+                if queue[0][0] >= best:
+                    queue.clear()
+                    continue
+                d, node = heappop(queue)
+                if node in settled[side]:
+                    continue
+                settled[side].add(node)
+                other = dist[1-side].get(node)
+                if other is not None and d + other < best:
+                    best, meeting = d + other, node
+                for neighbor, (cost, _, _) in self.upward[node].items():
+                    candidate = d + cost
+                    if candidate < dist[side].get(neighbor, inf):
+                        dist[side][neighbor] = candidate
+                        parent[side][neighbor] = node
+                        heappush(queue, (candidate, neighbor))
+        if meeting == -1:
+            return None
+        nodes = [meeting]
+        while nodes[-1] != source:
+            nodes.append(parent[0][nodes[-1]])
+        nodes.reverse()
+        while nodes[-1] != target:
+            nodes.append(parent[1][nodes[-1]])
+        full_nodes, edges = [source], []
+        for a, b in zip(nodes, nodes[1:]):
+            self._unpack(a, b, full_nodes, edges)
+        return best, full_nodes, edges
+
+    def _record(self, a: int, b: int) -> Shortcut:
+        return self.upward[a][b] if self.rank[a] < self.rank[b] else self.upward[b][a]
+
+    def _unpack(self, a: int, b: int, nodes: list[int], edges: list[int]) -> None:
+        _, middle, edge = self._record(a, b)
+        if middle == -1:
+            nodes.append(b)
+            edges.append(edge)
+            return
+        self._unpack(a, middle, nodes, edges)
+        self._unpack(middle, b, nodes, edges)
+
+    def save(self, path: Path) -> None:
+        """Write the hierarchy to an .npz file."""
+        counts = [len(edges) for edges in self.upward]
+        records = [(target, *record) for edges in self.upward for target, record in edges.items()]
+        table = np.array(records, dtype=float).reshape(-1, 4)
+        np.savez(
+            path,
+            rank=self.rank,
+            indptr=np.concatenate(([0], np.cumsum(counts))).astype(np.intp),
+            targets=table[:, 0].astype(np.intp),
+            costs=table[:, 1],
+            middles=table[:, 2].astype(np.intp),
+            edges=table[:, 3].astype(np.intp),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "ContractionHierarchy":
+        """Read a hierarchy written by save."""
+        with np.load(path) as data:
+            indptr = data["indptr"].tolist()
+            targets = data["targets"].tolist()
+            costs = data["costs"].tolist()
+            middles = data["middles"].tolist()
+            edges = data["edges"].tolist()
+            upward = [
+                {targets[i]: (costs[i], middles[i], edges[i]) for i in range(start, end)}
+                for start, end in zip(indptr, indptr[1:])
+            ]
+            return cls(data["rank"], upward)
+
+
+def _witness_search(adjacency: list[dict[int, Shortcut]], source: int, avoid: int, limit: float) -> dict[int, float]:
+    """Bounded Dijkstra from source that doesn't pass through avoid."""
+    dist = {source: 0.0}
+    queue = [(0.0, source)]
+    settled = 0
+    while queue and settled < WITNESS_SETTLE_LIMIT:
+        d, node = heappop(queue)
+        if d > limit:
+            break
+        if d > dist[node]:
+            continue
+        settled += 1
+        for neighbor, (cost, _, _) in adjacency[node].items():
+            if neighbor == avoid:
+                continue
+            candidate = d + cost
+            if candidate < dist.get(neighbor, inf):
+                dist[neighbor] = candidate
+                heappush(queue, (candidate, neighbor))
+    return dist
+
+
+def contraction_hierarchy(topo: Topology, graph: CSRGraph, weights: np.ndarray, directory: Path | None = None) -> ContractionHierarchy:
+    """Get contraction hierarchy for a set of link costs.
+
+    Kept in memory per topology and stored in the index directory, so it's only rebuilt when
+    the topology or the costs actually change. Only the INDEX_LIMIT most recently used indexes
+    are kept on disk. Building one takes much longer than a single search, so it only pays off
+    for many queries with the same costs - costs that follow utilization rarely are.
+    """
+    digest = weights_digest(graph, weights)
+    def build() -> ContractionHierarchy:
+        path = (directory or index_dir()) / f"ch-{digest}.npz"
+        if path.exists():
+            try:
+                hierarchy = ContractionHierarchy.load(path)
+                path.touch()
+                return hierarchy
+            except (OSError, ValueError, KeyError):
+                pass
+        hierarchy = ContractionHierarchy.build(graph, weights)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            hierarchy.save(path)
+            prune_indexes(path.parent)
+        except OSError:
+            pass # the index is only an optimization
+        return hierarchy
+    return topo.derived(("ch", digest), build, structural=True)
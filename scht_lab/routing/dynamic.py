@@ -0,0 +1,207 @@
+"""Incremental re-routing of admitted streams as link costs change."""
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field
+from typing import cast
+
+import numpy as np
+
+from scht_lab.cost_calc import compile_weights, edge_weights
+from scht_lab.models.stream import Priorities, Requirements, StreamType
+from scht_lab.routing.graph import ShortestPathTree, csr_graph
+from scht_lab.topo import Link, Location, Topology
+
+# decides if a stream may be moved to a new path, asked while the stream still occupies its current one
+Acceptor = Callable[[Hashable, list[Location], list[Link]], bool]
+# relative difference of path costs below which paths count as equally cheap
+TOLERANCE = 1e-9
+
+
+@dataclass
+class RoutedStream:
+    """Stream admitted to the topology, with the shortest path tree from its source (costs without its own load)."""
+    key: Hashable
+    source: int
+    target: int
+    priorities: Priorities | None
+    requirements: Requirements | None
+    stream_type: StreamType | None
+    rate: int
+    nodes: list[int] = field(default_factory=list)
+    edges: list[int] = field(default_factory=list)
+    loads: list[float] = field(default_factory=list)
+    # cost of the current path under the tree's costs
+    cost: float = 0.0
+    tree: ShortestPathTree | None = None
+    # topology-wide maxima link costs are normalized by when the tree was built
+    scale: tuple[float, ...] = ()
+    # edges of the last path the acceptor turned down and their costs then, it's not offered again until those change
+    rejected: tuple[tuple[int, ...], tuple[float, ...]] | None = None
+
+
+def cheaper(cost: float, than: float) -> bool:
+    """Check if a cost is lower than another by more than rounding errors of summing it differently."""
+    return cost < than - TOLERANCE*max(1.0, abs(than))
+
+
+class DynamicRouter:
+    """Keeps admitted streams on their cheapest paths as link utilization changes.
+
+    The router records which streams use which links and listens to topology changes. Every stream keeps a
+    shortest path tree from its source, which is only repaired for links whose cost changed since (their
+    costs are compiled alone, not for the whole topology). A stream is re-routed on ``update`` only if its
+    tree shows a path cheaper than the current one. Moving a stream shifts its utilization, which can affect
+    others in turn, so updates repeat until nothing moves or ``max_rounds`` runs out. A path the acceptor
+    rejects changes nothing and is only offered again once the costs of its links change.
+    """
+    def __init__(self, topo: Topology, accept: Acceptor | None = None, max_rounds: int = 10) -> None:
+        """Start tracking streams on a topology."""
+        self.topo = topo
+        self.accept = accept
+        self.max_rounds = max_rounds
+        self.streams: dict[Hashable, RoutedStream] = {}
+        self.link_streams: dict[int, set[Hashable]] = {}
+        self._pending: set[int] = set()
+        self._everything_changed = False
+        topo.subscribe(self._changed)
+
+    def close(self) -> None:
+        """Stop listening to topology changes."""
+        self.topo.unsubscribe(self._changed)
+
+    def _changed(self, edge: int | None) -> None:
+        if edge is None:
+            self._everything_changed = True
+        else:
+            self._pending.add(edge)
+
+    def add(
+            self,
+            key: Hashable,
+            path: list[Location],
+            priorities: Priorities | None,
+            requirements: Requirements | None,
+            stream_type: StreamType | None = None,
+            rate: int = 0,
+            ) -> None:
+        """Admit a stream on a path (found by any search), adding its rate to the links' utilization."""
+        nodes = [self.topo.position(location) for location in path]
+        edges = [self._link(a, b).id for a, b in zip(path, path[1:])]
+        stream = RoutedStream(
+            key, nodes[0], nodes[-1],
+            priorities.model_copy() if priorities else None,
+            requirements.model_copy() if requirements else None,
+            stream_type, rate,
+        )
+        self._occupy(stream, nodes, edges) # type: ignore
+        self._refresh(stream, None)
+        self.streams[key] = stream
+
+    def remove(self, key: Hashable) -> None:
+        """Remove a stream, releasing its utilization."""
+        stream = self.streams.pop(key)
+        self._release(stream)
+
+    def path(self, key: Hashable) -> list[Location]:
+        """Current path of a stream."""
+        return [self.topo.locations[i] for i in self.streams[key].nodes]
+
+    def paths(self) -> dict[Hashable, list[Location]]:
+        """Current paths of all streams."""
+        return {key: self.path(key) for key in self.streams}
+
+    def update(self) -> set[Hashable]:
+        """Re-route streams affected by changes since last update, returning keys of streams that moved."""
+        moved: set[Hashable] = set()
+        for _ in range(self.max_rounds):
+            if not self._pending and not self._everything_changed:
+                break
+            changed = None if self._everything_changed else set(self._pending)
+            self._pending.clear()
+            self._everything_changed = False
+            for stream in self.streams.values():
+                self._refresh(stream, changed)
+            affected = [
+                stream for stream in self.streams.values()
+                if cheaper(cast(ShortestPathTree, stream.tree).dist[stream.target], stream.cost)
+            ]
+            for stream in affected:
+                if self._reroute(stream):
+                    moved.add(stream.key)
+        return moved
+
+    def _refresh(self, stream: RoutedStream, edges: set[int] | None) -> None:
+        """Bring the stream's tree up to date with current costs of the given links (None for all of them)."""
+        topo = self.topo
+        scale = (topo.max_delay, topo.max_jitter, topo.max_bandwidth, topo.max_loss)
+        graph = csr_graph(topo)
+        if stream.tree is None or edges is None or scale != stream.scale or stream.tree.graph is not graph:
+            costs: list[float] = compile_weights(
+                topo, stream.priorities, stream.requirements, stream.stream_type, stream.rate,
+            ).tolist()
+            for edge, cost in zip(stream.edges, self._costs(stream, stream.edges), strict=True):
+                costs[edge] = cost
+            stream.tree = ShortestPathTree(graph, costs, stream.source)
+            stream.scale = scale
+        elif edges:
+            changed = sorted(edges)
+            stream.tree.update(dict(zip(changed, self._costs(stream, changed), strict=True)))
+        tree_costs = stream.tree.costs
+        stream.cost = sum(tree_costs[edge] for edge in stream.edges)
+
+    def _costs(self, stream: RoutedStream, edges: list[int]) -> list[float]:
+        """Costs of some links as the stream sees them, without its own load (so it doesn't run away from itself)."""
+        if not edges:
+            return []
+        own = dict(zip(stream.edges, stream.loads, strict=True))
+        utilization = np.maximum(0.0, self.topo.metrics.utilization[edges] - np.array([own.get(edge, 0.0) for edge in edges]))
+        return edge_weights(
+            self.topo, edges, stream.priorities, stream.requirements, stream.stream_type, stream.rate, utilization,
+        ).tolist()
+
+    def _reroute(self, stream: RoutedStream) -> bool:
+        """Move a stream if a cheaper acceptable path appeared."""
+        # streams moved earlier in this round changed some links already
+        self._refresh(stream, None if self._everything_changed else self._pending)
+        tree = cast(ShortestPathTree, stream.tree)
+        found = tree.path(stream.target)
+        if found is None or found[1] == stream.edges or not cheaper(tree.dist[stream.target], stream.cost):
+            return False
+        nodes, edges = found
+        offer = (tuple(edges), tuple(tree.costs[edge] for edge in edges))
+        if offer == stream.rejected:
+            return False
+        links = [self.topo.links[edge] for edge in edges]
+        locations = [self.topo.locations[node] for node in nodes]
+        if self.accept is not None and not self.accept(stream.key, locations, links):
+            stream.rejected = offer
+            return False
+        stream.rejected = None
+        self._release(stream)
+        self._occupy(stream, nodes, edges)
+        # the tree doesn't include the stream's own load, so moving it doesn't change the tree
+        stream.cost = sum(tree.costs[edge] for edge in edges)
+        return True
+
+    def _release(self, stream: RoutedStream) -> None:
+        for edge, load in zip(stream.edges, stream.loads, strict=True):
+            link = self.topo.links[edge]
+            link.utilization = max(0.0, link.utilization - load)
+            self.link_streams.get(edge, set()).discard(stream.key)
+        stream.loads = []
+
+    def _occupy(self, stream: RoutedStream, nodes: list[int], edges: list[int]) -> None:
+        stream.nodes, stream.edges = nodes, edges
+        for edge in edges:
+            link = self.topo.links[edge]
+            before = link.utilization
+            link.increase_utilization(stream.rate)
+            # utilization is capped at bandwidth, remember how much was actually added
+            stream.loads.append(link.utilization - before)
+            self.link_streams.setdefault(edge, set()).add(stream.key)
+
+    def _link(self, a: Location, b: Location) -> Link:
+        link = self.topo.get_link(a, b)
+        if link is None:
+            msg = f"No link between {a.name} and {b.name}"
+            raise ValueError(msg)
+        return link
@@ -0,0 +1,193 @@
+"""Compact adjacency of a topology, a plain Dijkstra over compiled link costs and shortest path trees kept up to date."""
+from collections.abc import Collection, Mapping
+from heapq import heappop, heappush
+from math import inf
+
+import numpy as np
+
+from scht_lab.topo import Topology
+
+
+class CSRGraph:
+    """Undirected topology adjacency in compressed sparse row form.
+
+    Nodes are positions in ``Topology.locations`` (same as node indices from ``build_graph``),
+    edges are link ids, so compiled link costs can be indexed directly.
+    """
+    def __init__(self, node_count: int, endpoints: np.ndarray) -> None:
+        """Build adjacency from an (E, 2) array of link endpoints."""
+        self.node_count = node_count
+        self.edge_count = len(endpoints)
+        edge_ids = np.arange(self.edge_count)
+        sources = np.concatenate((endpoints[:, 0], endpoints[:, 1]))
+        targets = np.concatenate((endpoints[:, 1], endpoints[:, 0]))
+        edges = np.concatenate((edge_ids, edge_ids))
+        order = np.argsort(sources, kind="stable")
+        self.indptr = np.zeros(node_count + 1, dtype=np.intp)
+        np.cumsum(np.bincount(sources, minlength=node_count), out=self.indptr[1:])
+        self.targets = targets[order]
+        self.edges = edges[order]
+        self.endpoints = endpoints
+        self._index()
+
+    @classmethod
+    def from_arrays(cls, endpoints: np.ndarray, indptr: np.ndarray, targets: np.ndarray, edges: np.ndarray) -> "CSRGraph":
+        """Restore a graph from its arrays (e.g. memory-mapped from a snapshot) without sorting them again."""
+        graph = cls.__new__(cls)
+        graph.node_count = len(indptr) - 1
+        graph.edge_count = len(endpoints)
+        graph.indptr, graph.targets, graph.edges, graph.endpoints = indptr, targets, edges, endpoints
+        graph._index()
+        return graph
+
+    def _index(self) -> None:
+        # python lists are much faster to index in the search loops than numpy arrays
+        targets, edges, bounds = self.targets.tolist(), self.edges.tolist(), self.indptr.tolist()
+        self._adjacency: list[list[tuple[int, int]]] = [
+            list(zip(targets[start:end], edges[start:end], strict=True))
+            for start, end in zip(bounds[:-1], bounds[1:], strict=True)
+        ]
+
+    def neighbors(self, node: int) -> list[tuple[int, int]]:
+        """Get (neighbor, edge id) pairs of a node."""
+        return self._adjacency[node]
+
+    def other_end(self, edge: int, node: int) -> int:
+        """Get the node on the other side of an edge."""
+        a, b = self.endpoints[edge]
+        return int(b if a == node else a)
+
+
+def csr_graph(topo: Topology) -> CSRGraph:
+    """Get CSR adjacency of a topology, cached until the topology changes."""
+    return topo.derived(
+        ("csr",), lambda: CSRGraph(len(topo.locations), topo.metrics.endpoints.copy()), structural=True,
+    )
+
+
+def dijkstra(
+        graph: CSRGraph,
+        weights: list[float],
+        source: int,
+        target: int | None = None,
+        banned_nodes: Collection[int] = (),
+        banned_edges: Collection[int] = (),
+        ) -> tuple[list[float], list[int]]:
+    """Run Dijkstra from source, skipping banned nodes/edges and edges with infinite cost.
+
+    Returns distances to every node and the edge used to reach it (-1 if none).
+    Stops early once target is settled.
+    """
+    dist = [inf] * graph.node_count
+    via = [-1] * graph.node_count
+    dist[source] = 0.0
+    queue = [(0.0, source)]
+    settled = [False] * graph.node_count
+    while queue:
+        d, node = heappop(queue)
+        if settled[node]:
+            continue
+        settled[node] = True
+        if node == target:
+            break
+        for neighbor, edge in graph.neighbors(node):
+            cost = weights[edge]
+            if cost < 0:
+                msg = "Negative weights not supported."
+                raise ValueError(msg)
+            if settled[neighbor] or cost == inf or neighbor in banned_nodes or edge in banned_edges:
+                continue
+            candidate = d + cost
+            if candidate < dist[neighbor]:
+                dist[neighbor] = candidate
+                via[neighbor] = edge
+                heappush(queue, (candidate, neighbor))
+    return dist, via
+
+
+def trace(graph: CSRGraph, via: list[int], source: int, target: int) -> tuple[list[int], list[int]] | None:
+    """Rebuild (nodes, edges) of a path from the edges returned by dijkstra."""
+    if source != target and via[target] == -1:
+        return None
+    nodes, edges = [target], []
+    node = target
+    while node != source:
+        edge = via[node]
+        edges.append(edge)
+        node = graph.other_end(edge, node)
+        nodes.append(node)
+    nodes.reverse()
+    edges.reverse()
+    return nodes, edges
+
+
+class ShortestPathTree:
+    """Shortest paths from a root node, repaired in place when some link costs change.
+
+    After a change only nodes whose distance can change are searched again: those reached through a link
+    that got more expensive (with everything below them in the tree), and those a cheaper link gets closer.
+    Distances end up the same as from a fresh dijkstra, equal-cost paths may be chosen differently.
+    """
+    def __init__(self, graph: CSRGraph, costs: list[float], root: int) -> None:
+        """Compute the tree for link costs indexed by edge id (the list is copied)."""
+        self.graph = graph
+        self.root = root
+        self.costs = list(costs)
+        self.dist, self.via = dijkstra(graph, self.costs, root)
+
+    def path(self, target: int) -> tuple[list[int], list[int]] | None:
+        """Get (nodes, edges) of the shortest path to a node, None if unreachable."""
+        return trace(self.graph, self.via, self.root, target)
+
+    def update(self, changes: Mapping[int, float]) -> None:
+        """Set new costs of some links (edge id -> cost) and repair the tree."""
+        graph, costs, dist, via = self.graph, self.costs, self.dist, self.via
+        increased, decreased = [], []
+        for edge, cost in changes.items():
+            if cost < 0:
+                msg = "Negative weights not supported."
+                raise ValueError(msg)
+            if cost != costs[edge]:
+                (increased if cost > costs[edge] else decreased).append(edge)
+                costs[edge] = cost
+        # nodes below a link that got more expensive lose their distance
+        invalid: list[int] = []
+        for edge in increased:
+            a, b = graph.endpoints[edge].tolist()
+            child = a if via[a] == edge else b if via[b] == edge else -1
+            if child == -1 or child == self.root:
+                continue
+            stack = [child]
+            via[child] = -1
+            while stack:
+                node = stack.pop()
+                invalid.append(node)
+                dist[node] = inf
+                for neighbor, neighbor_edge in graph.neighbors(node):
+                    if via[neighbor] == neighbor_edge and neighbor != node:
+                        via[neighbor] = -1
+                        stack.append(neighbor)
+        queue: list[tuple[float, int]] = []
+        for node in invalid:
+            for neighbor, edge in graph.neighbors(node):
+                candidate = dist[neighbor] + costs[edge]
+                if candidate < dist[node]:
+                    dist[node], via[node] = candidate, edge
+            if dist[node] < inf:
+                heappush(queue, (dist[node], node))
+        for edge in decreased:
+            a, b = graph.endpoints[edge].tolist()
+            for u, v in ((a, b), (b, a)):
+                candidate = dist[u] + costs[edge]
+                if candidate < dist[v]:
+                    dist[v], via[v] = candidate, edge
+                    heappush(queue, (candidate, v))
+        while queue:
+            d, node = heappop(queue)
+            if d > dist[node]:
+                continue
+            for neighbor, edge in graph.neighbors(node):
+                candidate = d + costs[edge]
+                if candidate < dist[neighbor]:
+                    dist[neighbor], via[neighbor] = candidate, edge
+                    heappush(queue, (candidate, neighbor))
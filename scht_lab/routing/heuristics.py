@@ -0,0 +1,112 @@
+"""Admissible A* heuristics in the same units as compiled link costs."""
+import numpy as np
+
+from scht_lab.routing.graph import CSRGraph, dijkstra
+from scht_lab.topo import Topology
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def coordinates(topo: Topology) -> np.ndarray:
+    """Get (lat, lon) of every location in radians, NaN where unknown. Cached until the topology changes."""
+    def build() -> np.ndarray:
+        coords = np.array(
+            [(np.nan, np.nan) if location.lat is None or location.lon is None else (location.lat, location.lon)
+             for location in topo.locations],
+            dtype=float,
+        ).reshape(-1, 2)
+        return np.radians(coords)
+    return topo.derived(("coordinates",), build, structural=True)
+
+
+def haversine(coords: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km between rows of two (lat, lon) radian arrays (broadcasting)."""
+    lat1, lon1 = coords[..., 0], coords[..., 1]
+    lat2, lon2 = other[..., 0], other[..., 1]
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2*EARTH_RADIUS_KM*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GeoHeuristic:
+    """Straight-line distance to target scaled to cost units.
+
+    Scaled by the smallest cost per km of any link (measured along the great circle),
+    so by the triangle inequality no path can be cheaper than the estimate.
+    """
+    def __init__(self, topo: Topology, weights: np.ndarray) -> None:
+        """Prepare the heuristic for a set of compiled link costs."""
+        self.coords = coordinates(topo)
+        endpoints = topo.metrics.endpoints
+        lengths = haversine(self.coords[endpoints[:, 0]], self.coords[endpoints[:, 1]])
+        usable = np.isfinite(weights) & (lengths > 0)
+        if np.isnan(self.coords).any() or (weights < 0).any() or not usable.any():
+            self.scale = 0.0
+        else:
+            self.scale = float(np.min(weights[usable]/lengths[usable]))
+
+    def estimate(self, target: int) -> np.ndarray:
+        """Get lower bounds of the cost from every node to target."""
+        if not self.scale:
+            return np.zeros(len(self.coords))
+        return self.scale*haversine(self.coords, self.coords[target])
+
+
+class LandmarkTable:
+    """ALT heuristic: exact costs from a few landmarks to every node.
+
+    For any node v and target t, |d(l, t) - d(l, v)| is a lower bound of d(v, t) by the triangle inequality.
+    The table stays admissible when link costs only grow, e.g. with increasing utilization.
+    """
+    def __init__(self, graph: CSRGraph, weights: np.ndarray, count: int = 8) -> None:
+        """Pick landmarks far apart from each other and compute costs from them."""
+        self.weights = weights
+        costs: list[float] = weights.tolist()
+        self.landmarks: list[int] = []
+        rows: list[np.ndarray] = []
+        if graph.node_count == 0 or (weights < 0).any():
+            self.distances = np.zeros((0, graph.node_count))
+            return
+        # farthest-point selection, starting from the best connected node
+        candidate = int(np.argmax(np.diff(graph.indptr)))
+        closest = np.full(graph.node_count, np.inf)
+        for _ in range(min(count, graph.node_count)):
+            self.landmarks.append(candidate)
+            row = np.array(dijkstra(graph, costs, candidate)[0])
+            rows.append(row)
+            closest = np.minimum(closest, row)
+            reachable = np.where(np.isfinite(closest), closest, -1.0)
+            candidate = int(np.argmax(reachable))
+            if reachable[candidate] <= 0:
+                break
+        self.distances = np.vstack(rows)
+
+    def admissible_for(self, weights: np.ndarray) -> bool:
+        """Check if the table is still a valid lower bound for new link costs."""
+        return weights.shape == self.weights.shape and bool(np.all(weights >= self.weights))
+
+    def estimate(self, target: int) -> np.ndarray:
+        """Get lower bounds of the cost from every node to target."""
+        if not len(self.distances):
+            return np.zeros(self.distances.shape[1])
+        with np.errstate(invalid="ignore"):
+            bounds = np.abs(self.distances[:, [target]] - self.distances)
+        # nan comes from inf - inf (both unreachable from landmark), which says nothing
+        return np.nanmax(np.where(np.isnan(bounds), 0, bounds), axis=0)
+
+
+def landmark_table(topo: Topology, graph: CSRGraph, weights: np.ndarray, key: object, count: int = 8) -> LandmarkTable:
+    """Get landmark table for a weight profile, reusing it while it stays admissible."""
+    return topo.derived(
+        ("landmarks", key, count),
+        lambda: LandmarkTable(graph, weights, count),
+        structural=True,
+        valid=lambda table: table.admissible_for(weights),
+    )
+
+
+def estimates(topo: Topology, graph: CSRGraph, weights: np.ndarray, key: object, target: int, landmarks: int = 8) -> np.ndarray:
+    """Get the best admissible lower bound of the cost from every node to target."""
+    bound = topo.derived(("geo", key), lambda: GeoHeuristic(topo, weights)).estimate(target)
+    if landmarks:
+        bound = np.maximum(bound, landmark_table(topo, graph, weights, key, landmarks).estimate(target))
+    return bound
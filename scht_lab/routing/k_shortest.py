@@ -0,0 +1,58 @@
+"""K shortest loopless paths (Yen's algorithm) over compiled link costs."""
+from collections.abc import Iterator
+from heapq import heappop, heappush
+from itertools import count
+
+import numpy as np
+
+from scht_lab.routing.graph import CSRGraph, dijkstra, trace
+
+
+def k_shortest_paths(
+        graph: CSRGraph,
+        weights: np.ndarray,
+        source: int,
+        target: int,
+        ) -> Iterator[tuple[float, list[int], list[int]]]:
+    """Lazily yield loopless paths from source to target in order of increasing cost.
+
+    Every item is (cost, nodes, edges). Links with infinite cost are never used.
+    Each next path costs at most one Dijkstra per node of the previous one, so stop iterating
+    as soon as a good enough path is found.
+    """
+    costs: list[float] = weights.tolist()
+    dist, via = dijkstra(graph, costs, source, target)
+    first = trace(graph, via, source, target)
+    if first is None:
+        return
+    found: list[tuple[list[int], list[int]]] = [first]
+    seen = {tuple(first[1])}
+    yield dist[target], *first
+    candidates: list[tuple[float, int, list[int], list[int]]] = []
+    tiebreak = count()
+    while True:
+        nodes, edges = found[-1]
+        for i, spur in enumerate(nodes[:-1]):
+            root_nodes, root_edges = nodes[:i+1], edges[:i]
+            banned_edges = {
+                path_edges[i] for path_nodes, path_edges in found
+                if len(path_edges) > i and path_nodes[:i+1] == root_nodes
+            }
+            banned_nodes = set(root_nodes[:-1])
+            _, spur_via = dijkstra(graph, costs, spur, target, banned_nodes, banned_edges)
+            spur_path = trace(graph, spur_via, spur, target)
+            if spur_path is None:
+                continue
+            path_edges = root_edges + spur_path[1]
+            key = tuple(path_edges)
+            if key in seen:
+                continue
+            seen.add(key)
+            heappush(candidates, (
+                sum(costs[edge] for edge in path_edges), next(tiebreak), root_nodes[:-1] + spur_path[0], path_edges,
+            ))
+        if not candidates:
+            return
+        cost, _, nodes, edges = heappop(candidates)
+        found.append((nodes, edges))
+        yield cost, nodes, edges
@@ -0,0 +1,155 @@
+"""Routing tables of many weight profiles computed in a process pool."""
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities, Requirements, StreamType
+from scht_lab.routing.graph import CSRGraph, csr_graph
+from scht_lab.routing.table import (
+    FORMAT_VERSION,
+    TABLE_LIMIT,
+    RoutingTable,
+    load_stored,
+    prune_tables,
+    shortest_rows,
+    store_table,
+    table_cache_key,
+    table_key,
+    tables_dir,
+)
+from scht_lab.topo import Topology
+
+# below this many nodes starting workers costs more than it saves
+PARALLEL_THRESHOLD = 256
+# tasks per worker, smaller tasks balance better but repeat the per-task graph setup more often
+TASKS_PER_WORKER = 4
+# tmpfs, so arrays shared with workers never touch the disk
+SHARED_DIR = Path("/dev/shm")
+
+# arrays of the current job, opened once per worker process
+_worker: dict[str, Any] = {}
+
+
+def _init_worker(directory: str, tables: list[str]) -> None:
+    root = Path(directory)
+    endpoints = np.load(root / "endpoints.npy", mmap_mode="r")
+    _worker["graph"] = CSRGraph(int(np.load(root / "nodes.npy")), np.asarray(endpoints))
+    _worker["weights"] = np.load(root / "weights.npy", mmap_mode="r")
+    _worker["tables"] = [
+        (np.load(Path(table) / "distances.npy", mmap_mode="r+"), np.load(Path(table) / "via.npy", mmap_mode="r+"))
+        for table in tables
+    ]
+
+
+def _solve(profile: int, start: int, stop: int) -> None:
+    """Compute rows start:stop of a profile's table, writing them straight into the shared output arrays."""
+    distances, via = shortest_rows(_worker["graph"], np.asarray(_worker["weights"][profile]), range(start, stop))
+    table_distances, table_via = _worker["tables"][profile]
+    table_distances[start:stop] = distances
+    table_via[start:stop] = via
+    table_distances.flush()
+    table_via.flush()
+
+
+def routing_tables(
+        topo: Topology,
+        profiles: Sequence[Priorities | None],
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        workers: int | None = None,
+        persist: bool = False,
+        ) -> list[RoutingTable]:
+    """Get routing tables of many priority profiles at once, like calling routing_table for each of them.
+
+    Link costs of every profile are compiled up front and shared with a pool of ``workers`` processes
+    (all CPUs by default) through memory-mapped files on tmpfs, together with link endpoints.
+    Work is split into (profile, range of sources) tasks. Each worker writes its rows directly into
+    the output matrices, so merging results copies nothing. Tables that are already cached on the
+    topology or stored on disk (with ``persist``) are reused. The others are cached afterwards, the
+    same way routing_table caches them. Small topologies are computed in-process.
+    """
+    graph = csr_graph(topo)
+    keep = max(TABLE_LIMIT, len(profiles))
+    tables: dict[str, RoutingTable] = {}
+    missing: dict[str, np.ndarray] = {}
+    keys: list[str] = []
+    for priorities in profiles:
+        weights = compile_weights(topo, priorities, requirements, stream_type, rate)
+        key = table_key(graph, weights)
+        keys.append(key)
+        if key in tables or key in missing:
+            continue
+        table = topo.cached(table_cache_key(priorities, requirements, stream_type, rate))
+        if table is None and persist:
+            table = load_stored(topo, tables_dir() / key)
+        if table is None:
+            missing[key] = weights
+        else:
+            tables[key] = table
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or graph.node_count < PARALLEL_THRESHOLD:
+        for key, weights in missing.items():
+            tables[key] = RoutingTable(topo, *shortest_rows(graph, weights, range(graph.node_count)))
+            if persist:
+                store_table(tables[key], tables_dir() / key, keep)
+    elif missing:
+        tables.update(zip(missing, _compute(topo, graph, list(missing.values()), workers, persist), strict=True))
+        if persist:
+            prune_tables(tables_dir(), keep)
+
+    for priorities, key in zip(profiles, keys, strict=True):
+        topo.derived(table_cache_key(priorities, requirements, stream_type, rate), lambda key=key: tables[key])
+    return [tables[key] for key in keys]
+
+
+def _compute(topo: Topology, graph: CSRGraph, weights: list[np.ndarray], workers: int, persist: bool) -> list[RoutingTable]:
+    """Compute full tables of the given link costs in a process pool."""
+    node_count = graph.node_count
+    shared = tempfile.TemporaryDirectory(prefix="scht_lab-", dir=SHARED_DIR if SHARED_DIR.is_dir() else None)
+    # outputs of stored tables are created where they will be kept, so they can be renamed into place
+    output_root = tables_dir() if persist else Path(shared.name)
+    output_root.mkdir(parents=True, exist_ok=True)
+    keys = [table_key(graph, profile_weights) for profile_weights in weights]
+    outputs = [output_root / f".{key}.tmp" for key in keys]
+    try:
+        root = Path(shared.name)
+        np.save(root / "endpoints.npy", np.ascontiguousarray(graph.endpoints))
+        np.save(root / "nodes.npy", np.array(node_count))
+        np.save(root / "weights.npy", np.stack([np.asarray(profile_weights, dtype=np.float64) for profile_weights in weights]))
+        for output in outputs:
+            shutil.rmtree(output, ignore_errors=True)
+            output.mkdir()
+            np.lib.format.open_memmap(output / "distances.npy", "w+", np.float64, (node_count, node_count))
+            np.lib.format.open_memmap(output / "via.npy", "w+", np.int32, (node_count, node_count))
+        step = max(1, ceil(node_count*len(weights) / (workers*TASKS_PER_WORKER)))
+        step = min(step, node_count)
+        tasks = [(profile, start, min(start + step, node_count)) for profile in range(len(weights)) for start in range(0, node_count, step)]
+        with ProcessPoolExecutor(min(workers, len(tasks)), initializer=_init_worker, initargs=(str(root), [str(output) for output in outputs])) as pool:
+            for future in [pool.submit(_solve, *task) for task in tasks]:
+                future.result()
+        tables: list[RoutingTable] = []
+        for key, output in zip(keys, outputs, strict=True):
+            if persist:
+                (output / "meta.json").write_text(json.dumps({"format": FORMAT_VERSION, "nodes": node_count}))
+                target = output_root / key
+                shutil.rmtree(target, ignore_errors=True)
+                output.rename(target)
+                tables.append(RoutingTable.load(target, topo))
+            else:
+                tables.append(RoutingTable(topo, np.load(output / "distances.npy"), np.load(output / "via.npy")))
+        return tables
+    finally:
+        for output in outputs:
+            shutil.rmtree(output, ignore_errors=True)
+        shared.cleanup()
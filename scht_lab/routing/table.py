@@ -0,0 +1,279 @@
+"""All-pairs routing tables: distance and incoming edge matrices per weight profile, with paths rebuilt on demand."""
+import hashlib
+import json
+import shutil
+from collections.abc import Hashable, Iterator, Mapping, Sequence
+from math import inf
+from pathlib import Path
+
+import numpy as np
+import rustworkx as rx
+from rich import print
+from typer import get_app_dir
+
+from scht_lab.cost_calc import compile_weights, weight_key
+from scht_lab.models.stream import Priorities, Requirements, StreamType
+from scht_lab.routing.graph import CSRGraph, csr_graph, dijkstra
+from scht_lab.topo import Link, Location, Topology
+
+# bump when the stored layout changes
+FORMAT_VERSION = 1
+# sources handled together when looking for incoming edges, bounds temporary (sources, arcs) arrays
+ROW_BATCH = 64
+# how many tables to keep on disk, oldest ones are removed first
+TABLE_LIMIT = 16
+
+
+def tables_dir() -> Path:
+    """Default directory of stored routing tables, in the app directory."""
+    return Path(get_app_dir("scht_lab")) / "routes"
+
+
+def table_key(graph: CSRGraph, weights: np.ndarray) -> str:
+    """Key identifying the shortest paths of a graph under given link costs, for tables stored on disk."""
+    digest = hashlib.sha256(f"format:{FORMAT_VERSION}:{graph.node_count}".encode())
+    digest.update(np.ascontiguousarray(graph.endpoints, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def shortest_rows(graph: CSRGraph, weights: np.ndarray, sources: Sequence[int]) -> tuple[np.ndarray, np.ndarray]:
+    """Compute routing table rows for the given sources.
+
+    Returns distances from every source to every node (inf if unreachable) and the edge (link id)
+    used to reach each node on a shortest path (-1 for the source and unreachable nodes).
+    Distances come from rustworkx with link costs as edge payloads. Incoming edges are then found
+    for a batch of sources at once as arcs ``u -> v`` with ``dist[u] + cost == dist[v]``.
+    Dijkstra computes distances with exactly that sum, so the comparison is exact. Zero-cost arcs are
+    skipped, because they could form a cycle. A row with a node left unexplained is computed with the
+    plain Dijkstra instead.
+    """
+    node_count = graph.node_count
+    usable = np.flatnonzero(np.isfinite(weights))
+    endpoints = np.asarray(graph.endpoints)[usable]
+    costs = np.asarray(weights, dtype=np.float64)[usable]
+    rx_graph = rx.PyGraph(multigraph=True)
+    rx_graph.add_nodes_from(range(node_count))
+    rx_graph.add_edges_from(list(zip(endpoints[:, 0].tolist(), endpoints[:, 1].tolist(), costs.tolist(), strict=True)))
+    # both directions of every usable link with a positive cost
+    positive = costs > 0
+    tails = np.concatenate((endpoints[positive, 0], endpoints[positive, 1]))
+    heads = np.concatenate((endpoints[positive, 1], endpoints[positive, 0]))
+    arc_costs = np.concatenate((costs[positive], costs[positive]))
+    arc_edges = np.concatenate((usable[positive], usable[positive]))
+
+    distances = np.full((len(sources), node_count), inf)
+    via = np.full((len(sources), node_count), -1, dtype=np.int32)
+    for row, source in enumerate(sources):
+        lengths = rx.dijkstra_shortest_path_lengths(rx_graph, source, float)
+        distances[row, np.fromiter(lengths.keys(), np.intp, len(lengths))] = np.fromiter(lengths.values(), float, len(lengths))
+        distances[row, source] = 0.0
+    costs_list: list[float] | None = None
+    for start in range(0, len(sources), ROW_BATCH):
+        rows = slice(start, start + ROW_BATCH)
+        block = distances[rows]
+        tight = (block[:, tails] + arc_costs == block[:, heads]) & np.isfinite(block[:, heads])
+        batch_rows, arcs = np.nonzero(tight)
+        via[rows][batch_rows, heads[arcs]] = arc_edges[arcs]
+        for row in range(start, min(start + ROW_BATCH, len(sources))):
+            source = sources[row]
+            missing = np.isfinite(distances[row]) & (via[row] == -1)
+            missing[source] = False
+            if missing.any():
+                if costs_list is None:
+                    costs_list = np.asarray(weights, dtype=np.float64).tolist()
+                dist, edges = dijkstra(graph, costs_list, source)
+                distances[row], via[row] = dist, edges
+    return distances, via
+
+
+class RoutingTable:
+    """Shortest paths between all pairs of locations under one weight profile.
+
+    Only two (N, N) matrices are kept, distances and the link used to reach each target (-1 if none).
+    Paths are rebuilt from the latter on request, in O(path length). Matrices may be memory-mapped from disk.
+    The table is tied to the topology version it was computed at, see ``stale``.
+    """
+    def __init__(self, topo: Topology, distances: np.ndarray, via: np.ndarray, version: int | None = None) -> None:
+        """Wrap computed matrices (rows and columns are positions in ``topo.locations``)."""
+        self.topo = topo
+        self.distances = distances
+        self.via = via
+        self.version = topo.version if version is None else version
+        self._endpoints: list[list[int]] = np.asarray(topo.metrics.endpoints).tolist()
+
+    @property
+    def stale(self) -> bool:
+        """Whether the topology changed since the table was computed."""
+        return self.version != self.topo.version
+
+    def node_path(self, source: int, target: int) -> tuple[list[int], list[int]] | None:
+        """Get (nodes, edges) of the shortest path between node positions, None if unreachable."""
+        if source != target and self.via[source, target] == -1:
+            return None
+        nodes, edges = [target], []
+        node = target
+        row = self.via[source]
+        while node != source:
+            edge = int(row[node])
+            edges.append(edge)
+            a, b = self._endpoints[edge]
+            node = b if a == node else a
+            nodes.append(node)
+        nodes.reverse()
+        edges.reverse()
+        return nodes, edges
+
+    def path(self, src: Location, dst: Location) -> list[Location] | None:
+        """Get the shortest path between two locations, None if unreachable."""
+        found = self.node_path(self.topo.position(src), self.topo.position(dst))
+        return None if found is None else [self.topo.locations[i] for i in found[0]]
+
+    def links(self, src: Location, dst: Location) -> list[Link] | None:
+        """Get links of the shortest path between two locations, None if unreachable."""
+        found = self.node_path(self.topo.position(src), self.topo.position(dst))
+        return None if found is None else [self.topo.links[i] for i in found[1]]
+
+    def distance(self, src: Location, dst: Location) -> float:
+        """Get cost of the shortest path between two locations (inf if unreachable)."""
+        return float(self.distances[self.topo.position(src), self.topo.position(dst)])
+
+    def paths(self) -> "TablePaths":
+        """Get a lazy source -> target -> path mapping over all reachable pairs (like all_paths)."""
+        return TablePaths(self)
+
+    def save(self, path: Path) -> None:
+        """Store the matrices in a directory, written next to it first so readers never see a partial table."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+        np.save(tmp / "distances.npy", np.ascontiguousarray(self.distances))
+        np.save(tmp / "via.npy", np.ascontiguousarray(self.via))
+        (tmp / "meta.json").write_text(json.dumps({"format": FORMAT_VERSION, "nodes": len(self.distances)}))
+        shutil.rmtree(path, ignore_errors=True)
+        tmp.rename(path)
+
+    @classmethod
+    def load(cls, path: Path, topo: Topology) -> "RoutingTable":
+        """Memory-map a table stored with save for a topology (read-only)."""
+        meta = json.loads((path / "meta.json").read_text())
+        if meta.get("format") != FORMAT_VERSION or meta.get("nodes") != len(topo.locations):
+            msg = f"Routing table in {path} doesn't match the topology"
+            raise ValueError(msg)
+        return cls(topo, np.load(path / "distances.npy", mmap_mode="r"), np.load(path / "via.npy", mmap_mode="r"))
+
+
+class TablePaths(Mapping[Location, Mapping[Location, list[Location]]]):
+    """Paths from every source of a routing table, rebuilt only when accessed."""
+    def __init__(self, table: RoutingTable) -> None:
+        """Wrap a routing table."""
+        self.table = table
+
+    def __getitem__(self, src: Location) -> "SourcePaths":
+        """Get paths from a source."""
+        return SourcePaths(self.table, self.table.topo.position(src))
+
+    def __iter__(self) -> Iterator[Location]:
+        """Iterate over sources."""
+        return iter(self.table.topo.locations)
+
+    def __len__(self) -> int:
+        """Number of sources."""
+        return len(self.table.topo.locations)
+
+
+class SourcePaths(Mapping[Location, list[Location]]):
+    """Paths from a single source to every location reachable from it (except itself)."""
+    def __init__(self, table: RoutingTable, source: int) -> None:
+        """Wrap a row of a routing table."""
+        self.table = table
+        self.source = source
+        self._targets: list[int] = np.flatnonzero(np.asarray(table.via[source]) != -1).tolist()
+
+    def __getitem__(self, dst: Location) -> list[Location]:
+        """Get path to a target."""
+        path = self.table.path(self.table.topo.locations[self.source], dst)
+        if path is None or dst is self.table.topo.locations[self.source]:
+            raise KeyError(dst)
+        return path
+
+    def __iter__(self) -> Iterator[Location]:
+        """Iterate over reachable targets."""
+        locations = self.table.topo.locations
+        return (locations[target] for target in self._targets)
+
+    def __len__(self) -> int:
+        """Number of reachable targets."""
+        return len(self._targets)
+
+
+def prune_tables(directory: Path, keep: int = TABLE_LIMIT) -> None:
+    """Remove all but the most recently used stored tables."""
+    if not directory.is_dir():
+        return
+    tables = sorted(
+        (path for path in directory.iterdir() if path.is_dir() and not path.name.startswith(".")),
+        key=lambda path: path.stat().st_mtime, reverse=True,
+    )
+    for path in tables[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def store_table(table: RoutingTable, path: Path, keep: int = TABLE_LIMIT) -> None:
+    """Save a table, keeping at most keep stored tables. Failures are only reported, the table works without being stored."""
+    try:
+        table.save(path)
+        prune_tables(path.parent, keep)
+    except OSError as e:
+        print(f"[yellow]Couldn't save routing table: {e}[/yellow]")
+
+
+def table_cache_key(
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        ) -> Hashable:
+    """Key of the routing table of a weight profile in the topology cache."""
+    return ("routing-table", weight_key(priorities, requirements, stream_type, rate))
+
+
+def load_stored(topo: Topology, path: Path) -> RoutingTable | None:
+    """Memory-map a stored table if there is a usable one at path."""
+    if not path.is_dir():
+        return None
+    try:
+        table = RoutingTable.load(path, topo)
+    except (OSError, ValueError) as e:
+        print(f"[yellow]Ignoring broken routing table {path}: {e}[/yellow]")
+        return None
+    path.touch()
+    return table
+
+
+def routing_table(
+        topo: Topology,
+        priorities: Priorities | None = None,
+        requirements: Requirements | None = None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        persist: bool = False,
+        ) -> RoutingTable:
+    """Get the all-pairs routing table of a weight profile, computed once per topology version.
+
+    With ``persist`` tables are also stored in the app directory, keyed by the graph and its link costs,
+    so a later run with the same topology state memory-maps the table instead of computing it.
+    See routing.parallel for computing many tables at once on large topologies.
+    """
+    def build() -> RoutingTable:
+        graph = csr_graph(topo)
+        weights = compile_weights(topo, priorities, requirements, stream_type, rate)
+        path = tables_dir() / table_key(graph, weights) if persist else None
+        if path is not None and (table := load_stored(topo, path)) is not None:
+            return table
+        table = RoutingTable(topo, *shortest_rows(graph, weights, range(graph.node_count)))
+        if path is not None:
+            store_table(table, path)
+        return table
+    return topo.derived(table_cache_key(priorities, requirements, stream_type, rate), build)
@@ -0,0 +1,114 @@
+"""Compiled topology snapshots, so loading an unchanged topology file skips parsing, geocoding and graph building."""
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+from typer import get_app_dir
+
+from scht_lab.link_metrics import DERIVED
+from scht_lab.routing.graph import CSRGraph, csr_graph
+from scht_lab.topo import Link, Location, Topology, location_ip
+
+# bump when the layout (or metric formulas stored in it) change, so old snapshots aren't used
+FORMAT_VERSION = 1
+# how many snapshots to keep, oldest ones are removed first
+SNAPSHOT_LIMIT = 8
+METRIC_COLUMNS = ("distance", "bw_override", "utilization", *DERIVED)
+
+
+def snapshot_dir() -> Path:
+    """Default directory of snapshots, next to the topology in the app directory."""
+    return Path(get_app_dir("scht_lab")) / "snapshots"
+
+
+def source_key(data: bytes) -> str:
+    """Key of a snapshot compiled from the given topology file contents."""
+    digest = hashlib.sha256(data)
+    digest.update(f"format:{FORMAT_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def save_snapshot(topo: Topology, path: Path) -> None:
+    """Write a topology as a directory of .npy arrays with names in meta.json.
+
+    The snapshot is written to a temporary directory first and renamed, so readers never see a partial one.
+    """
+    metrics = topo.metrics
+    graph = csr_graph(topo)
+    arrays: dict[str, np.ndarray] = {
+        "population": np.fromiter((location.population for location in topo.locations), np.int64, len(topo.locations)),
+        "connectivity": np.fromiter((location.connectivity for location in topo.locations), np.int64, len(topo.locations)),
+        "lat": np.fromiter((np.nan if location.lat is None else location.lat for location in topo.locations), float, len(topo.locations)),
+        "lon": np.fromiter((np.nan if location.lon is None else location.lon for location in topo.locations), float, len(topo.locations)),
+        "endpoints": metrics.endpoints,
+        "ports": np.array([link.ports or (0, 0) for link in topo.links], dtype=np.int64).reshape(-1, 2),
+        "indptr": graph.indptr,
+        "targets": graph.targets,
+        "edges": graph.edges,
+        **{column: getattr(metrics, column) for column in METRIC_COLUMNS},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    for name, array in arrays.items():
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(array))
+    meta = {"format": FORMAT_VERSION, "names": [location.name for location in topo.locations]}
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    shutil.rmtree(path, ignore_errors=True)
+    tmp.rename(path)
+
+
+def load_snapshot(path: Path) -> Topology:
+    """Load a topology saved with save_snapshot.
+
+    Arrays are memory-mapped copy-on-write: they're read lazily and changes (e.g. utilization) never reach the file.
+    Derived link metrics and the CSR adjacency are used as stored instead of being recomputed.
+    """
+    meta = json.loads((path / "meta.json").read_text())
+    if meta.get("format") != FORMAT_VERSION:
+        msg = f"Unsupported snapshot format {meta.get('format')} in {path}"
+        raise ValueError(msg)
+    arrays = {file.stem: np.load(file, mmap_mode="c") for file in path.glob("*.npy")}
+    topo = Topology()
+    population, connectivity = arrays["population"].tolist(), arrays["connectivity"].tolist()
+    for index, (name, lat, lon) in enumerate(zip(meta["names"], arrays["lat"].tolist(), arrays["lon"].tolist(), strict=True)):
+        topo.add_location(Location(
+            name=name,
+            ip=location_ip(index),
+            index=index,
+            population=population[index],
+            lat=None if np.isnan(lat) else lat,
+            lon=None if np.isnan(lon) else lon,
+            connectivity=connectivity[index],
+        ))
+    endpoints = arrays["endpoints"]
+    topo.metrics.adopt(endpoints, {column: arrays[column] for column in METRIC_COLUMNS})
+    locations = topo.locations
+    links = zip(endpoints.tolist(), arrays["ports"].tolist(), arrays["bw_override"].tolist(), strict=True)
+    for edge, ((a, b), (port_a, port_b), bw_override) in enumerate(links):
+        topo.add_link(
+            Link(
+                (locations[a], locations[b]), 0,
+                ports=(port_a, port_b) if port_a or port_b else None,
+                bw_override=None if np.isnan(bw_override) else bw_override,
+            ),
+            edge,
+        )
+    graph = CSRGraph.from_arrays(endpoints, arrays["indptr"], arrays["targets"], arrays["edges"])
+    topo.derived(("csr",), lambda: graph, structural=True)
+    return topo
+
+
+def prune_snapshots(directory: Path, keep: int = SNAPSHOT_LIMIT) -> None:
+    """Remove all but the most recently used snapshots."""
+    if not directory.is_dir():
+        return
+    snapshots = sorted(
+        (path for path in directory.iterdir() if path.is_dir() and not path.name.startswith(".")),
+        key=lambda path: path.stat().st_mtime, reverse=True,
+    )
+    for path in snapshots[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
@@ -2,29 +2,34 @@
 from asyncio import gather
 import json
 from collections import OrderedDict
-from math import log, sqrt
+from contextlib import nullcontext
 from pathlib import Path
 import time
-from typing import Optional, cast, Awaitable
-from functools import cache
-from ipaddress import ip_interface, IPv4Interface, IPv6Interface
+from typing import Any, Optional, TypeVar, cast
+from collections.abc import Callable, Hashable
+import numpy as np
+from ipaddress import ip_interface, IPv4Address, IPv4Interface, IPv6Address, IPv6Interface
 
 from anyio import open_file
-from aiocache import cached
-from aiofilecache import FileCache
 
-from geopy.adapters import AioHTTPAdapter
-from geopy.geocoders import Nominatim, Photon, IGNFrance, DataBC
 from geopy.location import Location as GeoLocation
-from geopy.exc import GeopyError
 from typer import get_app_dir
-from scht_lab.helpers.gather_dict import gather_dict
-from scht_lab.helpers.location_serializer import LocationSerializer
+from scht_lab.geo import GeoStore, geocode_all
+from scht_lab import link_metrics
+from scht_lab.link_metrics import Aggregate, LinkMetrics, Metric
 
-from scht_lab.models.flow import Flow, Selector, Treatment
+from scht_lab.models.flow import FlowRecord, eth_type_criterion, ip_criterion
 from scht_lab.models.topo import Topology as TopologyModel
 from rich import print
 
+T = TypeVar("T")
+DERIVED_CACHE_SIZE = 128
+NETWORK = IPv4Interface("10.0.0.0/8")
+
+def location_ip(index: int) -> IPv4Interface:
+    """Address of the location at an index in a loaded topology (10.0.0.1/8 for the first one)."""
+    return IPv4Interface((int(NETWORK.ip) + index + 1, NETWORK.network.prefixlen))
+
 class Location:
     """Location (switch/city) in the topology."""
     def __init__(self, name: str, ip: str | IPv4Interface | IPv6Interface, index: int, population: int, lat: Optional[int] = None, lon: Optional[int] = None, connectivity: int = 1) -> None:
@@ -52,33 +57,13 @@ class Location:
         if self.lat is None or self.lon is None:
             raise ValueError("Location does not have coordinates")
         return (self.lat, self.lon)
-    def endpoint_flows(self) -> list[Flow]:
+    def endpoint_flows(self) -> list[FlowRecord]:
         return [
-            Flow(
-                deviceId=self.ofname,
-                isPermanent=True,
-                priority=65534,
-                timeout=0,
-                selector=Selector(
-                    criteria=[
-                        {
-                            "type": "ETH_TYPE",
-                            "ethType": "0x800" if self.ip.version == 4 else "0x86dd",
-                        },
-                        {
-                            "type": "IPV4_DST" if self.ip.version == 4 else "IPV6_DST",
-                            "ip": f"{self.ip.ip}/{self.ip.max_prefixlen}",
-                        } # type: ignore
-                    ]
-                ),
-                treatment=Treatment(
-                    instructions=[
-                        {
-                            "type": "OUTPUT",
-                            "port": "1",
-                        }
-                    ]
-                ),
+            FlowRecord(
+                self.ofname,
+                65534,
+                (eth_type_criterion(self.ip), ip_criterion(self.ip, "DST")),
+                ((("type", "OUTPUT"), ("port", "1")),),
             ),
         ]
     def __rich_repr__(self):
@@ -92,7 +77,12 @@ class Location:
         yield "link_count", self.connectivity
 
 class Link:
-    """Link between two locations (switches)."""
+    """Link between two locations (switches).
+
+    Once added to a topology the link is a view over the topology's LinkMetrics store,
+    before that it keeps its own values and computes metrics on demand.
+    """
+    __slots__ = ("locations", "ports", "id", "_metrics", "_distance", "_utilization", "_bw_override")
     def __init__(
             self, 
             locations: tuple[Location, Location], 
@@ -102,50 +92,79 @@ class Link:
             ) -> None:
         """Initialize a link object."""
         self.locations = locations
-        self.distance = distance
         self.ports = ports
-        self.utilization = utilization
-        self.bw_override = bw_override
-    @cache
+        self.id: int | None = None
+        self._metrics: LinkMetrics | None = None
+        self._distance = distance
+        self._utilization = utilization
+        self._bw_override = bw_override
+    def attach(self, metrics: LinkMetrics, edge: int | None = None) -> None:
+        """Move link data into a metric store and keep only the edge id.
+
+        With ``edge`` the link is bound to a row already in the store instead (e.g. one loaded from a snapshot).
+        """
+        if edge is None:
+            edge = metrics.append(self.locations, self._distance, self._bw_override, self._utilization)
+        self.id = edge
+        self._metrics = metrics
+
+    @property
+    def distance(self) -> float:
+        """Length of the link."""
+        if self._metrics is not None:
+            return float(self._metrics.distance[self.id])
+        return self._distance
+    @distance.setter
+    def distance(self, value: float) -> None:
+        self._distance = value
+        if self._metrics is not None:
+            self._metrics.set_distance(cast(int, self.id), value)
+    @property
+    def utilization(self) -> float:
+        """Bandwidth currently used by streams on the link."""
+        if self._metrics is not None:
+            return float(self._metrics.utilization[self.id])
+        return self._utilization
+    @utilization.setter
+    def utilization(self, value: float) -> None:
+        self._utilization = value
+        if self._metrics is not None:
+            self._metrics.set_utilization(cast(int, self.id), value)
+    @property
+    def bw_override(self) -> Optional[int]:
+        """Fixed bandwidth of the link, overriding the calculated one."""
+        return self._bw_override
+    @bw_override.setter
+    def bw_override(self, value: Optional[int]) -> None:
+        self._bw_override = value
+        if self._metrics is not None:
+            self._metrics.set_bw_override(cast(int, self.id), value)
+
     def delay_calc(self) -> float:
         """Calculate delay for a link."""
-        return self.distance/200
-    @cache
+        if self._metrics is not None:
+            return float(self._metrics.delay[self.id])
+        return float(link_metrics.delay(self.distance))
     def jitter_calc(self) -> float:
         """Calculate jitter (derivative of delay) for a link."""
-        return log(sqrt(self.distance/200))
-    @cache
+        if self._metrics is not None:
+            return float(self._metrics.jitter[self.id])
+        return float(link_metrics.jitter(self.distance))
     def bandwidth_calc(self) -> float:
         """Calculate bandwidth for a link."""
-        if self.bw_override:
-            return self.bw_override
-        return max(
-                (
-                    (
-                        self.locations[0].population + 
-                        self.locations[1].population + 
-                        10*max(self.locations[0].population, self.locations[1].population)
-                    ) / 9000000 - 
-                    self.distance / 3 +
-                    (self.locations[0].connectivity + self.locations[1].connectivity) * 90
-                ),
-                (
-                    min(self.locations[0].population, self.locations[1].population) / 
-                    (self.locations[0].population + self.locations[1].population) 
-                    * 100 +
-                    self.distance / 12 -
-                    (75/min(self.locations[0].connectivity, self.locations[1].connectivity))
-                )
-        )
-    @cache
+        if self._metrics is not None:
+            return float(self._metrics.bandwidth[self.id])
+        return float(link_metrics.bandwidth(
+            self.distance,
+            self.locations[0].population, self.locations[1].population,
+            self.locations[0].connectivity, self.locations[1].connectivity,
+            np.nan if self.bw_override is None else self.bw_override,
+        ))
     def loss_calc(self) -> float:
         """Calculate loss for a link."""
-        return (
-                (self.locations[0].population + self.locations[1].population + 
-                 max(self.locations[0].population, self.locations[1].population)) / 2000000000 + 
-                self.distance / 1500000
-                )
-    @cache
+        if self._metrics is not None:
+            return float(self._metrics.loss[self.id])
+        return float(link_metrics.loss(self.distance, self.locations[0].population, self.locations[1].population))
     def port_to(self, location: Location) -> int:
         """Get the port number to a location."""
         if not self.ports:
@@ -170,83 +189,155 @@ class Topology:
     """Topology of the network."""
     def __init__(self, locations: list[Location] | None = None, links: list[Link] | None = None) -> None:
         """Initialize the topology."""
-        self.locations: list[Location] = locations or []
-        self.links: list[Link] = links or []
+        self.locations: list[Location] = []
+        self.links: list[Link] = []
+        # lookup indexes, kept in sync by add_location/add_link - don't modify the lists above directly
+        self._by_name: dict[str, Location] = {}
+        self._by_ip: dict[IPv4Address | IPv6Address, Location] = {}
+        self._by_ofname: dict[str, Location] = {}
+        self._adjacency: dict[Location, dict[Location, Link]] = {}
+        self._positions: dict[Location, int] = {}
+        self.metrics = LinkMetrics(self.locations, self._positions)
+        self._cache: OrderedDict[Hashable, tuple[int, Any]] = OrderedDict()
+        # changes only when locations or links are added, unlike version
+        self.structure_version = 0
+        for location in locations or []:
+            self.add_location(location)
+        for link in links or []:
+            self.add_link(link)
     def add_location(self, location: Location) -> None:
         """Add a new location to the topology."""
+        self._positions.setdefault(location, len(self.locations))
         self.locations.append(location)
-    def add_link(self, link: Link) -> None:
-        """Add a new link between locations to the topology."""
+        # first location wins on duplicates, same as the previous linear scan
+        self._by_name.setdefault(location.name, location)
+        self._by_ip.setdefault(location.ip.ip, location)
+        self._by_ofname.setdefault(location.ofname, location)
+        self._adjacency.setdefault(location, {})
+        self.metrics.version += 1
+        self.structure_version += 1
+    def add_link(self, link: Link, edge: int | None = None) -> None:
+        """Add a new link between locations to the topology (bound to an existing metrics row with ``edge``)."""
+        if not all(location in self._positions for location in link.locations):
+            msg = "Both ends of a link must be added to the topology first"
+            raise ValueError(msg)
+        link.attach(self.metrics, edge)
         self.links.append(link)
+        self.structure_version += 1
+        l1, l2 = link.locations
+        self._adjacency.setdefault(l1, {}).setdefault(l2, link)
+        self._adjacency.setdefault(l2, {}).setdefault(l1, link)
+    def position(self, location: Location) -> int:
+        """Get the position of a location in the topology (its node index in build_graph)."""
+        return self._positions[location]
     def get_location(self, name: str) -> Location | None:
-        """Get a location from the topology by name."""
-        ip = IPv4Interface("0.0.0.0/0")
+        """Get a location from the topology by name, IP address or OpenFlow device id."""
+        location = self._by_name.get(name) or self._by_ofname.get(name)
+        if location is not None:
+            return location
         try:
-            ip = ip_interface(name)
+            return self._by_ip.get(ip_interface(name).ip)
         except ValueError:
-            pass
-        return next((location for location in self.locations if location.name == name or ip.ip == location.ip.ip), None)
-        
+            return None
+    def neighbors(self, location: Location) -> dict[Location, Link]:
+        """Get neighbors of a location mapped to the links leading to them."""
+        return self._adjacency.get(location, {})
     def get_link(self, l1: Location, l2: Location) -> Link | None:
         """Get a link between two locations (undirected)."""
-        return next((link for link in self.links if l1 in link.locations and l2 in link.locations), None)
+        return self._adjacency.get(l1, {}).get(l2)
     def has_link(self, l1: Location, l2: Location):
         """Check if a link exists between two locations (undirected)."""
-        return any(l1 in link.locations and l2 in link.locations for link in self.links)
+        return l2 in self._adjacency.get(l1, {})
     def port_to(self, src: Location, dst: Location):
         """Get the port number to a location."""
-        return next(link.port_to(dst) for link in self.links if src in link.locations and dst in link.locations)
+        link = self.get_link(src, dst)
+        if link is None:
+            msg = f"No link between {src.name} and {dst.name}"
+            raise ValueError(msg)
+        return link.port_to(dst)
+
+    @property
+    def version(self) -> int:
+        """Counter increased on every change to the topology (locations, links, metrics or utilization)."""
+        return self.metrics.version
+    def invalidate(self) -> None:
+        """Mark all link metrics and aggregates as stale.
+
+        Needed after changing attributes the metrics depend on outside of the topology API,
+        e.g. population, connectivity or coordinates of a location.
+        """
+        self.metrics.invalidate()
+        self.structure_version += 1
+    def derived(
+            self, key: Hashable, factory: Callable[[], T],
+            structural: bool = False, valid: Callable[[T], bool] | None = None,
+            ) -> T:
+        """Get a value derived from the topology, calling factory only if it's missing or the topology changed since.
+
+        With ``structural`` the value only depends on locations and links themselves, not on their metrics.
+        ``valid`` can reject a cached value for reasons the versions don't capture.
+        """
+        version = self.structure_version if structural else self.version
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == version and (valid is None or valid(entry[1])):
+            self._cache.move_to_end(key)
+            return entry[1]
+        value = factory()
+        self._cache[key] = (version, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > DERIVED_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return value
+    def cached(self, key: Hashable, structural: bool = False) -> Any | None:
+        """Get a value stored with derived if it's still up to date, without computing it otherwise."""
+        entry = self._cache.get(key)
+        version = self.structure_version if structural else self.version
+        return entry[1] if entry is not None and entry[0] == version else None
+    def subscribe(self, listener: Callable[[int | None], None]) -> None:
+        """Call listener with the id of every link whose metrics or utilization change (None if all might have)."""
+        self.metrics.listeners.append(listener)
+    def unsubscribe(self, listener: Callable[[int | None], None]) -> None:
+        """Stop calling a listener added with subscribe."""
+        self.metrics.listeners.remove(listener)
+    def stats(self, metric: Metric) -> Aggregate:
+        """Get incrementally maintained max/min/sum of a link metric."""
+        return self.metrics.aggregate(metric)
 
     @property
-    @cache
     def max_delay(self) -> float:
         """Get the maximum delay in the topology."""
-        return max(link.delay_calc() for link in self.links)
+        return self.stats("delay").max
     @property
-    @cache
     def max_jitter(self) -> float:
         """Get the maximum jitter in the topology."""
-        return max(link.jitter_calc() for link in self.links)
+        return self.stats("jitter").max
     @property
-    @cache
     def max_bandwidth(self) -> float:
         """Get the maximum bandwidth in the topology."""
-        return max(link.bandwidth_calc() for link in self.links)
+        return self.stats("bandwidth").max
     @property
-    @cache
     def max_loss(self) -> float:
         """Get the maximum loss in the topology."""
-        return max(link.loss_calc() for link in self.links)
+        return self.stats("loss").max
     def __rich_repr__(self):
         yield "locations", self.locations
         yield "links", self.links
 
-@cached(serializer=LocationSerializer(), cache=FileCache, basedir=Path(get_app_dir("scht_lab")) / "cache")
-async def get_geo(name: str) -> GeoLocation | None:
-    """Get geolocation by name of a place (e.g. city)."""
-    for provider in [Nominatim, Photon, IGNFrance, DataBC]:
-        async with provider(user_agent="scht_lab_pw", adapter_factory=AioHTTPAdapter) as geolocator:
-            coro = geolocator.geocode(name, exactly_one=True)
-            if coro is None:
-                return None
-            try:
-                return cast(GeoLocation, await coro)
-            except GeopyError:
-                continue
-async def load_topology(topo_data: OrderedDict[str, OrderedDict[str, int | OrderedDict[str, int]]]) -> Topology:
-    """Load topology from a OrderedDict."""
+async def load_topology(topo_data: OrderedDict[str, OrderedDict[str, Any]], store: GeoStore | None = None) -> Topology:
+    """Load topology from a OrderedDict.
+
+    Locations without inline lat/lon are geocoded through the coordinate store (the default one unless given).
+    """
     topo = Topology()
-    topo_index = lambda x: list(topo_data.keys()).index(x)
-    city_geo_lookups: dict[Location, Awaitable[GeoLocation | None]] = {}
-    for city in topo_data.keys():
-        index = topo_index(city)
+    for index, city in enumerate(topo_data.keys()):
         city_data = Location(
             name=city,
-            ip=f"10.0.0.{index+1}/8",
+            ip=location_ip(index),
             index=index,
             population=cast(int, topo_data[city]["population"]),
+            lat=topo_data[city].get("lat"),
+            lon=topo_data[city].get("lon"),
         )
-        city_geo_lookups[city_data] = get_geo(city)
         topo.add_location(city_data)
 
     
@@ -270,19 +361,50 @@ async def load_topology(topo_data: OrderedDict[str, OrderedDict[str, int | Order
                     bw_override=bw_override,
                 ),
             )
-    geo_data = await gather_dict(city_geo_lookups)
-    for city, geo in geo_data.items():
+    for city in topo.locations:
         city.connectivity = topo_data[city.name]["connectivity"]
-        if city is not None and geo is not None:
-            city.set_geo(geo)
+    missing = [city for city in topo.locations if city.lat is None or city.lon is None]
+    if missing:
+        # a store passed in stays open for the caller
+        with nullcontext(store) if store else GeoStore() as geo_store:
+            coordinates = await geocode_all([city.name for city in missing], geo_store)
+        for city in missing:
+            if coords := coordinates.get(city.name):
+                city.lat, city.lon = coords
+    # connectivity changed after links were added, derived metrics need to be recomputed
+    topo.invalidate()
     return topo
 
-async def load_topology_from_file(filename: str | Path) -> Topology:
-    """Load topology from a file."""
-    async with await open_file(filename, "r") as f:
+async def load_topology_from_file(filename: str | Path, snapshot: bool = True) -> Topology:
+    """Load topology from a file.
+
+    Unless disabled, the compiled topology is kept in a snapshot keyed by the file contents,
+    so loading an unchanged file again skips parsing, geocoding and graph building.
+    """
+    async with await open_file(filename, "rb") as f:
         data = await f.read()
-        topo_data = json.loads(data, object_pairs_hook=OrderedDict)
-        return await load_topology(topo_data)
+    if not snapshot:
+        return await load_topology(json.loads(data, object_pairs_hook=OrderedDict))
+    from scht_lab.snapshot import load_snapshot, prune_snapshots, save_snapshot, snapshot_dir, source_key
+
+    path = snapshot_dir() / source_key(data)
+    if path.is_dir():
+        try:
+            topo = load_snapshot(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[yellow]Ignoring broken topology snapshot {path}: {e}[/yellow]")
+        else:
+            path.touch()
+            return topo
+    topo = await load_topology(json.loads(data, object_pairs_hook=OrderedDict))
+    # locations that couldn't be geocoded are looked up again on next load instead
+    if all(location.lat is not None and location.lon is not None for location in topo.locations):
+        try:
+            save_snapshot(topo, path)
+            prune_snapshots(path.parent)
+        except OSError as e:
+            print(f"[yellow]Couldn't save topology snapshot: {e}[/yellow]")
+    return topo
 
 
 async def default_topo() -> Topology:
@@ -293,10 +415,22 @@ async def default_topo() -> Topology:
 
 def to_model(topo: Topology) -> TopologyModel:
     """Convert a Topology object to a TopologyModel."""
-    data = {location.name: {"population": location.population, "neighbors": {}} for location in topo.locations}
+    data: dict[str, dict[str, Any]] = {
+        location.name: {
+            "population": location.population,
+            "connectivity": location.connectivity,
+            "neighbors": {},
+            # stored inline so loading the saved topology doesn't need geocoding
+            "lat": location.lat,
+            "lon": location.lon,
+        }
+        for location in topo.locations
+    }
     for link in topo.links:
-        data[link.locations[0].name][link.locations[1].name] = link.distance
-        data[link.locations[1].name][link.locations[0].name] = link.distance
+        data[link.locations[0].name]["neighbors"][link.locations[1].name] = link.distance
+        data[link.locations[1].name]["neighbors"][link.locations[0].name] = link.distance
+        if link.bw_override:
+            data[link.locations[0].name].setdefault("bw_overrides", {})[link.locations[1].name] = link.bw_override
     return TopologyModel.model_validate(data)
 
 async def save_default(topo: TopologyModel | Topology) -> None:
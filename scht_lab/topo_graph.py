@@ -1,56 +1,54 @@
 """Graph utilities for Topology objects."""
-from collections.abc import Callable
-from enum import Enum
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator, Mapping
 from functools import wraps
+from ipaddress import collapse_addresses, ip_network
 from itertools import chain, pairwise, permutations
 from pathlib import Path
-from typing import NewType, cast, Literal
+from typing import Any, NewType, cast, Literal
 
+import numpy as np
 import rustworkx as rx
-from geopy.distance import distance
 
-from scht_lab.cost_calc import get_cost_calc
-from scht_lab.models.flow import Flow, Selector, Treatment
+from scht_lab.cost_calc import compile_weights, get_compiled_cost, weight_key
+from scht_lab.models.graph import GraphMethod
+from scht_lab.models.flow import FlowRecord, Rule, eth_type_criterion, ip_criterion
 from scht_lab.models.stream import Priorities, Requirements, StreamType
+from scht_lab.routing.contraction import contraction_hierarchy
+from scht_lab.routing.constrained import Bounds, constrained_shortest_path
+from scht_lab.routing.graph import csr_graph
+from scht_lab.routing.heuristics import estimates
+from scht_lab.routing.k_shortest import k_shortest_paths
+from scht_lab.routing.table import routing_table
 from scht_lab.topo import Link, Location, Topology
 from rustworkx.visualization import graphviz_draw
 
-def build_graph(topo: Topology):
-    """Convert a Topology object to a rustworkx graph."""
-    graph = rx.PyGraph()
-    graph_map = {topo.locations[i]: i for i in graph.add_nodes_from(topo.locations)}
-    for link in topo.links:
-        graph.add_edge(graph_map[link.locations[0]], graph_map[link.locations[1]], link)
-    return graph, graph_map
+def build_graph(topo: Topology) -> tuple[rx.PyGraph, dict[Location, int]]:
+    """Convert a Topology object to a rustworkx graph, cached until locations or links change.
 
+    Node indices are positions in ``topo.locations``, edges are added from the link endpoint array in a single call.
+    """
+    def build() -> tuple[rx.PyGraph, dict[Location, int]]:
+        graph = rx.PyGraph()
+        graph.add_nodes_from(topo.locations)
+        endpoints = topo.metrics.endpoints
+        graph.add_edges_from(list(zip(endpoints[:, 0].tolist(), endpoints[:, 1].tolist(), topo.links, strict=True)))
+        return graph, {location: i for i, location in enumerate(topo.locations)}
+    return topo.derived(("rustworkx",), build, structural=True)
 
 
-NodePaths = NewType("NodePaths", dict[Location, dict[Location, list[Location]]])
+
+NodePaths = NewType("NodePaths", Mapping[Location, Mapping[Location, list[Location]]])
 
 def all_paths(
         graph: rx.PyGraph, graph_map: dict[Location, int], 
         priorities: Priorities, topo: Topology) -> NodePaths:
-    """Find all shortest paths between all nodes in a graph."""
-    inverse_graph_map = {v: k for k, v in graph_map.items()}
-    paths: dict[int, dict[int, list[int]]] = rx.all_pairs_dijkstra_shortest_paths(graph, get_cost_calc(priorities, None, None, topo)) # type: ignore
-    node_paths: NodePaths = {} # type: ignore
-    for node, targets in paths.items():
-        node_paths.setdefault(inverse_graph_map[node], {})
-        for target, path in targets.items():
-            node_paths[inverse_graph_map[node]][inverse_graph_map[target]] = [inverse_graph_map[i] for i in path]
-    return node_paths
-
-def cost_estimate(src: Location, dst: Location) -> float:
-    """Adjust the weight of a node for A*."""
-    return Link((src,dst), distance(src.coords, dst.coords).km).delay_calc()
-
-def cost_estimate_fn(dst: Location) -> Callable[[Location], float]:
-    """Create a cost estimate function for A*."""
-    @wraps(cost_estimate)
-    def wrapper(src: Location) -> float:
-        return cost_estimate(src, dst)
-    return wrapper
+    """Find all shortest paths between all nodes in a graph.
 
+    Paths come from the topology's routing table (see routing.table), so they're computed once per
+    topology version and each one is only rebuilt when accessed.
+    """
+    return cast(NodePaths, routing_table(topo, priorities).paths())
 
 def goal(node: Location, dst: Location) -> bool:
     """Check if a node is the goal for A*."""
@@ -70,67 +68,263 @@ def get_path(
         priorities: Priorities | None,
         requirements: Requirements | None,
         stream_type: StreamType | None = None,
+        rate: int = 0,
+        landmarks: int = 8,
+        index: bool = False,
         ) -> list[Location]:
-    """Find a shortest path between two nodes in a graph."""
+    """Find a shortest path between two nodes in a graph.
+
+    A* is guided by precomputed lower bounds in cost units: straight-line distance scaled to the cheapest
+    link cost per km, and (unless ``landmarks`` is 0) costs from that many landmarks, reused between
+    searches with the same weight profile.
+
+    With ``index``, queries are answered from a contraction hierarchy built for the weight profile
+    (and stored in the app directory), as long as every link is usable - worth it for many queries
+    with the same costs.
+    """
     inverse_graph_map = {v: k for k, v in graph_map.items()}
+    key = weight_key(priorities, requirements, stream_type, rate)
+    weights = compile_weights(topo, priorities, requirements, stream_type, rate)
+    if index and np.all(np.isfinite(weights)) and not np.any(weights < 0):
+        result = contraction_hierarchy(topo, csr_graph(topo), weights).query(topo.position(src), topo.position(dst))
+        return [topo.locations[i] for i in result[1]] if result else []
+    bounds: list[float] = estimates(topo, csr_graph(topo), weights, key, topo.position(dst), landmarks).tolist()
     path: rx.NodeIndices = rx.astar_shortest_path( # type: ignore
         graph,
         graph_map[src], 
         goal_fn(dst), 
-        get_cost_calc(priorities, requirements, stream_type, topo), 
-        cost_estimate_fn(dst),
+        get_compiled_cost(priorities, requirements, stream_type, topo, rate), 
+        lambda node: bounds[graph_map[node]],
         )
     return [inverse_graph_map[i] for i in path]
 
-def paths_to_flows(paths: NodePaths | list[Location], topo: Topology) -> list[Flow]:
-    """Convert a NodePaths object to a list of unique flows."""
+def get_constrained_path(
+        topo: Topology,
+        src: Location, dst: Location,
+        priorities: Priorities | None,
+        requirements: Requirements | None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        ) -> list[Location]:
+    """Find the cheapest path between two nodes that meets end-to-end requirements in one search.
+
+    Unlike get_path, delay, jitter and loss requirements are checked for the whole path, not per link.
+    Returns an empty list if there is no such path.
+    """
+    metrics = topo.metrics
+    requirements = requirements or Requirements()
+    bounds = Bounds(
+        delay=requirements.delay or None,
+        jitter=requirements.jitter or None,
+        loss=requirements.loss or None,
+        rate=rate if stream_type == StreamType.UDP else None,
+    )
+    result = constrained_shortest_path(
+        csr_graph(topo),
+        compile_weights(topo, priorities, requirements, stream_type, rate),
+        metrics.delay, metrics.jitter, metrics.loss, metrics.bandwidth,
+        topo.position(src), topo.position(dst),
+        bounds,
+    )
+    if result is None:
+        return []
+    return [topo.locations[i] for i in result[1]]
+
+def candidate_paths(
+        topo: Topology,
+        src: Location, dst: Location,
+        priorities: Priorities | None,
+        requirements: Requirements | None,
+        stream_type: StreamType | None = None,
+        rate: int = 0,
+        ) -> Iterator[list[Location]]:
+    """Lazily yield loopless paths between two nodes, cheapest first."""
+    weights = compile_weights(topo, priorities, requirements, stream_type, rate)
+    for _, nodes, _ in k_shortest_paths(csr_graph(topo), weights, topo.position(src), topo.position(dst)):
+        yield [topo.locations[i] for i in nodes]
+
+def paths_to_flows(paths: NodePaths | list[Location], topo: Topology, aggregate: bool = False) -> list[FlowRecord]:
+    """Convert a NodePaths object to a list of flows, optionally aggregated by destination (see aggregate_flows)."""
     if isinstance(paths, list):
         paths = cast(NodePaths, {paths[0]: {paths[-1]: paths}})
-    flows: list[Flow] = []
+    flows: list[FlowRecord] = []
     for src, targets in paths.items():
+        src_match = ip_criterion(src.ip, "SRC")
         for dst, path in targets.items():
+            criteria = (eth_type_criterion(dst.ip), ip_criterion(dst.ip, "DST"), src_match)
             for current, nexthop in pairwise(path):
-                flows.append(Flow(
-                    deviceId=current.ofname,
-                    isPermanent=True,
-                    priority=40000,
-                    timeout=0,
-                    selector=Selector(
-                        criteria=[
-                            {
-                                "type": "ETH_TYPE",
-                                "ethType": "0x800" if dst.ip.version == 4 else "0x86dd",
-                            },
-                            {
-                                "type": "IPV4_DST" if dst.ip.version == 4 else "IPV6_DST",
-                                "ip": f"{dst.ip.ip}/{dst.ip.max_prefixlen}",
-                            }, 
-                            {
-                                "type": "IPV4_SRC" if src.ip.version == 4 else "IPV6_SRC",
-                                "ip": f"{src.ip.ip}/{src.ip.max_prefixlen}",
-                            }, # type: ignore
-                        ],
-                    ),
-                    treatment=Treatment(
-                        instructions=[
-                            {
-                                "type": "OUTPUT",
-                                "port": str(topo.port_to(current, nexthop)),
-                            },
-                        ],
-                    ),
+                flows.append(FlowRecord(
+                    current.ofname,
+                    40000,
+                    criteria,
+                    ((("type", "OUTPUT"), ("port", str(topo.port_to(current, nexthop)))),),
                 ))
+    return aggregate_flows(flows) if aggregate else flows
+
+
+# EtherTypes of MPLS unicast and of IP packets carried inside
+MPLS_UNICAST = 0x8847
+IPV4 = 0x800
+IPV6 = 0x86dd
+# labels 0-15 are reserved
+FIRST_MPLS_LABEL = 16
+MAX_MPLS_LABEL = 2**20 - 1
+
+
+class LabelTable:
+    """Assigns an MPLS label to every distinct path, so streams on the same path share forwarding state."""
+    def __init__(self, first: int = FIRST_MPLS_LABEL) -> None:
+        """Start assigning labels from first."""
+        self.labels: dict[tuple[str, ...], int] = {}
+        self.next = first
+
+    def label(self, path: list[Location]) -> int:
+        """Get the label of a path, assigning a new one if it doesn't have one yet."""
+        key = tuple(location.name for location in path)
+        if key not in self.labels:
+            if self.next > MAX_MPLS_LABEL:
+                msg = "Ran out of MPLS labels"
+                raise ValueError(msg)
+            self.labels[key] = self.next
+            self.next += 1
+        return self.labels[key]
+
+
+def next_free_label(flows: Iterable[Mapping[str, Any]]) -> int:
+    """Get the first label above every label matched or pushed by flows as listed by ONOS."""
+    used = [
+        int(rule["label"])
+        for flow in flows
+        for rule in chain(flow.get("selector", {}).get("criteria", []), flow.get("treatment", {}).get("instructions", []))
+        if "label" in rule
+    ]
+    return max(used, default=FIRST_MPLS_LABEL - 1) + 1
+
+
+def mpls_flows(path: list[Location], topo: Topology, labels: LabelTable) -> list[FlowRecord]:
+    """Convert a path to a label-switched path.
+
+    The ingress switch classifies packets by source and destination address and pushes the path's label,
+    core switches forward on the label alone and the egress switch pops it and delivers to the host.
+    """
+    if len(path) < 2:
+        return []
+    src, dst = path[0], path[-1]
+    label = labels.label(path)
+    label_match = (
+        (("type", "ETH_TYPE"), ("ethType", hex(MPLS_UNICAST))),
+        (("type", "MPLS_LABEL"), ("label", label)),
+    )
+    flows = [FlowRecord(
+        src.ofname,
+        40000,
+        (eth_type_criterion(dst.ip), ip_criterion(dst.ip, "DST"), ip_criterion(src.ip, "SRC")),
+        (
+            (("type", "L2MODIFICATION"), ("subtype", "MPLS_PUSH"), ("ethernetType", MPLS_UNICAST)),
+            (("type", "L2MODIFICATION"), ("subtype", "MPLS_LABEL"), ("label", label)),
+            (("type", "OUTPUT"), ("port", str(topo.port_to(src, path[1])))),
+        ),
+    )]
+    for current, nexthop in pairwise(path[1:]):
+        flows.append(FlowRecord(
+            current.ofname,
+            40000,
+            label_match,
+            ((("type", "OUTPUT"), ("port", str(topo.port_to(current, nexthop)))),),
+        ))
+    flows.append(FlowRecord(
+        dst.ofname,
+        40000,
+        label_match,
+        (
+            (("type", "L2MODIFICATION"), ("subtype", "MPLS_POP"), ("ethernetType", IPV4 if dst.ip.version == 4 else IPV6)),
+            # hosts are always on port 1, same as in Location.endpoint_flows
+            (("type", "OUTPUT"), ("port", "1")),
+        ),
+    ))
     return flows
 
 
-class GraphMethod(str, Enum):
-    """Which layout method to use for drawing a graph."""
-    CIRCO = "circo"
-    DOT = "dot"
-    FDP = "fdp"
-    NEATO = "neato"
-    OSAGE = "osage"
-    SFDP = "sfdp"
+def _split_source(criteria: tuple[Rule, ...]) -> tuple[Rule | None, tuple[Rule, ...]]:
+    """Separate the source address match from other criteria."""
+    sources = [rule for rule in criteria if dict(rule).get("type") in ("IPV4_SRC", "IPV6_SRC")]
+    if len(sources) != 1:
+        return None, criteria
+    return sources[0], tuple(rule for rule in criteria if rule is not sources[0])
+
+
+def aggregate_flows(flows: Iterable[FlowRecord], prefixes: bool = True) -> list[FlowRecord]:
+    """Shrink flow tables by matching on destination only wherever the source doesn't matter.
+
+    On every device, flows to the same destination that only differ by source address are grouped.
+    If they all take the same action they're replaced by one destination-only flow. Otherwise the most
+    common action becomes a destination-only flow one priority lower, and source-specific flows are
+    kept only for sources that diverge from it. With prefixes, destination-only flows with the same
+    action are then merged into the smallest set of prefixes covering exactly the same addresses.
+    """
+    result: list[FlowRecord] = []
+    groups: dict[tuple[str, int, tuple[Rule, ...]], list[FlowRecord]] = {}
+    for flow in flows:
+        source, rest = _split_source(flow.criteria)
+        if source is None:
+            result.append(flow)
+        else:
+            groups.setdefault((flow.device_id, flow.priority, rest), []).append(flow)
+
+    destination_only: list[FlowRecord] = []
+    for (device, priority, criteria), group in groups.items():
+        actions = Counter(flow.instructions for flow in group)
+        common, _ = actions.most_common(1)[0]
+        if len(actions) == 1:
+            destination_only.append(FlowRecord(device, priority, criteria, common, group[0].timeout, group[0].permanent))
+            continue
+        destination_only.append(FlowRecord(device, priority - 1, criteria, common, group[0].timeout, group[0].permanent))
+        result.extend(flow for flow in group if flow.instructions != common)
+
+    # flows already matching on destination only can be merged with the aggregated ones
+    kept = []
+    for flow in result:
+        (destination_only if _destination(flow.criteria) is not None else kept).append(flow)
+    if not prefixes:
+        return list(dict.fromkeys(kept + destination_only))
+    return list(dict.fromkeys(kept + _merge_prefixes(destination_only)))
+
+
+def _destination(criteria: tuple[Rule, ...]) -> tuple[int, Rule] | None:
+    """Find the destination address match of destination-only criteria, with its position."""
+    found = None
+    for i, rule in enumerate(criteria):
+        kind = dict(rule).get("type")
+        if kind in ("IPV4_SRC", "IPV6_SRC"):
+            return None
+        if kind in ("IPV4_DST", "IPV6_DST"):
+            found = (i, rule)
+    return found
+
+
+def _merge_prefixes(flows: list[FlowRecord]) -> list[FlowRecord]:
+    """Merge destination-only flows with the same action into covering prefixes."""
+    merged: list[FlowRecord] = []
+    groups: dict[tuple, list[tuple[FlowRecord, Rule]]] = {}
+    for flow in flows:
+        found = _destination(flow.criteria)
+        if found is None:
+            merged.append(flow)
+            continue
+        i, rule = found
+        template = flow.criteria[:i] + (None,) + flow.criteria[i+1:]
+        key = (flow.device_id, flow.priority, flow.instructions, flow.timeout, flow.permanent, dict(rule)["type"], template)
+        groups.setdefault(key, []).append((flow, rule))
+    for (device, priority, instructions, timeout, permanent, kind, template), group in groups.items():
+        if len(group) == 1:
+            merged.append(group[0][0])
+            continue
+        networks = collapse_addresses(ip_network(dict(rule)["ip"], strict=False) for _, rule in group) # type: ignore
+        for network in networks:
+            criteria = tuple((("type", kind), ("ip", str(network))) if rule is None else rule for rule in template)
+            merged.append(FlowRecord(device, priority, criteria, instructions, timeout, permanent))
+    return merged
+
 
 def draw_graph(graph: rx.PyGraph, filename: str | Path | None, show: bool = False, method: GraphMethod = GraphMethod.CIRCO):
     """Draw a graph using graphviz."""
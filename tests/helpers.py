@@ -0,0 +1,44 @@
+"""Shared setup of the tests: seeded generated topologies and path checks."""
+import asyncio
+from itertools import pairwise
+
+import rustworkx as rx
+
+from scht_lab.benchmarks.generators import generate_topology
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.graph import CSRGraph
+from scht_lab.topo import Topology, load_topology
+from scht_lab.topo_graph import build_graph
+
+SEEDS = [0, 1, 2]
+# jitter can be negative, so profiles weighing it aren't searchable by Dijkstra
+PROFILES = [
+    None,
+    Priorities(),
+    Priorities(delay=1.0, bandwidth=2.0, loss=1.0),
+]
+
+
+def generated(cities: int, seed: int) -> Topology:
+    """Load a generated topology (with inline coordinates, so nothing is geocoded)."""
+    return asyncio.run(load_topology(generate_topology(cities, seed))) # type: ignore[arg-type]
+
+
+def path_cost(graph: CSRGraph, weights: list[float], source: int, target: int, nodes: list[int], edges: list[int]) -> float:
+    """Check that nodes and edges form a source-target path and get its cost."""
+    assert nodes[0] == source
+    assert nodes[-1] == target
+    assert len(edges) == len(nodes) - 1
+    for (a, b), edge in zip(pairwise(nodes), edges, strict=True):
+        assert graph.other_end(edge, a) == b
+    return sum(weights[edge] for edge in edges)
+
+
+def simple_paths(topo: Topology, source: int, target: int) -> list[list[int]]:
+    """Edges of every loopless path between two nodes (small topologies only)."""
+    graph, _ = build_graph(topo)
+    edge_ids = {frozenset((int(a), int(b))): edge for edge, (a, b) in enumerate(topo.metrics.endpoints.tolist())}
+    return [
+        [edge_ids[frozenset(pair)] for pair in pairwise(nodes)]
+        for nodes in rx.all_simple_paths(graph, source, target)
+    ]
@@ -0,0 +1,59 @@
+"""Bulk flow deletion: chunking, requests in flight and rejected chunks, against the in-process fake controller."""
+import asyncio
+from math import ceil
+
+import pytest
+from aiohttp import ClientResponseError
+
+from scht_lab.benchmarks.fake_onos import FakeConfig, FakeOnos
+from scht_lab.benchmarks.onos import make_flows
+from scht_lab.client import APP_ID, delete_flows, get_client, iter_flows, reconcile_flows
+from scht_lab.limits import CHUNK_SIZE, CONCURRENCY
+
+DEVICES = 20
+DEVICE_IDS = [f"of:{hex(device + 1)[2:].zfill(16)}" for device in range(DEVICES)]
+FLOWS = 1200
+DELETE = "DELETE /onos/v1/flows"
+
+
+@pytest.mark.parametrize("concurrency", [1, CONCURRENCY])
+def test_delete_flows_limits_requests_in_flight(concurrency: int):
+    flows = make_flows(FLOWS, DEVICES)
+
+    async def run() -> None:
+        # latency keeps requests open long enough to overlap
+        async with FakeOnos(DEVICE_IDS, FakeConfig(latency=0.01)) as onos:
+            for flow in flows:
+                onos.add_flow(flow.device_id, APP_ID, flow.to_onos())
+            ctx = onos.context()
+            async with get_client(ctx):
+                installed = [{"deviceId": flow["deviceId"], "flowId": flow["id"]} async for flow in iter_flows(ctx, app_id=APP_ID)]
+                assert len(installed) == FLOWS
+                onos.stats.reset()
+                result = await delete_flows(ctx, installed, 100, concurrency)
+            assert result.done == FLOWS
+            assert not result.failed
+            assert onos.flow_count == 0
+            assert onos.stats.requests[DELETE] == ceil(FLOWS/100)
+            assert max(onos.stats.batches) <= 100
+            assert onos.stats.max_in_flight == concurrency
+    asyncio.run(run())
+
+
+def test_delete_flows_counts_rejected_chunks():
+    flows = make_flows(300, DEVICES)
+
+    async def run() -> None:
+        async with FakeOnos(DEVICE_IDS, FakeConfig(max_batch=100)) as onos:
+            for flow in flows:
+                onos.add_flow(flow.device_id, APP_ID, flow.to_onos())
+            ctx = onos.context()
+            async with get_client(ctx):
+                installed = [{"deviceId": flow["deviceId"], "flowId": flow["id"]} async for flow in iter_flows(ctx, app_id=APP_ID)]
+                result = await delete_flows(ctx, installed, 200, CONCURRENCY)
+                assert (result.done, result.failed) == (100, 200)
+                assert onos.stats.rejected == 1
+                assert onos.flow_count == 200
+                with pytest.raises(ClientResponseError):
+                    await reconcile_flows(ctx, [], chunk_size=200)
+    asyncio.run(run())
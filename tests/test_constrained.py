@@ -0,0 +1,61 @@
+"""Constrained cheapest paths against every simple path of small generated topologies."""
+from math import inf, isclose, prod
+
+import numpy as np
+import pytest
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.constrained import Bounds, constrained_shortest_path
+from scht_lab.routing.graph import csr_graph, dijkstra
+from scht_lab.routing.k_shortest import k_shortest_paths
+from tests.helpers import SEEDS, generated, path_cost, simple_paths
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_constrained_path_matches_brute_force(seed: int):
+    topo = generated(10, seed)
+    graph = csr_graph(topo)
+    metrics = topo.metrics
+    # costs that don't follow delay, so delay bounds rule out the cheapest paths
+    weights = compile_weights(topo, Priorities(delay=None, bandwidth=1.0))
+    costs = weights.tolist()
+    delays, losses = metrics.delay.tolist(), metrics.loss.tolist()
+    for source, target in [(0, 9), (3, 7), (5, 1)]:
+        paths = simple_paths(topo, source, target)
+        path_delays = sorted(sum(delays[edge] for edge in edges) for edges in paths)
+        # unbounded, then bounds that rule out some of the cheaper paths
+        for bounds in (Bounds(), Bounds(delay=path_delays[len(path_delays)//3]), Bounds(delay=path_delays[0], loss=0.5)):
+            allowed = [
+                sum(costs[edge] for edge in edges) for edges in paths
+                if (bounds.delay is None or sum(delays[edge] for edge in edges) <= bounds.delay) and
+                (bounds.loss is None or 1 - prod(1 - losses[edge] for edge in edges) <= bounds.loss)
+            ]
+            result = constrained_shortest_path(
+                graph, weights, metrics.delay, metrics.jitter, metrics.loss, metrics.bandwidth, source, target, bounds,
+            )
+            if not allowed:
+                assert result is None
+                continue
+            assert result is not None
+            cost, nodes, edges = result
+            assert isclose(cost, min(allowed), rel_tol=1e-9)
+            assert isclose(path_cost(graph, costs, source, target, nodes, edges), cost, rel_tol=1e-9)
+            if bounds == Bounds():
+                assert isclose(cost, dijkstra(graph, costs, source, target)[0][target], rel_tol=1e-9)
+
+
+def test_unreachable_targets_agree():
+    topo = generated(20, 0)
+    graph = csr_graph(topo)
+    weights = np.asarray(compile_weights(topo, Priorities()), dtype=float).copy()
+    # cut node 0 off completely
+    for _, edge in graph.neighbors(0):
+        weights[edge] = inf
+    costs = weights.tolist()
+    assert dijkstra(graph, costs, 1)[0][0] == inf
+    assert next(k_shortest_paths(graph, weights, 1, 0), None) is None
+    metrics = topo.metrics
+    assert constrained_shortest_path(
+        graph, weights, metrics.delay, metrics.jitter, metrics.loss, metrics.bandwidth, 1, 0, Bounds(),
+    ) is None
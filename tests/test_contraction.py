@@ -0,0 +1,40 @@
+"""Contraction hierarchy queries against plain Dijkstra on seeded generated topologies."""
+from math import isclose
+
+import pytest
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.contraction import ContractionHierarchy, contraction_hierarchy, prune_indexes
+from scht_lab.routing.graph import csr_graph, dijkstra
+from tests.helpers import PROFILES, SEEDS, generated, path_cost
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("priorities", PROFILES)
+def test_contraction_hierarchy_matches_dijkstra(seed: int, priorities: Priorities | None, tmp_path):
+    topo = generated(60, seed)
+    graph = csr_graph(topo)
+    weights = compile_weights(topo, priorities)
+    costs = weights.tolist()
+    built = ContractionHierarchy.build(graph, weights)
+    built.save(tmp_path / "ch.npz")
+    for hierarchy in (built, ContractionHierarchy.load(tmp_path / "ch.npz")):
+        for source in range(0, graph.node_count, 7):
+            dist, _ = dijkstra(graph, costs, source)
+            for target in range(graph.node_count):
+                result = hierarchy.query(source, target)
+                assert result is not None
+                cost, nodes, edges = result
+                assert isclose(cost, dist[target], rel_tol=1e-9, abs_tol=1e-12)
+                assert isclose(path_cost(graph, costs, source, target, nodes, edges), dist[target], rel_tol=1e-9, abs_tol=1e-12)
+
+
+def test_stored_indexes_are_pruned(tmp_path):
+    topo = generated(20, 0)
+    graph = csr_graph(topo)
+    for bandwidth in range(1, 5):
+        contraction_hierarchy(topo, graph, compile_weights(topo, Priorities(bandwidth=float(bandwidth))), tmp_path)
+    assert len(list(tmp_path.glob("ch-*.npz"))) == 4
+    prune_indexes(tmp_path, keep=2)
+    assert len(list(tmp_path.glob("ch-*.npz"))) == 2
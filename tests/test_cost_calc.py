@@ -0,0 +1,20 @@
+"""Compiled link costs against per-link cost calculation."""
+from math import isclose
+
+from scht_lab.cost_calc import compile_weights, cost_calc, get_compiled_cost
+from scht_lab.models.stream import Priorities
+from tests.helpers import generated
+
+
+def test_compiled_cost_follows_changes():
+    topo = generated(30, 0)
+    priorities = Priorities(congestion=1.0)
+    cost = get_compiled_cost(priorities, None, None, topo)
+    assert [cost(link) for link in topo.links] == compile_weights(topo, priorities).tolist()
+    link = topo.links[0]
+    link.utilization = link.bandwidth_calc()/2
+    # functions got earlier keep the costs they were created with, new ones see the change
+    updated = get_compiled_cost(priorities, None, None, topo)
+    assert updated(link) > cost(link)
+    for link in topo.links:
+        assert isclose(updated(link), cost_calc(link, priorities, None, None, topo), rel_tol=1e-9)
@@ -0,0 +1,105 @@
+"""Re-routing of admitted streams as link utilization changes."""
+from collections.abc import Hashable
+
+import numpy as np
+import pytest
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities, StreamType
+from scht_lab.routing.dynamic import DynamicRouter
+from scht_lab.routing.graph import ShortestPathTree, csr_graph, dijkstra, trace
+from scht_lab.topo import Link, Location, Topology
+from tests.helpers import SEEDS, generated, path_cost
+
+PRIORITIES = Priorities(delay=1.0, bandwidth=1.0, congestion=100.0)
+
+
+def admit(topo: Topology, router: DynamicRouter, source: int, target: int) -> tuple[list[int], int]:
+    """Admit a stream on its cheapest path, returning the path's edges and one of them with a detour around it."""
+    graph = csr_graph(topo)
+    costs = compile_weights(topo, PRIORITIES, None, StreamType.TCP, 10).tolist()
+    nodes, edges = trace(graph, dijkstra(graph, costs, source)[1], source, target) # type: ignore[misc]
+    router.add("stream", [topo.locations[node] for node in nodes], PRIORITIES, None, StreamType.TCP, 10)
+    for edge in edges:
+        detour = list(costs)
+        detour[edge] = np.inf
+        if dijkstra(graph, detour, source, target)[0][target] < np.inf:
+            return edges, edge
+    pytest.fail("Every link of the path is a bridge")
+
+
+def congest(topo: Topology, edge: int) -> None:
+    topo.links[edge].utilization = float(topo.metrics.bandwidth[edge])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_tree_updates_match_dijkstra(seed: int):
+    topo = generated(80, seed)
+    graph = csr_graph(topo)
+    costs = compile_weights(topo, Priorities()).tolist()
+    tree = ShortestPathTree(graph, costs, seed)
+    rng = np.random.default_rng(seed)
+    for step in range(30):
+        edges = rng.choice(graph.edge_count, 5, replace=False).tolist()
+        # increases, decreases, both at once, links cut off and restored
+        factors = {0: rng.uniform(1.5, 5.0, 5), 1: rng.uniform(0.1, 0.7, 5), 2: rng.uniform(0.1, 5.0, 5)}[step % 3]
+        changes = {edge: costs[edge]*factor for edge, factor in zip(edges, factors.tolist(), strict=True)}
+        if step % 7 == 0:
+            changes[edges[0]] = np.inf
+        if step % 7 == 1:
+            changes[edges[0]] = 0.0
+        for changed, cost in changes.items():
+            costs[changed] = cost
+        tree.update(changes)
+        dist, _ = dijkstra(graph, costs, seed)
+        assert np.allclose(tree.dist, dist, rtol=1e-9)
+        for target in range(graph.node_count):
+            found = tree.path(target)
+            if dist[target] == np.inf:
+                assert found is None
+            else:
+                assert found is not None
+                assert np.isclose(path_cost(graph, costs, seed, target, *found), dist[target], rtol=1e-9)
+
+
+def test_congested_link_moves_stream():
+    topo = generated(30, 0)
+    router = DynamicRouter(topo)
+    edges, edge = admit(topo, router, 0, 29)
+    assert router.update() == set()
+    congest(topo, edge)
+    assert router.update() == {"stream"}
+    stream = router.streams["stream"]
+    assert edge not in stream.edges
+    # the stream's load moved along with it
+    utilization = topo.metrics.utilization
+    assert all(utilization[old] == 0 for old in set(edges) - set(stream.edges) - {edge})
+    assert all(utilization[new] > 0 for new in stream.edges)
+    # and it now takes the cheapest path as it sees the links (without its own load)
+    assert np.isclose(stream.cost, stream.tree.dist[29], rtol=1e-9) # type: ignore[union-attr]
+    router.close()
+
+
+def test_rejected_move_changes_nothing():
+    topo = generated(30, 0)
+    offers: list[list[Link]] = []
+    def reject(key: Hashable, path: list[Location], links: list[Link]) -> bool:
+        offers.append(links)
+        return False
+    router = DynamicRouter(topo, reject)
+    edges, edge = admit(topo, router, 0, 29)
+    congest(topo, edge)
+    utilization = topo.metrics.utilization.copy()
+    assert router.update() == set()
+    assert router.streams["stream"].edges == edges
+    assert np.array_equal(topo.metrics.utilization, utilization)
+    assert len(offers) == 1
+    # nothing changed, so the same path isn't offered again
+    assert router.update() == set()
+    assert len(offers) == 1
+    # until its costs do
+    detour = next(link for link in offers[0] if link.id not in edges)
+    detour.utilization += 0.01*detour.bandwidth_calc()
+    assert router.update() == set()
+    assert len(offers) == 2
+    router.close()
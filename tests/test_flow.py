@@ -0,0 +1,39 @@
+"""Compact flow records against the validated Flow model and ONOS JSON."""
+import json
+
+from scht_lab.models.flow import Flow, FlowRecord, dump_flows, flow_key
+from scht_lab.routing.table import routing_table
+from scht_lab.topo_graph import LabelTable, mpls_flows, paths_to_flows
+from tests.helpers import generated
+
+
+def records() -> list[FlowRecord]:
+    topo = generated(10, 0)
+    paths = routing_table(topo, None).paths()
+    labels = LabelTable()
+    flows = {
+        *paths_to_flows(paths, topo), # type: ignore[arg-type]
+        *(flow for location in topo.locations for flow in location.endpoint_flows()),
+        *(flow for targets in paths.values() for path in targets.values() for flow in mpls_flows(path, topo, labels)),
+    }
+    return sorted(flows, key=lambda flow: flow.to_json())
+
+
+def test_dump_round_trip():
+    # plain, endpoint and label-switched flows
+    for record in records():
+        flow = Flow.model_validate(json.loads(dump_flows([record]))["flows"][0])
+        assert flow_key(flow) == flow_key(record), record
+        copy = FlowRecord.from_model(flow)
+        assert copy == record
+        assert hash(copy) == hash(record)
+
+
+def test_equal_records_hash_equal():
+    first, second = records(), records()
+    assert all(a is not b and a == b and hash(a) == hash(b) for a, b in zip(first, second, strict=True))
+    assert len({*first, *second}) == len(first)
+    record = first[0]
+    changed = FlowRecord(record.device_id, record.priority + 1, record.criteria, record.instructions)
+    assert changed != record
+    assert flow_key(changed) != flow_key(record)
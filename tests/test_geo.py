@@ -0,0 +1,177 @@
+"""Hedged geocoding against local geocoding servers, and the coordinate store."""
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from time import monotonic
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from geopy.exc import GeocoderServiceError
+from geopy.geocoders import Photon
+from geopy.location import Location as GeoLocation
+
+from scht_lab.geo import Coordinates, GeoStore, HedgedGeocoder, Provider, TokenBucket, geocode_all
+
+
+class FakeGeocoder:
+    """Photon-like geocoding service knowing a few places, optionally slow or failing for some of them."""
+    def __init__(self, places: dict[str, Coordinates], slow: dict[str, float] | None = None, failing: set[str] | None = None) -> None:
+        self.places = places
+        self.slow = slow or {}
+        self.failing = failing or set()
+        self.requests: list[tuple[str, float]] = []
+        self.app = web.Application()
+        self.app.add_routes([web.get("/api", self.api)])
+
+    async def api(self, request: web.Request) -> web.Response:
+        name = request.query["q"]
+        self.requests.append((name, monotonic()))
+        await asyncio.sleep(self.slow.get(name, 0))
+        if name in self.failing:
+            raise web.HTTPInternalServerError
+        features = []
+        if name in self.places:
+            lat, lon = self.places[name]
+            features.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": {"name": name}})
+        return web.json_response({"type": "FeatureCollection", "features": features})
+
+
+@asynccontextmanager
+async def providers(*services: FakeGeocoder, rate: float = 100) -> AsyncIterator[list[Provider]]:
+    async with AsyncExitStack() as stack:
+        servers = [await stack.enter_async_context(TestServer(service.app)) for service in services]
+        yield [Provider(Photon, rate, options={"domain": f"127.0.0.1:{server.port}", "scheme": "http"}) for server in servers]
+
+
+def test_slow_provider_is_hedged():
+    first = FakeGeocoder({"Kraków": (50.06, 19.94)}, slow={"Kraków": 5})
+    second = FakeGeocoder({"Kraków": (50.0, 20.0)})
+
+    async def run() -> None:
+        async with providers(first, second) as configured, HedgedGeocoder(configured, hedge_after=0.1) as geocoder:
+            start = monotonic()
+            found = await geocoder.geocode("Kraków")
+            assert monotonic() - start < 2
+        assert found is not None
+        assert (found.latitude, found.longitude) == (50.0, 20.0)
+        assert [name for name, _ in first.requests] == [name for name, _ in second.requests] == ["Kraków"]
+        # the second provider was only asked once the first kept it waiting
+        assert second.requests[0][1] - first.requests[0][1] >= 0.1
+    asyncio.run(run())
+
+
+def test_answered_lookups_are_not_hedged():
+    first = FakeGeocoder({"Kraków": (50.06, 19.94)})
+    second = FakeGeocoder({"Kraków": (50.0, 20.0)})
+
+    async def run() -> None:
+        async with providers(first, second) as configured, HedgedGeocoder(configured, hedge_after=5) as geocoder:
+            found = await geocoder.geocode("Kraków")
+        assert found is not None
+        assert (found.latitude, found.longitude) == (50.06, 19.94)
+        assert not second.requests
+    asyncio.run(run())
+
+
+def test_place_nobody_knows_is_not_found():
+    services = [FakeGeocoder({}), FakeGeocoder({})]
+
+    async def run() -> None:
+        async with providers(*services) as configured, HedgedGeocoder(configured, hedge_after=5) as geocoder:
+            assert await geocoder.geocode("Atlantyda") is None
+        assert all(len(service.requests) == 1 for service in services)
+    asyncio.run(run())
+
+
+def test_failed_provider_makes_lookup_fail():
+    services = [FakeGeocoder({}, failing={"Atlantyda"}), FakeGeocoder({})]
+
+    async def run() -> None:
+        async with providers(*services) as configured, HedgedGeocoder(configured, hedge_after=5) as geocoder:
+            # the second provider not knowing the place doesn't mean the first wouldn't have
+            with pytest.raises(GeocoderServiceError):
+                await geocoder.geocode("Atlantyda")
+            # any provider finding the place is enough
+            services[1].places["Atlantyda"] = (0.0, 0.0)
+            assert await geocoder.geocode("Atlantyda") is not None
+    asyncio.run(run())
+
+
+def test_provider_rate_is_kept():
+    rate = 20
+    service = FakeGeocoder({})
+
+    async def run() -> None:
+        async with providers(service, rate=rate) as configured, HedgedGeocoder(configured) as geocoder:
+            await asyncio.gather(*(geocoder.geocode(f"Miasto {i}") for i in range(6)))
+    asyncio.run(run())
+    times = sorted(time for _, time in service.requests)
+    assert len(times) == 6
+    # the first request uses the initial token, every later one waits for a new token
+    assert all(later - earlier >= 0.8/rate for earlier, later in zip(times, times[1:]))
+
+
+def test_token_bucket_allows_bursts():
+    async def run() -> list[float]:
+        bucket = TokenBucket(rate=10, burst=3)
+        start = monotonic()
+        times = []
+        for _ in range(5):
+            await bucket.acquire()
+            times.append(monotonic() - start)
+        return times
+    times = asyncio.run(run())
+    assert times[2] < 0.05
+    assert times[3] >= 0.09
+    assert times[4] - times[3] >= 0.09
+
+
+class StubGeocoder:
+    """Geocoder answering from a dict, failing for some places."""
+    def __init__(self, places: dict[str, Coordinates], failing: set[str] | None = None) -> None:
+        self.places = places
+        self.failing = failing or set()
+        self.asked: list[str] = []
+
+    async def geocode(self, name: str) -> GeoLocation | None:
+        self.asked.append(name)
+        if name in self.failing:
+            raise GeocoderServiceError(f"{name} failed")
+        return GeoLocation(name, self.places[name], {}) if name in self.places else None
+
+
+def test_geocode_all_stores_results(tmp_path):
+    names = ["Kraków", "Atlantyda", "Gdańsk", "Kraków"]
+    with GeoStore(tmp_path / "geo.sqlite") as store:
+        geocoder = StubGeocoder({"Kraków": (50.06, 19.94), "Gdańsk": (54.35, 18.65)}, failing={"Gdańsk"})
+        found = asyncio.run(geocode_all(names, store, geocoder)) # type: ignore[arg-type]
+        assert found == {"Kraków": (50.06, 19.94), "Atlantyda": None, "Gdańsk": None}
+        assert sorted(geocoder.asked) == ["Atlantyda", "Gdańsk", "Kraków"]
+        # the place nobody found is remembered, the failed lookup isn't
+        assert store.get_many(names) == {"Kraków": (50.06, 19.94), "Atlantyda": None}
+
+    with GeoStore(tmp_path / "geo.sqlite") as store:
+        geocoder.failing = set()
+        geocoder.asked = []
+        found = asyncio.run(geocode_all(names, store, geocoder)) # type: ignore[arg-type]
+        assert found == {"Kraków": (50.06, 19.94), "Atlantyda": None, "Gdańsk": (54.35, 18.65)}
+        assert geocoder.asked == ["Gdańsk"]
+
+        geocoder.places["Atlantyda"] = (0.5, 0.5)
+        geocoder.asked = []
+        assert asyncio.run(geocode_all(names, store, geocoder))["Atlantyda"] is None # type: ignore[arg-type]
+        assert geocoder.asked == []
+        assert asyncio.run(geocode_all(names, store, geocoder, retry_missing=True))["Atlantyda"] == (0.5, 0.5) # type: ignore[arg-type]
+        assert geocoder.asked == ["Atlantyda"]
+        assert store.get_many(["Atlantyda"]) == {"Atlantyda": (0.5, 0.5)}
+
+
+def test_store_reads_many_places(tmp_path):
+    # more names than SQLite takes parameters in one query
+    places = {f"Miasto {i}": GeoLocation(f"Miasto {i}", (i/1000, -i/1000), {}) for i in range(2500)}
+    with GeoStore(tmp_path / "geo.sqlite") as store:
+        store.put_many(places)
+        stored = store.get_many([*places, "Atlantyda"])
+    assert len(stored) == len(places)
+    assert stored["Miasto 1999"] == (1.999, -1.999)
@@ -0,0 +1,52 @@
+"""A* lower bounds and the paths they guide, against plain Dijkstra."""
+from itertools import pairwise
+from math import isclose
+
+import numpy as np
+import pytest
+
+from scht_lab.cost_calc import compile_weights, weight_key
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.graph import csr_graph, dijkstra
+from scht_lab.routing.heuristics import GeoHeuristic, LandmarkTable, estimates
+from scht_lab.topo_graph import build_graph, get_path
+from tests.helpers import PROFILES, SEEDS, generated
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("priorities", PROFILES)
+def test_estimates_are_lower_bounds(seed: int, priorities: Priorities | None):
+    topo = generated(60, seed)
+    graph = csr_graph(topo)
+    weights = compile_weights(topo, priorities)
+    geo = GeoHeuristic(topo, weights)
+    landmarks = LandmarkTable(graph, weights)
+    assert geo.scale > 0
+    for target in range(0, graph.node_count, 5):
+        exact = np.array(dijkstra(graph, weights.tolist(), target)[0])
+        for bound in (geo.estimate(target), landmarks.estimate(target)):
+            assert np.all(bound <= exact*(1 + 1e-9))
+        # landmarks know their own distances exactly
+        for landmark, row in zip(landmarks.landmarks, landmarks.distances, strict=True):
+            assert isclose(landmarks.estimate(target)[landmark], row[target], rel_tol=1e-9)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("landmarks", [0, 8])
+def test_get_path_finds_cheapest_paths(seed: int, landmarks: int):
+    topo = generated(60, seed)
+    graph, graph_map = build_graph(topo)
+    csr = csr_graph(topo)
+    priorities = Priorities()
+    weights = compile_weights(topo, priorities)
+    costs = weights.tolist()
+    rng = np.random.default_rng(seed)
+    for source, target in rng.choice(len(topo.locations), (20, 2)).tolist():
+        src, dst = topo.locations[source], topo.locations[target]
+        path = get_path(graph, graph_map, topo, src, dst, priorities, None, landmarks=landmarks)
+        assert path[0] is src
+        assert path[-1] is dst
+        cost = sum(costs[topo.get_link(a, b).id] for a, b in pairwise(path)) # type: ignore[union-attr,index]
+        exact = dijkstra(csr, costs, target)[0]
+        assert isclose(cost, exact[source], rel_tol=1e-9)
+        assert np.all(estimates(topo, csr, weights, weight_key(priorities), target, landmarks) <= np.array(exact)*(1 + 1e-9))
@@ -0,0 +1,82 @@
+"""Incremental JSON decoding, fed the same documents in chunks of every size."""
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+
+from scht_lab.helpers.json_stream import ItemDecoder, iter_json_array
+
+ITEMS: list[Any] = [
+    12345,
+    -1.5e10,
+    0.25,
+    {"deviceId": "of:0000000000000001", "name": "Zażółć gęślą jaźń 🚀", "ports": [1, 2]},
+    "flows",
+    {"flows": "not the array", "nested": {"flows": [0]}},
+    [],
+    None,
+    True,
+    7,
+]
+# the key also appears as a string value before the array
+DOCUMENT = json.dumps({"name": "flows", "flows": ITEMS, "after": [1]}, ensure_ascii=False, indent=1).encode()
+
+
+def chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+async def arrive(chunks: list[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+def parse_array(data: bytes, size: int, key: str = "flows") -> list[Any]:
+    async def run() -> list[Any]:
+        return [item async for item in iter_json_array(arrive(chunked(data, size)), key)]
+    return asyncio.run(run())
+
+
+def decode(text: str, size: int, closing: str | None) -> list[tuple[int, Any]]:
+    decoder = ItemDecoder(closing)
+    items = []
+    for i in range(0, len(text), size):
+        decoder.feed(text[i:i + size])
+        items.extend(decoder.items())
+    items.extend(decoder.items(final=True))
+    return items
+
+
+def test_array_items_in_any_chunks():
+    # small chunks split numbers, keys and multibyte characters, up to the whole document in one
+    for size in range(1, len(DOCUMENT) + 1):
+        assert parse_array(DOCUMENT, size) == ITEMS, size
+        assert parse_array(DOCUMENT, size, "after") == [1], size
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+@pytest.mark.parametrize(("document", "error"), [
+    (b'{"name": "flows", "other": [1, 2]}', "No \"flows\" array"),
+    (b'{"flows": {"a": 1}}', "not an array"),
+    (b'{"flows": [1, 2', "missing ]"),
+    (b'{"flows": [1, {"a": 2', "Line 1"),
+    (b'{"flows": [1, 2,\n 3 4 x]}', "Line 2"),
+])
+def test_array_errors(size: int, document: bytes, error: str):
+    with pytest.raises(ValueError, match=error):
+        parse_array(document, size)
+
+
+@pytest.mark.parametrize("size", range(1, 12))
+def test_lines_with_line_numbers(size: int):
+    text = '1\n{"a": "ż"}\n\n[1,\n 2]\n-0.5e3\n"x"'
+    assert decode(text, size, None) == [(1, 1), (2, {"a": "ż"}), (4, [1, 2]), (6, -500.0), (7, "x")]
+
+
+@pytest.mark.parametrize("size", [1, 5, 100])
+def test_decoder_stops_at_closing(size: int):
+    assert decode('1, 2 ]\n{"ignored"', size, "]") == [(1, 1), (1, 2)]
+    with pytest.raises(ValueError, match="Line 2: Unexpected end of JSON, missing ]"):
+        decode("1, 2\n", size, "]")
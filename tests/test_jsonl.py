@@ -0,0 +1,58 @@
+"""Stream files as JSON lines, arrays and keyed documents, read item by item."""
+import io
+import json
+
+import pytest
+from typer import Exit
+
+from scht_lab.cli.paths import read_streams
+from scht_lab.helpers.jsonl import iter_json_items, iter_streams
+
+ITEMS = [{"src": "Gdańsk", "n": 1}, {"src": "Kraków", "n": 2.5}, {"src": "Łódź", "n": [3]}]
+STREAM = {"src": "Warszawa", "dst": "Kraków", "type": "UDP", "rate": 10, "requirements": None, "priorities": None}
+
+LINES = [json.dumps(item, ensure_ascii=False) for item in ITEMS]
+# one item per line, so their line numbers are known
+DOCUMENTS = {
+    "lines": "\n".join(LINES) + "\n",
+    "array": "[\n" + ",\n".join(LINES) + "\n]",
+    "keyed": '{"streams": [\n' + ",\n".join(LINES) + "\n]}",
+    "schema": '{\n "$schema": "https://example.com/streams.json",\n "streams": [\n' + ",\n".join(LINES) + "\n]\n}",
+}
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 64*1024])
+@pytest.mark.parametrize("kind", DOCUMENTS)
+def test_documents_are_detected(kind: str, size: int):
+    document = DOCUMENTS[kind]
+    items = list(iter_json_items(io.StringIO(document), "streams", size))
+    assert [item for _, item in items] == ITEMS
+    lines = document.splitlines()
+    assert [lines[line - 1].rstrip(",") for line, _ in items] == LINES
+
+
+@pytest.mark.parametrize("document", ["", " \n\n", "[]", '{"streams": []}'])
+def test_empty_documents(document: str):
+    assert list(iter_json_items(io.StringIO(document), "streams")) == []
+
+
+def test_unknown_document():
+    with pytest.raises(ValueError, match="Line 3: Expected JSON lines"):
+        list(iter_json_items(io.StringIO('\n\n"streams"'), "streams"))
+
+
+def test_invalid_stream_reports_its_line(tmp_path, capsys: pytest.CaptureFixture[str]):
+    invalid = {**STREAM, "rate": "fast"}
+    text = "\n".join(json.dumps(stream) for stream in [STREAM, STREAM, invalid, STREAM])
+    streams = iter_streams(io.StringIO(text))
+    assert [next(streams).rate, next(streams).rate] == [10, 10]
+    with pytest.raises(ValueError, match="Line 3: invalid stream"):
+        next(streams)
+
+    path = tmp_path / "streams.json"
+    path.write_text(json.dumps({"streams": [STREAM, invalid]}, indent=1))
+    streams = read_streams(path)
+    assert next(streams).src == "Warszawa"
+    with pytest.raises(Exit):
+        next(streams)
+    assert "Line 11: invalid stream" in capsys.readouterr().out
@@ -0,0 +1,28 @@
+"""K shortest loopless paths against every simple path of small generated topologies."""
+from math import isclose
+
+import pytest
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.graph import csr_graph, dijkstra
+from scht_lab.routing.k_shortest import k_shortest_paths
+from tests.helpers import SEEDS, generated, path_cost, simple_paths
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_k_shortest_paths_match_brute_force(seed: int):
+    topo = generated(10, seed)
+    graph = csr_graph(topo)
+    weights = compile_weights(topo, Priorities())
+    costs = weights.tolist()
+    for source, target in [(0, 9), (3, 7), (5, 1)]:
+        expected = sorted(sum(costs[edge] for edge in edges) for edges in simple_paths(topo, source, target))
+        found = list(k_shortest_paths(graph, weights, source, target))
+        assert len(found) == len(expected)
+        assert isclose(found[0][0], dijkstra(graph, costs, source, target)[0][target], rel_tol=1e-9)
+        assert len({tuple(edges) for _, _, edges in found}) == len(found)
+        for (cost, nodes, edges), best in zip(found, expected, strict=True):
+            assert len(set(nodes)) == len(nodes)
+            assert isclose(cost, path_cost(graph, costs, source, target, nodes, edges), rel_tol=1e-9)
+            assert isclose(cost, best, rel_tol=1e-9)
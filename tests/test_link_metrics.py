@@ -0,0 +1,133 @@
+"""Vectorized link metrics against the per-link formulas they replaced, and their incremental aggregates."""
+import warnings
+from math import inf, isclose, log, sqrt
+
+import numpy as np
+import pytest
+
+from scht_lab.link_metrics import Aggregate
+from scht_lab.topo import Link, Location, Topology
+from tests.helpers import SEEDS, generated
+
+
+def scalar_metrics(link: Link) -> dict[str, float]:
+    """Metrics of a link computed one at a time, as Link did before they were stored in columns."""
+    a, b = link.locations
+    distance = link.distance
+    if link.bw_override:
+        bandwidth = link.bw_override
+    else:
+        bandwidth = max(
+            (a.population + b.population + 10*max(a.population, b.population))/9000000 - distance/3 + (a.connectivity + b.connectivity)*90,
+            min(a.population, b.population)/(a.population + b.population)*100 + distance/12 - 75/min(a.connectivity, b.connectivity),
+        )
+    return {
+        "delay": distance/200,
+        "jitter": log(sqrt(distance/200)),
+        "bandwidth": bandwidth,
+        "loss": (a.population + b.population + max(a.population, b.population))/2000000000 + distance/1500000,
+    }
+
+
+def detached(link: Link) -> Link:
+    return Link(link.locations, link.distance, ports=link.ports, bw_override=link.bw_override)
+
+
+def assert_matches(topo: Topology) -> None:
+    for link in topo.links:
+        for name, value in scalar_metrics(link).items():
+            assert isclose(getattr(topo.metrics, name)[link.id], value, rel_tol=1e-12), (name, link.id)
+            # links outside a topology use the same formulas on scalars
+            assert isclose(getattr(detached(link), f"{name}_calc")(), value, rel_tol=1e-12), (name, link.id)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_columns_match_scalar_formulas(seed: int):
+    topo = generated(40, seed)
+    for link in topo.links[::5]:
+        link.bw_override = 123
+    assert_matches(topo)
+
+    # changed rows are recomputed one by one, the same as in a full pass
+    rng = np.random.default_rng(seed)
+    for link in topo.links[::3]:
+        link.distance = float(rng.uniform(1, 500))
+        link.bw_override = None
+    assert_matches(topo)
+    # and everything after populations change
+    for location in topo.locations[::4]:
+        location.population *= 2
+    topo.invalidate()
+    assert_matches(topo)
+
+
+def test_zero_distance_has_no_jitter():
+    topo = Topology()
+    a, b = Location("A", "10.0.0.1/24", 0, 1000), Location("B", "10.0.0.2/24", 1, 2000)
+    topo.add_location(a)
+    topo.add_location(b)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        topo.add_link(Link((a, b), 0))
+        link = topo.links[0]
+        assert link.jitter_calc() == -inf
+        assert link.delay_calc() == 0
+        assert detached(link).jitter_calc() == -inf
+        topo.invalidate()
+        assert topo.metrics.jitter[0] == -inf
+    with pytest.raises(ValueError):
+        # the per-link formula didn't allow it at all
+        scalar_metrics(link)
+
+
+def assert_aggregates(topo: Topology) -> None:
+    metrics = topo.metrics
+    for name in ("delay", "jitter", "bandwidth", "loss", "utilization", "available"):
+        column = getattr(metrics, name)
+        stats = topo.stats(name) # type: ignore[arg-type]
+        assert (stats.max, stats.min, stats.count) == (column.max(), column.min(), len(column)), name
+        assert isclose(stats.sum, column.sum(), rel_tol=1e-9), name
+        assert isclose(stats.mean, column.mean(), rel_tol=1e-9), name
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_aggregates_follow_changes(seed: int):
+    topo = generated(40, seed)
+    assert_aggregates(topo)
+    rng = np.random.default_rng(seed)
+    for step in range(100):
+        link = topo.links[int(rng.integers(len(topo.links)))]
+        if step % 3 == 0:
+            link.distance = float(rng.uniform(1, 1000))
+        elif step % 3 == 1:
+            link.utilization = float(rng.uniform(0, link.bandwidth_calc()))
+        else:
+            link.bw_override = None if rng.random() < 0.5 else int(rng.integers(1, 5000))
+        assert_aggregates(topo)
+    # the largest value going down has to be replaced by the next one
+    longest = topo.links[int(np.argmax(topo.metrics.distance))]
+    longest.distance = 1
+    assert_aggregates(topo)
+
+    # links added up to and past the aggregate capacity
+    capacity = topo.stats("delay").capacity
+    while len(topo.links) <= capacity:
+        a, b = rng.choice(len(topo.locations), 2, replace=False).tolist()
+        if topo.get_link(topo.locations[a], topo.locations[b]) is None:
+            topo.add_link(Link((topo.locations[a], topo.locations[b]), float(rng.uniform(1, 1000))))
+            assert_aggregates(topo)
+    assert topo.stats("delay").capacity > capacity
+
+
+def test_aggregate_rows():
+    values = np.array([3.0, np.nan, -1.0, 7.0])
+    aggregate = Aggregate(values, 5)
+    assert (aggregate.max, aggregate.min, aggregate.sum, aggregate.count) == (7.0, -1.0, 9.0, 4)
+    aggregate.update(3, 2.0)
+    assert (aggregate.max, aggregate.sum) == (3.0, 4.0)
+    aggregate.update(1, 10.0)
+    assert (aggregate.max, aggregate.sum) == (10.0, 14.0)
+    aggregate.update(4, -inf)
+    assert (aggregate.min, aggregate.count) == (-inf, 5)
+    aggregate.update(0, np.nan)
+    assert (aggregate.max, aggregate.min, aggregate.sum) == (10.0, -inf, -inf)
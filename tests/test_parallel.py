@@ -0,0 +1,31 @@
+"""Routing tables computed in a process pool against serial routing_table."""
+import numpy as np
+import pytest
+
+from scht_lab.routing import parallel
+from scht_lab.routing.parallel import routing_tables
+from scht_lab.routing.table import routing_table, tables_dir
+from tests.helpers import PROFILES, SEEDS, generated
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("persist", [False, True])
+def test_routing_tables_match_serial(seed: int, persist: bool, tmp_path, monkeypatch: pytest.MonkeyPatch):
+    # small enough to check quickly, so the threshold is lowered to still go through the pool and shared files
+    monkeypatch.setattr(parallel, "PARALLEL_THRESHOLD", 0)
+    monkeypatch.setattr(parallel, "SHARED_DIR", tmp_path / "shm")
+    (tmp_path / "shm").mkdir()
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    profiles = [*PROFILES, PROFILES[-1]] # the repeated profile is computed once
+    tables = routing_tables(generated(40, seed), profiles, workers=2, persist=persist)
+    assert tables[-1] is tables[-2]
+    for priorities, table in zip(profiles, tables, strict=True):
+        expected = routing_table(generated(40, seed), priorities)
+        np.testing.assert_allclose(table.distances, expected.distances, rtol=1e-12)
+        assert np.array_equal(table.via, expected.via)
+    assert not list((tmp_path / "shm").iterdir())
+    if persist:
+        # renamed into place, no temporary outputs left
+        stored = [path.name for path in tables_dir().iterdir()]
+        assert len(stored) == len(PROFILES)
+        assert not [name for name in stored if name.startswith(".")]
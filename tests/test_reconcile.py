@@ -0,0 +1,71 @@
+"""Reconciling desired flows with ONOS, against the in-process fake controller."""
+import asyncio
+from math import ceil
+
+import pytest
+
+from scht_lab.benchmarks.fake_onos import FakeOnos
+from scht_lab.benchmarks.onos import make_flows
+from scht_lab.client import diff_flows, get_client, reconcile_flows
+from scht_lab.limits import CHUNK_SIZE
+
+DEVICES = 20
+DEVICE_IDS = [f"of:{hex(device + 1)[2:].zfill(16)}" for device in range(DEVICES)]
+FLOWS = 1200
+LISTING = "GET /onos/v1/flows/application/{appId}"
+UPLOAD = "POST /onos/v1/flows"
+DELETE = "DELETE /onos/v1/flows"
+
+
+def installed(flows: list, start: int = 1) -> list[dict]:
+    """Flows as ONOS lists them, with ids and criteria in a different order."""
+    result = []
+    for flow_id, flow in enumerate(flows, start):
+        data = flow.to_onos()
+        data["selector"]["criteria"].reverse()
+        result.append({"id": str(flow_id), "state": "ADDED", **data})
+    return result
+
+
+def test_diff_flows():
+    flows = make_flows(10, 3)
+    diff = diff_flows(flows[:6], installed(flows[2:8]) + installed(flows[2:3], 100))
+    assert diff.unchanged == 4
+    assert [flow["selector"]["criteria"] for flow in diff.add] == [flow.to_onos()["selector"]["criteria"] for flow in flows[:2]]
+    # flows no longer wanted, and the duplicate of a wanted one
+    assert sorted(flow["flowId"] for flow in diff.delete) == ["100", "5", "6"]
+    assert not diff_flows(flows, installed(flows))
+
+
+@pytest.mark.parametrize("chunk_size", [CHUNK_SIZE, 100])
+def test_reconcile_sends_chunks_and_only_differences(chunk_size: int):
+    flows = make_flows(FLOWS, DEVICES)
+
+    async def run() -> None:
+        async with FakeOnos(DEVICE_IDS) as onos:
+            ctx = onos.context()
+            async with get_client(ctx):
+                diff = await reconcile_flows(ctx, flows, chunk_size=chunk_size)
+                assert len(diff.add) == FLOWS
+                assert onos.flow_count == FLOWS
+                assert onos.stats.requests[LISTING] == 1
+                assert onos.stats.requests[UPLOAD] == ceil(FLOWS/chunk_size)
+                assert max(onos.stats.batches) <= chunk_size
+
+                onos.stats.reset()
+                diff = await reconcile_flows(ctx, flows, chunk_size=chunk_size)
+                assert not diff
+                assert diff.unchanged == FLOWS
+                assert dict(onos.stats.requests) == {LISTING: 1}
+
+                onos.stats.reset()
+                kept = flows[:FLOWS//4]
+                diff = await reconcile_flows(ctx, kept, chunk_size=chunk_size)
+                assert len(diff.delete) == FLOWS - len(kept)
+                assert onos.flow_count == len(kept)
+                assert onos.stats.requests[DELETE] == ceil((FLOWS - len(kept))/chunk_size)
+                assert onos.stats.requests[UPLOAD] == 0
+                assert max(onos.stats.batches) <= chunk_size
+    asyncio.run(run())
+
+
@@ -0,0 +1,44 @@
+"""Compiled topology snapshots give the same costs and paths as the topology they were saved from."""
+import numpy as np
+import pytest
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities, Requirements, StreamType
+from scht_lab.routing.graph import csr_graph
+from scht_lab.snapshot import load_snapshot, save_snapshot
+from scht_lab.topo import Topology
+from scht_lab.topo_graph import build_graph, get_path
+from tests.helpers import PROFILES, SEEDS, generated
+
+# (priorities, requirements, stream type, rate), the last ones follow utilization
+WEIGHTINGS = [
+    *((priorities, None, None, 0) for priorities in PROFILES),
+    (Priorities(congestion=1.0), None, None, 0),
+    (Priorities(), Requirements(bandwidth=100), StreamType.UDP, 200),
+]
+
+
+def paths(topo: Topology, weighting: tuple) -> list[list[str]]:
+    graph, graph_map = build_graph(topo)
+    locations = topo.locations
+    pairs = [(locations[i], locations[-1 - i]) for i in range(len(locations)//2)]
+    return [[location.name for location in get_path(graph, graph_map, topo, src, dst, *weighting)] for src, dst in pairs]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_snapshot_round_trip(seed: int, tmp_path):
+    topo = generated(40, seed)
+    rng = np.random.default_rng(seed)
+    for link in topo.links:
+        link.utilization = float(rng.uniform(0, link.bandwidth_calc()))
+    weights = [compile_weights(topo, *weighting) for weighting in WEIGHTINGS]
+    found = [paths(topo, weighting) for weighting in WEIGHTINGS]
+
+    save_snapshot(topo, tmp_path / "snapshot")
+    loaded = load_snapshot(tmp_path / "snapshot")
+    assert [location.name for location in loaded.locations] == [location.name for location in topo.locations]
+    for array in ("indptr", "targets", "edges"):
+        assert np.array_equal(getattr(csr_graph(loaded), array), getattr(csr_graph(topo), array))
+    for weighting, expected_weights, expected_paths in zip(WEIGHTINGS, weights, found, strict=True):
+        assert np.array_equal(compile_weights(loaded, *weighting), expected_weights)
+        assert paths(loaded, weighting) == expected_paths
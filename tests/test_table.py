@@ -0,0 +1,26 @@
+"""Routing tables against plain Dijkstra from every source, on seeded generated topologies."""
+from math import isclose
+
+import pytest
+
+from scht_lab.cost_calc import compile_weights
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.graph import csr_graph, dijkstra
+from scht_lab.routing.table import routing_table
+from tests.helpers import PROFILES, SEEDS, generated, path_cost
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("priorities", PROFILES)
+def test_routing_table_matches_dijkstra(seed: int, priorities: Priorities | None):
+    topo = generated(60, seed)
+    graph = csr_graph(topo)
+    costs = compile_weights(topo, priorities).tolist()
+    table = routing_table(topo, priorities)
+    for source in range(graph.node_count):
+        dist, _ = dijkstra(graph, costs, source)
+        for target in range(graph.node_count):
+            assert isclose(table.distances[source, target], dist[target], rel_tol=1e-9, abs_tol=1e-12)
+            found = table.node_path(source, target)
+            assert found is not None
+            assert isclose(path_cost(graph, costs, source, target, *found), dist[target], rel_tol=1e-9, abs_tol=1e-12)
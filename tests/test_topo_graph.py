@@ -0,0 +1,109 @@
+"""Flow generation from paths: aggregation and MPLS label-switched paths, on seeded generated topologies."""
+from ipaddress import ip_address, ip_network
+from itertools import islice
+
+import pytest
+
+from scht_lab.client import diff_flows
+from scht_lab.models.flow import FlowRecord, flow_key
+from scht_lab.models.stream import Priorities
+from scht_lab.routing.table import routing_table
+from scht_lab.topo_graph import (
+    FIRST_MPLS_LABEL,
+    LabelTable,
+    aggregate_flows,
+    candidate_paths,
+    mpls_flows,
+    next_free_label,
+    paths_to_flows,
+)
+from tests.helpers import SEEDS, generated
+
+
+def forward(flows: list[FlowRecord], src: str, dst: str) -> tuple | None:
+    """Instructions a device applies to an IPv4 packet, from the highest priority flows matching it."""
+    def matches(flow: FlowRecord) -> bool:
+        for rule in flow.criteria:
+            fields = dict(rule)
+            if fields["type"] == "ETH_TYPE":
+                if fields["ethType"] != "0x800":
+                    return False
+            elif fields["type"] in ("IPV4_SRC", "IPV4_DST"):
+                address = ip_address(src if fields["type"] == "IPV4_SRC" else dst)
+                if address not in ip_network(fields["ip"], strict=False):
+                    return False
+            else:
+                pytest.fail(f"Unexpected criterion {fields}")
+        return True
+    matching = [flow for flow in flows if matches(flow)]
+    if not matching:
+        return None
+    top = max(flow.priority for flow in matching)
+    actions = {flow.instructions for flow in matching if flow.priority == top}
+    assert len(actions) == 1, f"ambiguous flows for {src} -> {dst}"
+    return actions.pop()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("prefixes", [False, True])
+def test_aggregate_flows_forwards_the_same(seed: int, prefixes: bool):
+    topo = generated(15, seed)
+    priorities = Priorities()
+    # some pairs take their second best path, so sources to the same destination diverge
+    paths = {
+        src: {
+            dst: path if (i + j) % 3 or len(alternatives := list(islice(candidate_paths(topo, src, dst, priorities, None), 2))) < 2
+            else alternatives[1]
+            for j, (dst, path) in enumerate(targets.items())
+        }
+        for i, (src, targets) in enumerate(routing_table(topo, priorities).paths().items())
+    }
+    flows = paths_to_flows(paths, topo) # type: ignore[arg-type]
+    aggregated = aggregate_flows(flows, prefixes)
+    assert len(aggregated) < len(flows)
+    expected: dict[tuple[str, str, str], tuple] = {}
+    for flow in flows:
+        rules = {dict(rule)["type"]: dict(rule) for rule in flow.criteria}
+        key = (flow.device_id, str(ip_network(rules["IPV4_SRC"]["ip"]).network_address), str(ip_network(rules["IPV4_DST"]["ip"]).network_address))
+        assert expected.setdefault(key, flow.instructions) == flow.instructions
+    by_device: dict[str, list[FlowRecord]] = {}
+    for flow in aggregated:
+        by_device.setdefault(flow.device_id, []).append(flow)
+    for (device, src, dst), instructions in expected.items():
+        assert forward(by_device.get(device, []), src, dst) == instructions
+
+
+def listed(flow: FlowRecord, flow_id: int) -> dict:
+    """A flow as ONOS lists it: with bookkeeping, criteria in its own order and EtherTypes in hex."""
+    def hexed(rule: dict) -> dict:
+        return {key: hex(int(value, 0) if isinstance(value, str) else value) if key in ("ethType", "ethernetType") else value for key, value in rule.items()}
+    onos = flow.to_onos()
+    return {
+        "id": str(flow_id),
+        "appId": "scht_lab",
+        "state": "ADDED",
+        "deviceId": onos["deviceId"],
+        "priority": onos["priority"],
+        "isPermanent": True,
+        "selector": {"criteria": [hexed(rule) for rule in reversed(onos["selector"]["criteria"])]},
+        "treatment": {"instructions": [hexed(rule) for rule in onos["treatment"]["instructions"]]},
+    }
+
+
+def test_mpls_flows_match_their_listing():
+    topo = generated(15, 0)
+    labels = LabelTable()
+    paths = [path for targets in routing_table(topo, Priorities()).paths().values() for path in targets.values() if len(path) > 2]
+    flows = {flow for path in paths for flow in mpls_flows(path, topo, labels)}
+    installed = [listed(flow, i) for i, flow in enumerate(flows)]
+    assert any(rule.get("ethernetType") == "0x8847" for flow in installed for rule in flow["treatment"]["instructions"])
+    diff = diff_flows(flows, installed)
+    assert (diff.add, diff.delete, diff.unchanged) == ([], [], len(flows))
+    assert {flow_key(flow) for flow in flows} == {flow_key(flow) for flow in installed}
+
+    # labels of another run start above the installed ones
+    first = next_free_label(installed)
+    assert first == FIRST_MPLS_LABEL + len(labels.labels)
+    assert next_free_label([]) == FIRST_MPLS_LABEL
+    later = LabelTable(first)
+    assert later.label(paths[0]) == first